@@ -0,0 +1,206 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable
+
+from benchmarks import corpus
+
+SCALES = {
+    "small": {"raster": (512, 2048), "svg": (1_000, 10_000), "gcode": (100_000,)},
+    "full": {"raster": (512, 2048, 8192), "svg": (1_000, 100_000, 1_000_000), "gcode": (1_000_000, 5_000_000)}
+}
+# parse_gcode_frames builds one dict per move, so it is only run on the smaller files
+FRAMES_MAX_LINES = 1_000_000
+VTRACER_TILE = 1024
+TREE_ARTIFACTS = 2000
+TREE_PAGE = 100
+
+
+@dataclass
+class BenchCase:
+    name: str
+    stage: str
+    unit: str
+    source: Callable[[Path], Path]
+    # run(input, work_dir) -> units processed; prepare(input, work_dir) runs untimed beforehand
+    run: Callable[[Path, Path], float]
+    prepare: Callable[[Path, Path], None] | None = None
+
+
+def _megapixels(path: Path) -> float:
+    from PIL import Image
+
+    with Image.open(path) as image:
+        return image.size[0] * image.size[1] / 1e6
+
+
+def _vtracer(tile_size: int) -> Callable[[Path, Path], float]:
+    def run(path: Path, work_dir: Path) -> float:
+        from services.vtracer_runner import VtracerOptions, run_vtracer_to_svg
+
+        run_vtracer_to_svg(path, work_dir / "vectorized.svg", VtracerOptions(tile_size=tile_size))
+        return _megapixels(path)
+    return run
+
+
+def _vpype_svg(paths: int) -> Callable[[Path, Path], float]:
+    def run(path: Path, work_dir: Path) -> float:
+        from services.vpype_runner import run_vpype_to_svg
+
+        run_vpype_to_svg(path, work_dir / "processed.svg")
+        return paths
+    return run
+
+
+def _vpype_geometry(paths: int) -> Callable[[Path, Path], float]:
+    def run(path: Path, work_dir: Path) -> float:
+        from services.vpype_runner import run_vpype_to_geometry
+
+        run_vpype_to_geometry(path, work_dir / "processed.vgeo")
+        return paths
+    return run
+
+
+def _vpype_gcode(paths: int) -> Callable[[Path, Path], float]:
+    def run(path: Path, work_dir: Path) -> float:
+        from services.vpype_runner import GcodeProfile, run_vpype_to_gcode
+
+        run_vpype_to_gcode(path, work_dir / "plot.gcode", GcodeProfile())
+        return paths
+    return run
+
+
+def _prepare_geometry(path: Path, work_dir: Path) -> None:
+    from services.geometry_format import geometry_from_document, write_geometry
+    from services.svg_geometry import read_svg
+
+    write_geometry(work_dir / "input.vgeo", geometry_from_document(read_svg(path)))
+
+
+def _emit_gcode(paths: int, **profile) -> Callable[[Path, Path], float]:
+    def run(path: Path, work_dir: Path) -> float:
+        from services.gcode_emitter import write_gcode
+        from services.geometry_format import read_geometry
+        from services.vpype_runner import GcodeProfile
+
+        write_gcode(read_geometry(work_dir / "input.vgeo"), work_dir / "plot.gcode", GcodeProfile(**profile))
+        return paths
+    return run
+
+
+def _simplify(paths: int) -> Callable[[Path, Path], float]:
+    def run(path: Path, work_dir: Path) -> float:
+        from services.geometry_format import read_geometry
+        from services.geometry_simplify import SimplifyOptions, simplify_geometry
+
+        simplify_geometry(read_geometry(work_dir / "input.vgeo"), SimplifyOptions(tolerance_mm=0.1, merge_collinear=True))
+        return paths
+    return run
+
+
+def _parse_frames(lines: int) -> Callable[[Path, Path], float]:
+    def run(path: Path, work_dir: Path) -> float:
+        from routes.preview import parse_gcode_frames
+
+        parse_gcode_frames(path.read_text())
+        return lines
+    return run
+
+
+def _parse_file(lines: int) -> Callable[[Path, Path], float]:
+    def run(path: Path, work_dir: Path) -> float:
+        from services.gcode_parser import parse_gcode_file, preview_meta
+
+        preview_meta(parse_gcode_file(path))
+        return lines
+    return run
+
+
+def _pyramid(lines: int) -> Callable[[Path, Path], float]:
+    def run(path: Path, work_dir: Path) -> float:
+        from services.preview_pyramid import ensure_pyramid
+
+        ensure_pyramid(work_dir, "plot", path)
+        return lines
+    return run
+
+
+def _storage_save(path: Path, work_dir: Path) -> float:
+    from services.storage import create_project, find_output_file, save_output_file
+
+    project_id = create_project()
+    file_id = save_output_file(project_id, "plot.gcode", path)
+    find_output_file(project_id, file_id)
+    return path.stat().st_size / 1e6
+
+
+def _prepare_tree(path: Path, work_dir: Path) -> None:
+    from services.storage import create_project, save_intermediate
+
+    project_id = create_project()
+    for index in range(TREE_ARTIFACTS):
+        save_intermediate(project_id, f"artifact-{index:05d}.txt", f"{index}\n")
+    (work_dir / "project_id").write_text(project_id)
+
+
+def _storage_tree(path: Path, work_dir: Path) -> float:
+    from services.storage import load_project_tree
+
+    project_id = (work_dir / "project_id").read_text()
+    listed, cursor = 0, None
+    while True:
+        tree = load_project_tree(project_id, "intermediate", TREE_PAGE, cursor)
+        listed += len(tree["intermediate"])
+        cursor = tree["next_cursor"]["intermediate"]
+        if cursor is None:
+            return listed
+
+
+def _sized(source: Callable[[Path, int], Path], size: int) -> Callable[[Path], Path]:
+    return lambda root: source(root, size)
+
+
+def build_cases(scale: str) -> list[BenchCase]:
+    sizes = SCALES[scale]
+    cases = []
+    for size in sizes["raster"]:
+        raster = _sized(corpus.raster, size)
+        cases.append(BenchCase(f"vtracer/raster-{size}", "vtracer", "Mpx", raster, _vtracer(0)))
+        if size > VTRACER_TILE:
+            cases.append(BenchCase(f"vtracer-tiled/raster-{size}", "vtracer", "Mpx", raster, _vtracer(VTRACER_TILE)))
+    for paths in sizes["svg"]:
+        svg = _sized(corpus.svg, paths)
+        cases += [
+            BenchCase(f"vpype-svg/paths-{paths}", "vpype", "paths", svg, _vpype_svg(paths)),
+            BenchCase(f"vpype-geometry/paths-{paths}", "vpype", "paths", svg, _vpype_geometry(paths)),
+            BenchCase(f"vpype-gcode/paths-{paths}", "vpype", "paths", svg, _vpype_gcode(paths)),
+            BenchCase(f"emit-gcode/paths-{paths}", "gcode", "paths", svg, _emit_gcode(paths), _prepare_geometry),
+            BenchCase(
+                f"emit-gcode-fitted/paths-{paths}",
+                "gcode",
+                "paths",
+                svg,
+                _emit_gcode(paths, arc_tolerance_mm=0.05, line_tolerance_mm=0.02),
+                _prepare_geometry
+            ),
+            BenchCase(f"simplify/paths-{paths}", "simplify", "paths", svg, _simplify(paths), _prepare_geometry)
+        ]
+    for lines in sizes["gcode"]:
+        gcode = _sized(corpus.gcode, lines)
+        if lines <= FRAMES_MAX_LINES:
+            cases.append(BenchCase(f"preview-frames/lines-{lines}", "preview", "lines", gcode, _parse_frames(lines)))
+        cases += [
+            BenchCase(f"preview-parse/lines-{lines}", "preview", "lines", gcode, _parse_file(lines)),
+            BenchCase(f"preview-pyramid/lines-{lines}", "preview", "lines", gcode, _pyramid(lines)),
+            BenchCase(f"storage-save/lines-{lines}", "storage", "MB", gcode, _storage_save)
+        ]
+    cases.append(BenchCase(
+        f"storage-tree/artifacts-{TREE_ARTIFACTS}",
+        "storage",
+        "artifacts",
+        _sized(corpus.gcode, sizes["gcode"][0]),
+        _storage_tree,
+        _prepare_tree
+    ))
+    return cases
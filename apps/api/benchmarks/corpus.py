@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Callable
+from uuid import uuid4
+import os
+
+import numpy as np
+
+CORPUS_ROOT = Path("data/cache/bench-corpus")
+# bump when a generator changes so stale corpora are not reused
+CORPUS_VERSION = 1
+_SEED = 8128
+_PAGE = 1000.0
+_SVG_LAYERS = 4
+_SVG_POINTS = 8
+_GCODE_PATH_POINTS = 48
+
+
+def _rng(*key: int) -> np.random.Generator:
+    return np.random.default_rng([_SEED, CORPUS_VERSION, *key])
+
+
+def _ensure(root: Path, name: str, write: Callable[[Path], None]) -> Path:
+    path = root / f"v{CORPUS_VERSION}" / name
+    if path.exists():
+        return path
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{uuid4().hex}.tmp")
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+    return path
+
+
+def raster(root: Path, size: int) -> Path:
+    def write(path: Path) -> None:
+        from PIL import Image
+
+        rng = _rng(1, size)
+        # blocky colour regions with a little noise, roughly what a scanned drawing traces into
+        cells = rng.integers(0, 256, size=(max(2, size // 64), max(2, size // 64), 3), dtype=np.uint8)
+        image = Image.fromarray(cells, "RGB").resize((size, size), Image.Resampling.NEAREST)
+        noise = rng.integers(-12, 13, size=(size, size, 3), dtype=np.int16)
+        pixels = np.clip(np.asarray(image, dtype=np.int16) + noise, 0, 255).astype(np.uint8)
+        Image.fromarray(pixels, "RGB").save(path, format="PNG", compress_level=1)
+    return _ensure(root, f"raster-{size}.png", write)
+
+
+def svg(root: Path, paths: int) -> Path:
+    def write(path: Path) -> None:
+        rng = _rng(2, paths)
+        starts = rng.uniform(0, _PAGE, size=(paths, 1, 2))
+        points = np.clip(starts + rng.normal(0, 6.0, size=(paths, _SVG_POINTS, 2)).cumsum(axis=1), 0, _PAGE)
+        layer_of = np.arange(paths) % _SVG_LAYERS
+        template = "<path d=\"M{:.2f} {:.2f}" + " L{:.2f} {:.2f}" * (_SVG_POINTS - 1) + "\"/>\n"
+        with path.open("w", encoding="utf-8", buffering=1024 * 1024) as f:
+            f.write(
+                f"<svg xmlns=\"http://www.w3.org/2000/svg\" xmlns:inkscape=\"http://www.inkscape.org/namespaces/inkscape\" "
+                f"width=\"{_PAGE:g}mm\" height=\"{_PAGE:g}mm\" viewBox=\"0 0 {_PAGE:g} {_PAGE:g}\">\n"
+            )
+            for layer in range(_SVG_LAYERS):
+                f.write(
+                    f"<g inkscape:groupmode=\"layer\" inkscape:label=\"{layer + 1}\" "
+                    f"fill=\"none\" stroke=\"#{(layer * 0x3f2a17) & 0xffffff:06x}\">\n"
+                )
+                rows = points[layer_of == layer].reshape(-1, _SVG_POINTS * 2).tolist()
+                f.writelines(template.format(*row) for row in rows)
+                f.write("</g>\n")
+            f.write("</svg>\n")
+    return _ensure(root, f"paths-{paths}.svg", write)
+
+
+def gcode(root: Path, lines: int) -> Path:
+    # same layout as the emitter output: (Start Line), rapid, pen down, dwell, feeds, pen up, dwell
+    def write(path: Path) -> None:
+        rng = _rng(3, lines)
+        path_count = max(1, lines // (_GCODE_PATH_POINTS + 6))
+        starts = rng.uniform(0, 250.0, size=(path_count, 1, 2))
+        points = starts + rng.normal(0, 0.8, size=(path_count, _GCODE_PATH_POINTS, 2)).cumsum(axis=1)
+        segment = "G01 X{:.3f} Y{:.3f}\n" * (_GCODE_PATH_POINTS - 1)
+        with path.open("w", encoding="utf-8", buffering=1024 * 1024) as f:
+            f.write("G21\nG90\n(Start Layer)\n")
+            for row in points.reshape(path_count, -1).tolist():
+                f.write(f"(Start Line)\nG00 X{row[0]:.3f} Y{row[1]:.3f}\nM3 S1000\nG4 P0.1\n")
+                f.write(segment.format(*row[2:]))
+                f.write("M5\nG4 P0.1\n")
+            f.write("M5\nG00 X0 Y0\n")
+    return _ensure(root, f"plot-{lines}.gcode", write)
@@ -0,0 +1,191 @@
+from __future__ import annotations
+
+from pathlib import Path
+import argparse
+import json
+import os
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.cases import SCALES, BenchCase, build_cases
+
+API_ROOT = Path(__file__).resolve().parent.parent
+STUB_DIR = Path(__file__).resolve().parent / "stubs"
+BASELINE_DIR = Path(__file__).resolve().parent
+# a case regresses when it is this much slower / larger than the baseline; the
+# absolute floor keeps millisecond cases from flapping on timer noise
+MAX_SLOWDOWN = 0.20
+MAX_RSS_GROWTH = 0.25
+MIN_SLOWDOWN_S = 0.05
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux and bytes on macOS, and survives fork + exec, so the
+    # process's own peak comes from VmHWM where there is one; children covers the CLI tools
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    try:
+        for line in Path("/proc/self/status").read_text().splitlines():
+            if line.startswith("VmHWM:"):
+                own = int(line.split()[1]) * 1024 // scale
+    except OSError:
+        pass
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return max(own, children) / scale
+
+
+def _find_case(scale: str, name: str) -> BenchCase:
+    for case in build_cases(scale):
+        if case.name == name:
+            return case
+    raise SystemExit(f"unknown benchmark case {name!r}")
+
+
+def _child_main(args: argparse.Namespace) -> int:
+    # runs inside a fresh interpreter whose cwd is the case's scratch dir, so data/ and
+    # the stage caches start empty and peak RSS belongs to this case alone
+    case = _find_case(args.scale, args.case)
+    source = case.source(args.corpus)
+    work_dir = Path.cwd()
+    if args.step == "generate":
+        return 0
+    if args.step == "prepare":
+        case.prepare(source, work_dir)
+        return 0
+    start = time.perf_counter()
+    units = case.run(source, work_dir)
+    wall_s = time.perf_counter() - start
+    print(json.dumps({"wall_s": wall_s, "units": units, "peak_rss_mb": _peak_rss_mb()}))
+    return 0
+
+
+def _child_env(real_tools: bool) -> dict[str, str]:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(p for p in (str(API_ROOT), env.get("PYTHONPATH")) if p)
+    if not real_tools:
+        env["PATH"] = os.pathsep.join((str(STUB_DIR), env.get("PATH", "")))
+        # the vpype pool imports vpype in-process, which would bypass the stub CLI
+        env["VECTRA_VPYPE_WORKERS"] = "0"
+    return env
+
+
+def _spawn(case: BenchCase, step: str, args: argparse.Namespace, work_dir: Path, env: dict) -> dict | None:
+    # corpus generation also happens out of process: peak RSS is inherited across fork,
+    # so the runner itself has to stay small
+    cmd = [
+        sys.executable, "-m", "benchmarks.runner",
+        "--scale", args.scale, "--corpus", str(args.corpus), "--case", case.name, "--step", step
+    ]
+    result = subprocess.run(cmd, cwd=work_dir, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"{case.name} {step} failed:\n{result.stderr.strip()}")
+    return json.loads(result.stdout.strip().splitlines()[-1]) if step == "run" else None
+
+
+def run_case(case: BenchCase, args: argparse.Namespace, env: dict) -> dict:
+    samples = []
+    for index in range(args.repeat):
+        work_dir = Path(tempfile.mkdtemp(prefix="vectra-bench-"))
+        try:
+            if index == 0:
+                _spawn(case, "generate", args, work_dir, env)
+            if case.prepare is not None:
+                _spawn(case, "prepare", args, work_dir, env)
+            samples.append(_spawn(case, "run", args, work_dir, env))
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    wall_s = statistics.median(s["wall_s"] for s in samples)
+    return {
+        "stage": case.stage,
+        "unit": case.unit,
+        "wall_s": round(wall_s, 4),
+        "peak_rss_mb": round(max(s["peak_rss_mb"] for s in samples), 1),
+        "throughput": round(samples[0]["units"] / wall_s, 2) if wall_s > 0 else None
+    }
+
+
+def compare(results: dict, baseline: dict, max_slowdown: float, max_rss_growth: float) -> dict[str, list[str]]:
+    regressions = {}
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        problems = []
+        if result["wall_s"] > base["wall_s"] * (1 + max_slowdown) and result["wall_s"] - base["wall_s"] > MIN_SLOWDOWN_S:
+            problems.append(f"wall {base['wall_s']:.3f}s -> {result['wall_s']:.3f}s")
+        if result["peak_rss_mb"] > base["peak_rss_mb"] * (1 + max_rss_growth):
+            problems.append(f"rss {base['peak_rss_mb']:.0f}MB -> {result['peak_rss_mb']:.0f}MB")
+        if problems:
+            regressions[name] = problems
+    return regressions
+
+
+def _report(results: dict, baseline: dict, regressions: dict) -> None:
+    width = max((len(name) for name in results), default=10)
+    print(f"{'case':<{width}}  {'wall s':>9}  {'base s':>9}  {'rss MB':>8}  throughput")
+    for name, result in results.items():
+        base = baseline.get(name)
+        base_wall = f"{base['wall_s']:.3f}" if base else "-"
+        flag = "  REGRESSION" if name in regressions else ""
+        print(
+            f"{name:<{width}}  {result['wall_s']:>9.3f}  {base_wall:>9}  {result['peak_rss_mb']:>8.1f}  "
+            f"{result['throughput'] or 0:,.0f} {result['unit']}/s{flag}"
+        )
+    for name, problems in regressions.items():
+        print(f"regression in {name}: {'; '.join(problems)}")
+
+
+def _parse_args(argv: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Benchmark the Vectra pipeline stages")
+    parser.add_argument("--scale", choices=sorted(SCALES), default="small")
+    parser.add_argument("--only", action="append", default=[], help="run cases whose name contains this text")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--corpus", type=Path, default=None, help="where generated inputs are cached")
+    parser.add_argument("--baseline", type=Path, default=None)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--output", type=Path, default=None, help="also write the results as JSON")
+    parser.add_argument("--max-slowdown", type=float, default=MAX_SLOWDOWN)
+    parser.add_argument("--max-rss-growth", type=float, default=MAX_RSS_GROWTH)
+    parser.add_argument("--real-tools", action="store_true", help="use the installed vtracer/vpype instead of the stubs")
+    parser.add_argument("--case", help=argparse.SUPPRESS)
+    parser.add_argument("--step", choices=("generate", "prepare", "run"), default="run", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str]) -> int:
+    args = _parse_args(argv)
+    if args.case:
+        return _child_main(args)
+    from benchmarks.corpus import CORPUS_ROOT
+
+    args.corpus = (args.corpus or API_ROOT / CORPUS_ROOT).resolve()
+    baseline_path = args.baseline or BASELINE_DIR / f"baseline-{args.scale}.json"
+    baseline = json.loads(baseline_path.read_text())["cases"] if baseline_path.exists() else {}
+
+    env = _child_env(args.real_tools)
+    cases = [c for c in build_cases(args.scale) if not args.only or any(text in c.name for text in args.only)]
+    results = {}
+    for case in cases:
+        print(f"running {case.name}", file=sys.stderr, flush=True)
+        results[case.name] = run_case(case, args, env)
+
+    regressions = compare(results, baseline, args.max_slowdown, args.max_rss_growth)
+    _report(results, baseline, regressions)
+    document = {"scale": args.scale, "real_tools": args.real_tools, "cases": results}
+    if args.output:
+        args.output.write_text(json.dumps(document, indent=2) + "\n")
+    if args.update_baseline:
+        merged = {**baseline, **results}
+        baseline_path.write_text(json.dumps({**document, "cases": merged}, indent=2) + "\n")
+        print(f"baseline written to {baseline_path}")
+        return 0
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
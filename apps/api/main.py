@@ -1,7 +1,10 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 from routes.health import router as health_router
+from routes.metrics import router as metrics_router
 from routes.upload import router as upload_router
 from routes.vectorize import router as vectorize_router
 from routes.process import router as process_router
@@ -11,8 +14,18 @@ from routes.preview import router as preview_router
 from routes.presets import router as presets_router
 from routes.jobs import router as jobs_router
 from routes.projects import router as projects_router
+from services.job_manager import recover_interrupted_jobs
+from services.vpype_worker import warm_up_workers
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    recover_interrupted_jobs()
+    warm_up_workers()
+    yield
+
 
-app = FastAPI(title="Vectra API", version="0.1.0")
+app = FastAPI(title="Vectra API", version="0.1.0", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -23,6 +36,7 @@ app.add_middleware(
 )
 
 app.include_router(health_router)
+app.include_router(metrics_router)
 app.include_router(upload_router, prefix="/api")
 app.include_router(vectorize_router, prefix="/api")
 app.include_router(process_router, prefix="/api")
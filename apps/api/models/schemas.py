@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import List, Dict, Any
+from pydantic import BaseModel, Field
+from typing import List, Dict, Any, Literal
 
 
 class UploadResponse(BaseModel):
@@ -24,6 +24,13 @@ class VectorizeRequest(BaseModel):
     corner_threshold: float = 60.0
     segment_length: float = 4.0
     spiro: bool = True
+    tile_size: int = 0
+    tile_overlap: int = 32
+    plot_width_mm: float = 0.0
+    pen_width_mm: float = 0.3
+    quantize_colors: int = Field(0, ge=0, le=256)
+    threshold: int | None = None
+    denoise: int = Field(0, ge=0, le=7)
 
 
 class VectorizePreset(BaseModel):
@@ -37,6 +44,13 @@ class VectorizePreset(BaseModel):
     corner_threshold: float = 60.0
     segment_length: float = 4.0
     spiro: bool = True
+    tile_size: int = 0
+    tile_overlap: int = 32
+    plot_width_mm: float = 0.0
+    pen_width_mm: float = 0.3
+    quantize_colors: int = Field(0, ge=0, le=256)
+    threshold: int | None = None
+    denoise: int = Field(0, ge=0, le=7)
 
 
 class VectorizePresetRequest(BaseModel):
@@ -48,6 +62,31 @@ class VectorizePresetList(BaseModel):
     presets: List[VectorizePreset]
 
 
+class VectorizeSweepRequest(BaseModel):
+    project_id: str
+    file_id: str
+    preset: str | None = None
+    parameters: Dict[str, List[Any]] = {}
+    proxy_size: int = 512
+    thumbnail_size: int = 192
+
+
+class VectorizeSweepVariant(BaseModel):
+    parameters: Dict[str, Any]
+    path_count: int = 0
+    vertex_count: int = 0
+    thumbnail: str | None = None
+    cached: bool = False
+    error: str | None = None
+
+
+class VectorizeSweepResponse(BaseModel):
+    proxy_width: int
+    proxy_height: int
+    proxy_cached: bool = False
+    variants: List[VectorizeSweepVariant]
+
+
 class ProcessRequest(BaseModel):
     project_id: str
     file_id: str
@@ -56,10 +95,20 @@ class ProcessRequest(BaseModel):
 class OptimizeRequest(BaseModel):
     project_id: str
     svg_id: str
+    allow_reverse: bool = True
+    merge_tolerance: float = 0.05
+    two_opt_window: int = 32
+    two_opt_passes: int = 2
 
 
 class ToolpathResponse(BaseModel):
     toolpath_id: str
+    path_count_before: int = 0
+    path_count_after: int = 0
+    pen_up_distance_before: float = 0.0
+    pen_up_distance_after: float = 0.0
+    pen_lifts_before: int = 0
+    pen_lifts_after: int = 0
 
 
 class GcodeResponse(BaseModel):
@@ -73,23 +122,29 @@ class GcodeRequest(BaseModel):
     pen_up_cmd: str = "M5"
     pen_dwell_s: float = 0.1
     vertical_flip: bool = True
+    arc_tolerance_mm: float = Field(0.0, ge=0)
+    line_tolerance_mm: float = Field(0.0, ge=0)
+    gcode_precision: int = Field(3, ge=0, le=6)
 
 
 class PreviewMeta(BaseModel):
     estimated_time_s: float
     distance_mm: float
     pen_lifts: int
+    draw_time_s: float = 0.0
+    travel_time_s: float = 0.0
+    dwell_time_s: float = 0.0
+    layer_times_s: List[float] = []
 
 
 class PreviewResponse(BaseModel):
     frames: List[Dict[str, Any]]
     meta: PreviewMeta
+    level: int = 0
+    levels: int = 1
 
 
-class PipelineJobRequest(BaseModel):
-    project_id: str
-    file_id: str
-    filename: str
+class PipelineOptions(BaseModel):
     mode: str = "color"
     colormode: str = "color"
     hierarchical: bool = False
@@ -99,23 +154,69 @@ class PipelineJobRequest(BaseModel):
     corner_threshold: float = 60.0
     segment_length: float = 4.0
     spiro: bool = True
+    tile_size: int = 0
+    tile_overlap: int = 32
+    plot_width_mm: float = 0.0
+    pen_width_mm: float = 0.3
+    quantize_colors: int = Field(0, ge=0, le=256)
+    threshold: int | None = None
+    denoise: int = Field(0, ge=0, le=7)
+    simplify_tolerance_mm: float = 0.0
+    merge_collinear: bool = False
+    min_path_size_mm: float = 0.0
     pen_down_cmd: str = "M3 S1000"
     pen_up_cmd: str = "M5"
     pen_dwell_s: float = 0.1
     vertical_flip: bool = True
+    arc_tolerance_mm: float = Field(0.0, ge=0)
+    line_tolerance_mm: float = Field(0.0, ge=0)
+    gcode_precision: int = Field(3, ge=0, le=6)
+    # "layer" or "color" writes one G-code file per pen next to the combined plot
+    split_by: Literal["none", "layer", "color"] = "layer"
+    optimize_toolpaths: bool = False
+
+
+class PipelineJobRequest(PipelineOptions):
+    project_id: str
+    file_id: str
+    filename: str
+    priority: int = 0
+
+
+class BatchItem(BaseModel):
+    file_id: str
+    filename: str
+
+
+class PipelineBatchRequest(PipelineOptions):
+    project_id: str
+    items: List[BatchItem]
+    priority: int = 0
 
 
 class PipelineJobResult(BaseModel):
     ingest_svg_id: str | None = None
     processed_svg_id: str | None = None
     gcode_id: str | None = None
+    layers: List[Dict[str, Any]] | None = None
     source_kind: str | None = None
+    vertices_before: int | None = None
+    vertices_after: int | None = None
+    cache: Dict[str, str] | None = None
+    duration_s: float | None = None
+    timings: Dict[str, Dict[str, Any]] | None = None
+    total: int | None = None
+    completed: int | None = None
+    failed: int | None = None
+    items: List[Dict[str, Any]] | None = None
 
 
 class JobStatusResponse(BaseModel):
     job_id: str
+    project_id: str | None = None
     status: str
     progress: int
     message: str
     result: PipelineJobResult | None = None
     error: str | None = None
+    queue_position: int | None = None
@@ -1,6 +1,5 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
 from pathlib import Path
-from fastapi.responses import PlainTextResponse
 
 from models.schemas import GcodeResponse, GcodeRequest
 from services.storage import (
@@ -8,9 +7,13 @@ from services.storage import (
     find_intermediate_file,
     save_output,
     ensure_project_dir,
-    find_output_file
+    find_artifact,
+    staged_output
 )
-from services.vpype_runner import run_vpype_to_gcode, GcodeProfile
+from services.artifact_serving import serve_artifact
+from services.gcode_emitter import emit_gcode
+from services.preview_pyramid import ensure_pyramid
+from services.vpype_runner import GcodeProfile
 
 router = APIRouter()
 
@@ -29,20 +32,25 @@ def generate_gcode(payload: GcodeRequest):
             pen_down_cmd=payload.pen_down_cmd,
             pen_up_cmd=payload.pen_up_cmd,
             pen_dwell_s=payload.pen_dwell_s,
-            vertical_flip=payload.vertical_flip
+            vertical_flip=payload.vertical_flip,
+            arc_tolerance_mm=payload.arc_tolerance_mm,
+            line_tolerance_mm=payload.line_tolerance_mm,
+            precision=payload.gcode_precision
         )
-        run_vpype_to_gcode(Path(source_path), output_path, profile)
+        with staged_output(output_path) as staged_path:
+            emit_gcode(Path(source_path), staged_path, profile)
     except Exception as exc:
         raise HTTPException(status_code=500, detail=f"vpype gcode failed: {exc}") from exc
 
     content = output_path.read_text()
     gcode_id = save_output(payload.project_id, "plot.gcode", content)
+    ensure_pyramid(project_dir, gcode_id, output_path)
     return GcodeResponse(gcode_id=gcode_id)
 
 
-@router.get("/gcode/{project_id}/{gcode_id}", response_class=PlainTextResponse)
-def get_gcode(project_id: str, gcode_id: str):
-    output_path = find_output_file(project_id, gcode_id)
-    if output_path is None:
+@router.get("/gcode/{project_id}/{gcode_id}")
+def get_gcode(project_id: str, gcode_id: str, request: Request):
+    artifact = find_artifact(project_id, "outputs", gcode_id)
+    if artifact is None:
         raise HTTPException(status_code=404, detail="G-code not found")
-    return output_path.read_text()
+    return serve_artifact(request, artifact[0], artifact[1], "text/plain; charset=utf-8")
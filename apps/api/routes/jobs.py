@@ -1,17 +1,31 @@
-from threading import Thread
+import asyncio
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Header, HTTPException
+from fastapi.responses import StreamingResponse
 
-from models.schemas import JobStatusResponse, PipelineJobRequest
+from models.schemas import JobStatusResponse, PipelineBatchRequest, PipelineJobRequest
+from services.batch_job import run_batch_job
+from services.job_events import hub, job_event
 from services.job_manager import create_job, get_job, update_job
+from services.job_scheduler import scheduler
 from services.pipeline_job import run_pipeline_job
 
 router = APIRouter()
 
+SSE_KEEPALIVE_S = 15.0
+SSE_POLL_S = 1.0
+
+
+def _job_status(job_id: str) -> JobStatusResponse | None:
+    job = get_job(job_id)
+    if job is None:
+        return None
+    return JobStatusResponse(**job, queue_position=scheduler.queue_position(job_id))
+
 
 @router.post("/jobs", response_model=JobStatusResponse)
 def start_job(payload: PipelineJobRequest):
-    job_id = create_job()
+    job_id = create_job(payload.project_id)
 
     def _run():
         try:
@@ -25,14 +39,91 @@ def start_job(payload: PipelineJobRequest):
                 error=str(exc)
             )
 
-    Thread(target=_run, daemon=True).start()
-    job = get_job(job_id)
-    return JobStatusResponse(**job)
+    scheduler.submit(job_id, payload.project_id, _run, priority=payload.priority)
+    return _job_status(job_id)
+
+
+@router.post("/jobs/batch", response_model=JobStatusResponse)
+def start_batch_job(payload: PipelineBatchRequest):
+    if not payload.items:
+        raise HTTPException(status_code=400, detail="Batch has no items")
+    job_id = create_job(payload.project_id)
+
+    def _run():
+        try:
+            run_batch_job(job_id, payload)
+        except Exception as exc:
+            update_job(
+                job_id,
+                status="failed",
+                progress=100,
+                message="Batch failed",
+                error=str(exc)
+            )
+
+    scheduler.submit(job_id, payload.project_id, _run, priority=payload.priority)
+    return _job_status(job_id)
 
 
 @router.get("/jobs/{job_id}", response_model=JobStatusResponse)
 def get_job_status(job_id: str):
-    job = get_job(job_id)
-    if job is None:
+    status = _job_status(job_id)
+    if status is None:
         raise HTTPException(status_code=404, detail="Job not found")
-    return JobStatusResponse(**job)
+    return status
+
+
+@router.get("/jobs/{job_id}/events")
+async def stream_job_events(
+    job_id: str,
+    last_event_id: str | None = Header(default=None)
+):
+    try:
+        resume_from = int(last_event_id) if last_event_id is not None else None
+    except ValueError:
+        resume_from = None
+    try:
+        queue, initial = hub.subscribe(job_id, resume_from, lambda: get_job(job_id))
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Job not found") from None
+
+    async def poll_store():
+        # no local publisher for this job, so follow its row in the store instead
+        event = initial
+        yield event.encode()
+        idle_s = 0.0
+        while not event.finished:
+            await asyncio.sleep(SSE_POLL_S)
+            job = await asyncio.to_thread(get_job, job_id)
+            if job is None:
+                return
+            polled = job_event(event.event_id + 1, job)
+            if polled.data != event.data:
+                event, idle_s = polled, 0.0
+                yield event.encode()
+                continue
+            idle_s += SSE_POLL_S
+            if idle_s >= SSE_KEEPALIVE_S:
+                idle_s = 0.0
+                yield ": keep-alive\n\n"
+
+    async def events():
+        try:
+            event = initial
+            if event is not None:
+                yield event.encode()
+            while event is None or not event.finished:
+                try:
+                    event = await asyncio.wait_for(queue.get(), SSE_KEEPALIVE_S)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield event.encode()
+        finally:
+            hub.unsubscribe(job_id, queue)
+
+    return StreamingResponse(
+        events() if queue is not None else poll_store(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -0,0 +1,9 @@
+from fastapi import APIRouter, Response
+
+from services.metrics import CONTENT_TYPE, render_metrics
+
+router = APIRouter()
+
+@router.get("/metrics")
+def metrics():
+    return Response(content=render_metrics(), media_type=CONTENT_TYPE)
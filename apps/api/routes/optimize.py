@@ -1,11 +1,38 @@
-from fastapi import APIRouter
-from uuid import uuid4
+from fastapi import APIRouter, HTTPException
+from pathlib import Path
+from dataclasses import asdict
 
 from models.schemas import ToolpathResponse, OptimizeRequest
+from services.geometry_format import geometry_to_document, is_geometry_file, read_geometry
+from services.storage import find_source_file, find_intermediate_file, save_intermediate
+from services.svg_geometry import SvgDocument, read_svg, render_svg
+from services.toolpath_optimizer import OptimizeOptions, optimize_paths
 
 router = APIRouter()
 
 @router.post("/optimize", response_model=ToolpathResponse)
 def optimize_toolpaths(payload: OptimizeRequest):
-    # TODO: run toolpath ordering and pen-lift optimization
-    return ToolpathResponse(toolpath_id=uuid4().hex)
+    source_path = find_intermediate_file(payload.project_id, payload.svg_id)
+    if source_path is None:
+        source_path = find_source_file(payload.project_id, payload.svg_id)
+    if source_path is None:
+        raise HTTPException(status_code=404, detail="Source SVG not found")
+
+    try:
+        source_path = Path(source_path)
+        doc = geometry_to_document(read_geometry(source_path)) if is_geometry_file(source_path) else read_svg(source_path)
+    except Exception as exc:
+        raise HTTPException(status_code=400, detail=f"Could not read SVG: {exc}") from exc
+    if not doc.paths:
+        raise HTTPException(status_code=400, detail="SVG contains no drawable paths")
+
+    options = OptimizeOptions(
+        allow_reverse=payload.allow_reverse,
+        merge_tolerance=payload.merge_tolerance,
+        two_opt_window=payload.two_opt_window,
+        two_opt_passes=payload.two_opt_passes
+    )
+    paths, stats = optimize_paths(doc.paths, options)
+    optimized = SvgDocument(paths=paths, width=doc.width, height=doc.height, view_box=doc.view_box)
+    toolpath_id = save_intermediate(payload.project_id, "optimized.svg", render_svg(optimized))
+    return ToolpathResponse(toolpath_id=toolpath_id, **asdict(stats))
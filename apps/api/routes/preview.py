@@ -1,68 +1,71 @@
-from fastapi import APIRouter, HTTPException
+import json
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Query, Response
 
 from models.schemas import PreviewResponse, PreviewMeta
-from services.storage import find_output_file
+from services.gcode_parser import decode_preview, decode_preview_meta, parse_gcode_file, parse_gcode_moves, preview_meta
+from services.preview_pyramid import ensure_pyramid, read_level
+from services.storage import ensure_project_dir, find_output_file
 
 router = APIRouter()
 
-def parse_gcode_frames(gcode: str):
-    frames = []
-    current = {"x": 0.0, "y": 0.0}
-    pen_down = False
-    distance = 0.0
-    pen_lifts = 0
-
-    for raw in gcode.splitlines():
-        line = raw.split(";")[0].strip()
-        if not line:
-            continue
+def _frames_response(moves, meta: dict, level: int = 0, levels: int = 1):
+    frames = [
+        {"type": "move", "x": x, "y": y, "pen": "down" if pen else "up"}
+        for x, y, pen in zip(moves.x.tolist(), moves.y.tolist(), moves.pen.tolist())
+    ]
+    return PreviewResponse(frames=frames, meta=PreviewMeta(**meta), level=level, levels=levels)
 
-        parts = line.split()
-        cmd = parts[0].upper()
 
-        if cmd in ("M3", "M03"):
-            if not pen_down:
-                pen_down = True
-        if cmd in ("M5", "M05"):
-            if pen_down:
-                pen_down = False
-                pen_lifts += 1
+def parse_gcode_frames(gcode: str):
+    moves = parse_gcode_moves(gcode)
+    return _frames_response(moves, preview_meta(moves))
 
-        if cmd not in ("G0", "G00", "G1", "G01"):
-            continue
 
-        x = current["x"]
-        y = current["y"]
-        for part in parts[1:]:
-            axis = part[0].upper()
-            try:
-                value = float(part[1:])
-            except ValueError:
-                continue
-            if axis == "X":
-                x = value
-            if axis == "Y":
-                y = value
+def _find_gcode(project_id: str, gcode_id: str):
+    output_path = find_output_file(project_id, gcode_id)
+    if output_path is None:
+        raise HTTPException(status_code=404, detail="G-code not found")
+    return output_path
 
-        if x != current["x"] or y != current["y"]:
-            dx = x - current["x"]
-            dy = y - current["y"]
-            distance += (dx ** 2 + dy ** 2) ** 0.5
-            current = {"x": x, "y": y}
-            frames.append({"type": "move", "x": x, "y": y, "pen": "down" if pen_down else "up"})
 
-    meta = PreviewMeta(
-        estimated_time_s=round(distance / 20, 1),
-        distance_mm=round(distance, 2),
-        pen_lifts=max(0, pen_lifts - 1)
-    )
-    return PreviewResponse(frames=frames, meta=meta)
+def _read_pyramid_level(project_id: str, gcode_id: str, level: Optional[int], max_points: Optional[int]):
+    output_path = _find_gcode(project_id, gcode_id)
+    pyramid = ensure_pyramid(ensure_project_dir(project_id), gcode_id, output_path)
+    return read_level(pyramid, level, max_points)
 
 
 @router.get("/preview/{project_id}/{gcode_id}", response_model=PreviewResponse)
-def preview(project_id: str, gcode_id: str):
-    output_path = find_output_file(project_id, gcode_id)
-    if output_path is None:
-        raise HTTPException(status_code=404, detail="G-code not found")
-    gcode = output_path.read_text()
-    return parse_gcode_frames(gcode)
+def preview(
+    project_id: str,
+    gcode_id: str,
+    level: Optional[int] = Query(default=None, ge=0),
+    max_points: Optional[int] = Query(default=None, ge=1)
+):
+    if level is None and max_points is None:
+        moves = parse_gcode_file(_find_gcode(project_id, gcode_id))
+        return _frames_response(moves, preview_meta(moves))
+    data, selected, levels = _read_pyramid_level(project_id, gcode_id, level, max_points)
+    moves, meta = decode_preview(data)
+    return _frames_response(moves, meta, selected, levels)
+
+
+@router.get("/preview/{project_id}/{gcode_id}/binary")
+def preview_binary(
+    project_id: str,
+    gcode_id: str,
+    level: Optional[int] = Query(default=None, ge=0),
+    max_points: Optional[int] = Query(default=None, ge=1)
+):
+    data, selected, levels = _read_pyramid_level(project_id, gcode_id, level, max_points)
+    meta = decode_preview_meta(data)
+    return Response(
+        content=data,
+        media_type="application/octet-stream",
+        headers={
+            "X-Preview-Meta": json.dumps(meta, separators=(",", ":")),
+            "X-Preview-Level": str(selected),
+            "X-Preview-Levels": str(levels)
+        }
+    )
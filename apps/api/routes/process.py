@@ -2,8 +2,9 @@ from fastapi import APIRouter, HTTPException
 from pathlib import Path
 
 from models.schemas import SvgResponse, ProcessRequest
-from services.storage import find_source_file, save_intermediate, ensure_project_dir
-from services.vpype_runner import run_vpype_to_svg
+from services.geometry_format import GEOMETRY_SUFFIX
+from services.storage import find_source_file, save_intermediate_file, ensure_project_dir, staged_output
+from services.vpype_runner import run_vpype_to_geometry
 
 router = APIRouter()
 
@@ -14,12 +15,12 @@ def process_vector(payload: ProcessRequest):
         raise HTTPException(status_code=404, detail="Source file not found")
 
     project_dir = ensure_project_dir(payload.project_id)
-    output_path = project_dir / "intermediate" / f"{payload.file_id}_processed.svg"
+    output_path = project_dir / "intermediate" / f"{payload.file_id}_processed{GEOMETRY_SUFFIX}"
     try:
-        run_vpype_to_svg(Path(source_path), output_path)
+        with staged_output(output_path) as staged_path:
+            run_vpype_to_geometry(Path(source_path), staged_path)
     except Exception as exc:
         raise HTTPException(status_code=500, detail=f"vpype failed: {exc}") from exc
 
-    content = output_path.read_text()
-    svg_id = save_intermediate(payload.project_id, "processed.svg", content)
+    svg_id = save_intermediate_file(payload.project_id, f"processed{GEOMETRY_SUFFIX}", output_path)
     return SvgResponse(svg_id=svg_id)
@@ -1,20 +1,76 @@
-from fastapi import APIRouter
+from typing import Any, Callable
+import hashlib
 
-from services.storage import load_project_tree, load_runs
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import JSONResponse, Response
+
+from services.artifact_serving import etag_matches
+from services.job_manager import list_project_jobs
+from services.manifest import ARTIFACT_KINDS
+from services.storage import delete_artifact, load_project_tree, load_runs, load_runs_page, project_versions
 
 router = APIRouter()
 
 
+def _versioned(request: Request, project_id: str, keys: tuple[str, ...], build: Callable[[], Any]) -> Response:
+    versions = project_versions(project_id)
+    query = hashlib.sha256(str(sorted(request.query_params.multi_items())).encode()).hexdigest()[:12]
+    state = "-".join(f"{versions.get(key, 0):x}" for key in keys)
+    etag = f"\"{versions.get('epoch', 0):x}-{state}-{query}\""
+    headers = {"etag": etag, "cache-control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(build(), headers=headers)
+
+
 @router.get("/projects/{project_id}/tree")
-def get_project_tree(project_id: str):
-    return load_project_tree(project_id)
+def get_project_tree(
+    project_id: str,
+    request: Request,
+    kind: str | None = None,
+    limit: int | None = None,
+    cursor: str | None = None
+):
+    if kind is not None and kind not in ARTIFACT_KINDS:
+        raise HTTPException(status_code=404, detail="Unknown artifact kind")
+    if cursor is not None and kind is None:
+        # next_cursor is per kind; follow it with that kind
+        raise HTTPException(status_code=400, detail="cursor requires kind")
+    if limit is not None:
+        limit = max(1, min(limit, 1000))
+    return _versioned(
+        request,
+        project_id,
+        ("artifacts",),
+        lambda: load_project_tree(project_id, kind, limit, cursor)
+    )
 
 
 @router.get("/projects/{project_id}/runs")
-def get_project_runs(project_id: str):
-    return {"project_id": project_id, "runs": load_runs(project_id)}
+def get_project_runs(project_id: str, limit: int = 100, cursor: int | None = None):
+    runs, next_cursor = load_runs_page(project_id, min(limit, 1000), cursor)
+    return {"project_id": project_id, "runs": runs, "next_cursor": next_cursor}
 
 
 @router.get("/projects/{project_id}/summary")
-def get_project_summary(project_id: str):
-    return {"tree": load_project_tree(project_id), "runs": load_runs(project_id)}
+def get_project_summary(project_id: str, request: Request):
+    return _versioned(
+        request,
+        project_id,
+        ("artifacts", "runs"),
+        lambda: {"tree": load_project_tree(project_id), "runs": load_runs(project_id)}
+    )
+
+
+@router.get("/projects/{project_id}/jobs")
+def get_project_jobs(project_id: str, limit: int = 50):
+    return {"project_id": project_id, "jobs": list_project_jobs(project_id, limit)}
+
+
+@router.delete("/projects/{project_id}/files/{kind}/{file_id}")
+def delete_project_file(project_id: str, kind: str, file_id: str):
+    if kind not in ARTIFACT_KINDS:
+        raise HTTPException(status_code=404, detail="Unknown artifact kind")
+    if not delete_artifact(project_id, kind, file_id):
+        raise HTTPException(status_code=404, detail="File not found")
+    return {"project_id": project_id, "kind": kind, "file_id": file_id, "deleted": True}
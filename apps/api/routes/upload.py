@@ -1,16 +1,32 @@
-from fastapi import APIRouter, UploadFile, File, Form
-from typing import Optional
+from fastapi import APIRouter, HTTPException, Request
+from starlette.concurrency import run_in_threadpool
 
 from models.schemas import UploadResponse
-from services.storage import create_project, save_upload
+from services.storage import create_project, find_source_file, save_staged_upload
+from services.upload_stream import InvalidUpload, UploadTooLarge, stream_upload
 
 router = APIRouter()
 
 @router.post("/upload", response_model=UploadResponse)
-async def upload_file(
-    file: UploadFile = File(...),
-    project_id: Optional[str] = Form(default=None)
-):
-    active_project_id = project_id or create_project()
-    file_id = save_upload(active_project_id, file.filename, file.file)
-    return UploadResponse(project_id=active_project_id, file_id=file_id, filename=file.filename)
+async def upload_file(request: Request):
+    try:
+        staged, fields = await stream_upload(request)
+    except UploadTooLarge as exc:
+        raise HTTPException(status_code=413, detail=str(exc)) from exc
+    except InvalidUpload as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    if staged is None:
+        raise HTTPException(status_code=422, detail="Missing file field")
+
+    active_project_id = fields.get("project_id") or await run_in_threadpool(create_project)
+    file_id = await run_in_threadpool(
+        save_staged_upload,
+        active_project_id,
+        staged.filename,
+        staged.path,
+        staged.sha256
+    )
+    # identical bytes come back as the existing artifact, under the name it was stored with
+    stored = await run_in_threadpool(find_source_file, active_project_id, file_id)
+    filename = stored.name.split("_", 1)[1] if stored is not None else staged.filename
+    return UploadResponse(project_id=active_project_id, file_id=file_id, filename=filename)
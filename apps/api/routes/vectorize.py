@@ -1,9 +1,15 @@
-from fastapi import APIRouter, HTTPException
+from dataclasses import asdict
+from fastapi import APIRouter, HTTPException, Request
 from pathlib import Path
-from fastapi.responses import PlainTextResponse
 
-from models.schemas import SvgResponse, VectorizeRequest
-from services.storage import find_source_file, ensure_project_dir, save_intermediate_file
+from models.schemas import SvgResponse, VectorizeRequest, VectorizeSweepRequest, VectorizeSweepResponse
+from services.artifact_serving import serve_artifact
+from services.geometry_format import is_geometry_file
+from services.raster_preprocess import RasterPreprocessOptions, RasterProxyOptions, run_preprocess_stage
+from services.stage_cache import run_cached_stage
+from services.storage import find_artifact, find_source_file, ensure_project_dir, load_presets, save_intermediate_file, staged_output
+from services.vectorize_sweep import SWEEP_PARAMETERS, run_sweep
+from services.vpype_runner import materialize_svg
 from services.vtracer_runner import run_vtracer_to_svg, VtracerOptions
 
 router = APIRouter()
@@ -17,6 +23,16 @@ def vectorize_raster(payload: VectorizeRequest):
     project_dir = ensure_project_dir(payload.project_id)
     output_path = project_dir / "intermediate" / f"{payload.file_id}_vectorized.svg"
     try:
+        raster_path, _ = run_preprocess_stage(
+            Path(source_path),
+            RasterPreprocessOptions(
+                plot_width_mm=payload.plot_width_mm,
+                pen_width_mm=payload.pen_width_mm,
+                quantize_colors=payload.quantize_colors,
+                threshold=payload.threshold,
+                denoise=payload.denoise
+            )
+        )
         options = VtracerOptions(
             mode=payload.mode,
             colormode=payload.colormode,
@@ -26,9 +42,12 @@ def vectorize_raster(payload: VectorizeRequest):
             length_threshold=payload.length_threshold,
             corner_threshold=payload.corner_threshold,
             segment_length=payload.segment_length,
-            spiro=payload.spiro
+            spiro=payload.spiro,
+            tile_size=payload.tile_size,
+            tile_overlap=payload.tile_overlap
         )
-        run_vtracer_to_svg(Path(source_path), output_path, options)
+        with staged_output(output_path) as staged_path:
+            run_vtracer_to_svg(raster_path, staged_path, options)
     except Exception as exc:
         raise HTTPException(status_code=500, detail=f"vtracer failed: {exc}") from exc
 
@@ -36,10 +55,49 @@ def vectorize_raster(payload: VectorizeRequest):
     return SvgResponse(svg_id=svg_id)
 
 
-@router.get("/svg/{project_id}/{svg_id}", response_class=PlainTextResponse)
-def get_svg(project_id: str, svg_id: str):
-    from services.storage import find_intermediate_file
-    svg_path = find_intermediate_file(project_id, svg_id)
-    if svg_path is None:
+@router.post("/vectorize/sweep", response_model=VectorizeSweepResponse)
+def sweep_vectorize(payload: VectorizeSweepRequest):
+    source_path = find_source_file(payload.project_id, payload.file_id)
+    if source_path is None:
+        raise HTTPException(status_code=404, detail="Source file not found")
+    preset = {}
+    if payload.preset is not None:
+        preset = next((p for p in load_presets(payload.project_id) if p.get("name") == payload.preset), None)
+        if preset is None:
+            raise HTTPException(status_code=404, detail="Preset not found")
+    base = VtracerOptions(**{key: preset[key] for key in SWEEP_PARAMETERS if key in preset})
+    proxy_options = RasterProxyOptions(
+        max_size=max(16, payload.proxy_size),
+        quantize_colors=preset.get("quantize_colors", 0),
+        threshold=preset.get("threshold"),
+        denoise=preset.get("denoise", 0)
+    )
+    try:
+        proxy_size, proxy_cached, variants = run_sweep(
+            Path(source_path),
+            base,
+            proxy_options,
+            payload.parameters,
+            payload.thumbnail_size
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    return VectorizeSweepResponse(
+        proxy_width=proxy_size[0],
+        proxy_height=proxy_size[1],
+        proxy_cached=proxy_cached,
+        variants=[asdict(variant) for variant in variants]
+    )
+
+
+@router.get("/svg/{project_id}/{svg_id}")
+def get_svg(project_id: str, svg_id: str, request: Request):
+    artifact = find_artifact(project_id, "intermediate", svg_id)
+    if artifact is None:
         raise HTTPException(status_code=404, detail="SVG not found")
-    return svg_path.read_text()
+    path, sha256 = artifact
+    if is_geometry_file(path):
+        path, _ = run_cached_stage("materialize-svg", path, None, ".svg", lambda out: materialize_svg(artifact[0], out))
+        # the rendered SVG lives in the stage cache, not the project, so it gets no precompressed variants
+        return serve_artifact(request, path, sha256, "text/plain; charset=utf-8", variants=False)
+    return serve_artifact(request, path, sha256, "text/plain; charset=utf-8")
@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+from pathlib import Path
+import os
+import re
+
+import anyio
+from starlette.requests import Request
+from starlette.responses import FileResponse, Response
+from starlette.types import Receive, Scope, Send
+
+from services.artifact_variants import find_variant, schedule_variants
+
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+_CACHE_CONTROL = "private, max-age=31536000, immutable"
+
+
+class ArtifactFileResponse(FileResponse):
+    chunk_size = 1024 * 1024
+
+    def __init__(self, path: Path, stat_result: os.stat_result, offset: int = 0, length: int | None = None, **kwargs):
+        super().__init__(path, stat_result=stat_result, **kwargs)
+        self.offset = offset
+        self.length = stat_result.st_size - offset if length is None else length
+        self.headers["content-length"] = str(self.length)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope["method"].upper() == "HEAD" or self.length == 0:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+        if "http.response.zerocopysend" in scope.get("extensions", {}):
+            fd = os.open(self.path, os.O_RDONLY)
+            try:
+                await send({
+                    "type": "http.response.zerocopysend",
+                    "file": fd,
+                    "offset": self.offset,
+                    "count": self.length,
+                    "more_body": False
+                })
+            finally:
+                os.close(fd)
+            return
+        async with await anyio.open_file(self.path, mode="rb") as file:
+            await file.seek(self.offset)
+            remaining = self.length
+            while remaining > 0:
+                chunk = await file.read(min(self.chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+            if remaining > 0:
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+def etag_matches(header: str | None, etag: str) -> bool:
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in header.split(","))
+
+
+def _parse_range(header: str, size: int) -> tuple[int, int] | None:
+    match = _RANGE_RE.match(header.strip())
+    if match is None:
+        raise ValueError(header)
+    first, last = match.groups()
+    if not first and not last:
+        raise ValueError(header)
+    if not first:
+        start, end = max(0, size - int(last)), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return None
+    return start, end
+
+
+def serve_artifact(
+    request: Request,
+    path: Path,
+    sha256: str | None,
+    media_type: str,
+    variants: bool = True
+) -> Response:
+    stat = path.stat()
+    base_tag = sha256[:32] if sha256 else f"{stat.st_mtime_ns:x}-{stat.st_size:x}"
+    range_header = request.headers.get("range")
+    variant = None
+    if variants and not range_header:
+        variant = find_variant(path, request.headers.get("accept-encoding"))
+    if variant is None and variants:
+        schedule_variants(path)
+
+    etag = f"\"{base_tag}-{variant[1]}\"" if variant else f"\"{base_tag}\""
+    headers = {
+        "etag": etag,
+        "vary": "Accept-Encoding",
+        "accept-ranges": "bytes",
+        "cache-control": _CACHE_CONTROL
+    }
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    if variant is not None:
+        variant_path, encoding = variant
+        return ArtifactFileResponse(
+            variant_path,
+            variant_path.stat(),
+            media_type=media_type,
+            headers={**headers, "content-encoding": encoding}
+        )
+
+    if range_header and request.headers.get("if-range", etag) == etag:
+        try:
+            selected = _parse_range(range_header, stat.st_size)
+        except ValueError:
+            # unsupported or multi-part ranges: answer with the whole file, which RFC 9110 allows
+            return ArtifactFileResponse(path, stat, media_type=media_type, headers=headers)
+        if selected is None:
+            return Response(status_code=416, headers={**headers, "content-range": f"bytes */{stat.st_size}"})
+        start, end = selected
+        return ArtifactFileResponse(
+            path,
+            stat,
+            offset=start,
+            length=end - start + 1,
+            status_code=206,
+            media_type=media_type,
+            headers={**headers, "content-range": f"bytes {start}-{end}/{stat.st_size}"}
+        )
+
+    return ArtifactFileResponse(path, stat, media_type=media_type, headers=headers)
@@ -0,0 +1,109 @@
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from threading import Lock
+from uuid import uuid4
+import gzip
+import os
+import shutil
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESSIBLE_SUFFIXES = {".svg", ".gcode", ".json", ".txt"}
+VARIANT_MIN_BYTES = 4096
+_EXTENSIONS = {"zstd": "zst", "gzip": "gz"}
+_PREFERENCE = ("zstd", "gzip")
+
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="artifact-variants")
+_scheduled: set[Path] = set()
+_scheduled_lock = Lock()
+
+
+def available_encodings() -> tuple[str, ...]:
+    return tuple(e for e in _PREFERENCE if e != "zstd" or zstandard is not None)
+
+
+def variant_path(path: Path, encoding: str) -> Path:
+    # <project>/<kind>/<name> -> <project>/variants/<kind>/<name>.<ext>, outside the manifest-scanned dirs
+    return path.parent.parent / "variants" / path.parent.name / f"{path.name}.{_EXTENSIONS[encoding]}"
+
+
+def _compress(source: Path, dest: Path, encoding: str) -> None:
+    with source.open("rb") as src, dest.open("wb") as out:
+        if encoding == "gzip":
+            with gzip.GzipFile(fileobj=out, mode="wb", compresslevel=6, mtime=0) as gz:
+                shutil.copyfileobj(src, gz, 1024 * 1024)
+        else:
+            zstandard.ZstdCompressor(level=10).copy_stream(src, out)
+
+
+def build_variants(path: Path) -> None:
+    size = path.stat().st_size
+    for encoding in available_encodings():
+        dest = variant_path(path, encoding)
+        if dest.exists():
+            continue
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        tmp = dest.with_name(f".{uuid4().hex}.tmp")
+        try:
+            _compress(path, tmp, encoding)
+            # not worth serving a variant that barely shrinks the payload
+            if tmp.stat().st_size < size * 0.9:
+                os.replace(tmp, dest)
+        finally:
+            tmp.unlink(missing_ok=True)
+
+
+def _build_scheduled(path: Path) -> None:
+    try:
+        build_variants(path)
+    except OSError:
+        pass
+    finally:
+        with _scheduled_lock:
+            _scheduled.discard(path)
+
+
+def schedule_variants(path: Path) -> None:
+    if path.suffix.lower() not in COMPRESSIBLE_SUFFIXES:
+        return
+    try:
+        if path.stat().st_size < VARIANT_MIN_BYTES:
+            return
+    except FileNotFoundError:
+        return
+    with _scheduled_lock:
+        if path in _scheduled:
+            return
+        _scheduled.add(path)
+    _executor.submit(_build_scheduled, path)
+
+
+def _accepted(accept_encoding: str) -> set[str]:
+    accepted = set()
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        params = params.replace(" ", "")
+        if params.startswith("q=") and float(params[2:] or 0) == 0:
+            continue
+        accepted.add(name.strip().lower())
+    return accepted
+
+
+def find_variant(path: Path, accept_encoding: str | None) -> tuple[Path, str] | None:
+    if not accept_encoding:
+        return None
+    try:
+        accepted = _accepted(accept_encoding)
+    except ValueError:
+        return None
+    for encoding in available_encodings():
+        if encoding in accepted or "*" in accepted:
+            candidate = variant_path(path, encoding)
+            if candidate.exists():
+                return candidate, encoding
+    return None
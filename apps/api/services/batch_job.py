@@ -0,0 +1,176 @@
+from __future__ import annotations
+
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from queue import Empty
+from threading import Lock
+from typing import Any
+import multiprocessing
+import os
+
+from models.schemas import PipelineBatchRequest, PipelineJobRequest
+from services.job_manager import update_job
+from services.metrics import observe_failed_run, observe_run
+from services.storage import append_runs
+
+BATCH_WORKERS = int(os.environ.get("VECTRA_BATCH_WORKERS", str(os.cpu_count() or 2)))
+_REPORT_INTERVAL_S = 0.25
+
+_pool: ProcessPoolExecutor | None = None
+_manager = None
+_pool_lock = Lock()
+
+
+def _init_batch_worker() -> None:
+    from services import layer_pipeline, vpype_worker
+
+    vpype_worker.use_inline_execution()
+    layer_pipeline.use_inline_execution()
+
+
+def _run_item(job_id: str, index: int, payload: dict[str, Any], progress_queue) -> dict[str, Any]:
+    from services.pipeline_job import execute_pipeline
+
+    def report(**changes):
+        progress_queue.put((index, changes))
+
+    report(status="running", progress=5, message="Starting")
+    return execute_pipeline(job_id, PipelineJobRequest(**payload), report)
+
+
+def _get_pool():
+    global _pool, _manager
+    with _pool_lock:
+        if _pool is None:
+            context = multiprocessing.get_context("spawn")
+            _manager = context.Manager()
+            _pool = ProcessPoolExecutor(
+                max_workers=max(1, BATCH_WORKERS),
+                mp_context=context,
+                initializer=_init_batch_worker
+            )
+        return _pool, _manager
+
+
+def _discard_pool(pool: ProcessPoolExecutor) -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _apply(item: dict[str, Any], changes: dict[str, Any]) -> None:
+    for key in ("status", "progress", "message", "error"):
+        if key in changes:
+            item[key] = changes[key]
+    if changes.get("result") is not None:
+        item["result"] = {**(item["result"] or {}), **changes["result"]}
+
+
+def _drain(progress_queue, items: list[dict[str, Any]]) -> bool:
+    changed = False
+    while True:
+        try:
+            index, changes = progress_queue.get_nowait()
+        except Empty:
+            return changed
+        if items[index]["status"] in ("completed", "failed"):
+            continue
+        _apply(items[index], changes)
+        changed = True
+
+
+def _summary(items: list[dict[str, Any]]) -> dict[str, Any]:
+    completed = sum(1 for item in items if item["status"] == "completed")
+    failed = sum(1 for item in items if item["status"] == "failed")
+    progress = sum(100 if item["status"] in ("completed", "failed") else item["progress"] for item in items)
+    return {
+        "progress": progress // max(1, len(items)),
+        "message": f"{completed + failed}/{len(items)} items finished",
+        "result": {
+            "total": len(items),
+            "completed": completed,
+            "failed": failed,
+            "items": [dict(item) for item in items]
+        }
+    }
+
+
+def run_batch_job(job_id: str, payload: PipelineBatchRequest) -> None:
+    options = payload.model_dump(exclude={"items", "priority"})
+    items = [
+        {
+            "file_id": entry.file_id,
+            "filename": entry.filename,
+            "status": "queued",
+            "progress": 0,
+            "message": "Queued",
+            "result": None,
+            "error": None
+        }
+        for entry in payload.items
+    ]
+    update_job(job_id, status="running", **_summary(items))
+
+    pool, manager = _get_pool()
+    progress_queue = manager.Queue()
+    futures: dict[Future, int] = {}
+    try:
+        for index, entry in enumerate(payload.items):
+            item_payload = {**options, "file_id": entry.file_id, "filename": entry.filename}
+            futures[pool.submit(_run_item, job_id, index, item_payload, progress_queue)] = index
+    except BrokenProcessPool:
+        _discard_pool(pool)
+
+    runs: dict[int, dict[str, Any]] = {}
+    pending = set(futures)
+    while pending:
+        done, pending = wait(pending, timeout=_REPORT_INTERVAL_S, return_when=FIRST_COMPLETED)
+        changed = _drain(progress_queue, items)
+        for future in done:
+            index = futures[future]
+            try:
+                runs[index] = future.result()
+            except BrokenProcessPool as exc:
+                _discard_pool(pool)
+                observe_failed_run()
+                _apply(items[index], {"status": "failed", "message": "Item failed", "error": str(exc) or "Worker crashed"})
+            except Exception as exc:
+                observe_failed_run()
+                _apply(items[index], {"status": "failed", "message": "Item failed", "error": str(exc)})
+            else:
+                run = runs[index]
+                observe_run(run)
+                _apply(items[index], {
+                    "status": "completed",
+                    "progress": 100,
+                    "message": "Completed",
+                    "result": {
+                        "gcode_id": run["gcode_id"],
+                        "cache": run["cache"],
+                        "duration_s": run["duration_s"],
+                        "timings": run["timings"]
+                    }
+                })
+            changed = True
+        if changed:
+            update_job(job_id, **_summary(items))
+    _drain(progress_queue, items)
+
+    submitted = set(futures.values())
+    for index, item in enumerate(items):
+        if index not in submitted:
+            _apply(item, {"status": "failed", "message": "Item failed", "error": "Worker pool unavailable"})
+    append_runs(payload.project_id, [runs[index] for index in sorted(runs)])
+
+    summary = _summary(items)
+    completed = summary["result"]["completed"]
+    update_job(
+        job_id,
+        status="completed" if completed else "failed",
+        progress=100,
+        message=f"Batch finished: {completed}/{len(items)} completed",
+        result=summary["result"],
+        error=None if completed else "All batch items failed"
+    )
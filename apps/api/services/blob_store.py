@@ -0,0 +1,183 @@
+from __future__ import annotations
+
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from threading import local
+import os
+import shutil
+import sqlite3
+import sys
+
+BLOB_ROOT = Path("data/blobs")
+BLOB_DB_NAME = "blobs.sqlite"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    sha256 TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    refs INTEGER NOT NULL,
+    created_at TEXT NOT NULL
+) WITHOUT ROWID;
+"""
+
+_local = local()
+
+
+def _connection() -> sqlite3.Connection:
+    conn = getattr(_local, "conn", None)
+    key = str(BLOB_ROOT / BLOB_DB_NAME)
+    if conn is not None and getattr(_local, "key", None) == key:
+        return conn
+    BLOB_ROOT.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(key, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(_SCHEMA)
+    _local.conn = conn
+    _local.key = key
+    return conn
+
+
+@contextmanager
+def blob_transaction():
+    conn = _connection()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+
+def blob_path(sha256: str) -> Path:
+    return BLOB_ROOT / sha256[:2] / sha256
+
+
+def _link_or_copy(source: Path, dest: Path) -> None:
+    try:
+        os.link(source, dest)
+    except OSError:
+        # filesystems without hard links still work, they just lose the sharing
+        shutil.copyfile(source, dest)
+
+
+def store_blob(conn: sqlite3.Connection, path: Path, sha256: str, dest_path: Path) -> bool:
+    # moves path into the store (or drops it when the content is already there) and
+    # links dest_path to the stored blob; returns True when the content was deduplicated
+    blob = blob_path(sha256)
+    row = conn.execute("SELECT refs FROM blobs WHERE sha256 = ?", (sha256,)).fetchone()
+    existed = row is not None and blob.exists()
+    if not existed:
+        blob.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            os.replace(path, blob)
+        except OSError:
+            shutil.copyfile(path, blob)
+    _link_or_copy(blob, dest_path)
+    if row is None:
+        conn.execute(
+            "INSERT INTO blobs (sha256, size, refs, created_at) VALUES (?, ?, 1, ?)",
+            (sha256, blob.stat().st_size, datetime.now(timezone.utc).isoformat())
+        )
+    else:
+        conn.execute("UPDATE blobs SET refs = ? WHERE sha256 = ?", (max(row[0], 0) + 1, sha256))
+    return existed
+
+
+def release_blob(conn: sqlite3.Connection, sha256: str) -> bool:
+    # drops one reference; the blob itself is reclaimed once nothing points at it
+    row = conn.execute("SELECT refs FROM blobs WHERE sha256 = ?", (sha256,)).fetchone()
+    if row is None:
+        return False
+    if row[0] > 1:
+        conn.execute("UPDATE blobs SET refs = refs - 1 WHERE sha256 = ?", (sha256,))
+        return False
+    conn.execute("DELETE FROM blobs WHERE sha256 = ?", (sha256,))
+    blob_path(sha256).unlink(missing_ok=True)
+    return True
+
+
+def blob_stats() -> dict:
+    count, stored, referenced = _connection().execute(
+        "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(size * refs), 0) FROM blobs"
+    ).fetchone()
+    return {"blobs": count, "stored_bytes": stored, "referenced_bytes": referenced}
+
+
+def _adopt(path: Path, sha256: str) -> None:
+    blob = blob_path(sha256)
+    if not blob.exists():
+        blob.parent.mkdir(parents=True, exist_ok=True)
+        _link_or_copy(path, blob)
+    elif not os.path.samefile(path, blob):
+        # adopt artifacts written before the store existed
+        tmp = path.with_name(f".{path.name}.relink")
+        _link_or_copy(blob, tmp)
+        os.replace(tmp, path)
+
+
+def _project_refs(project_dir: Path) -> Counter[str]:
+    from services.manifest import ARTIFACT_KINDS, list_artifact_records
+
+    refs: Counter[str] = Counter()
+    for kind, name, sha256 in list_artifact_records(project_dir):
+        path = project_dir / kind / name
+        if kind not in ARTIFACT_KINDS or not sha256 or not path.exists():
+            continue
+        refs[sha256] += 1
+        _adopt(path, sha256)
+    return refs
+
+
+def reconcile_project_refs(project_dir: Path, before: Counter[str]) -> None:
+    # a manifest rescan replaces a project's records wholesale, so its references move by
+    # the difference between the records it had and the ones it has now
+    with blob_transaction() as conn:
+        after = _project_refs(project_dir)
+        now = datetime.now(timezone.utc).isoformat()
+        for sha256, count in (after - before).items():
+            conn.execute(
+                "INSERT INTO blobs (sha256, size, refs, created_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (sha256) DO UPDATE SET refs = MAX(refs, 0) + excluded.refs",
+                (sha256, blob_path(sha256).stat().st_size, count, now)
+            )
+        for sha256, count in (before - after).items():
+            for _ in range(count):
+                release_blob(conn, sha256)
+
+
+def rebuild_blob_store(project_dirs: list[Path]) -> dict:
+    refs: Counter[str] = Counter()
+    with blob_transaction() as conn:
+        for project_dir in project_dirs:
+            refs += _project_refs(project_dir)
+        known = dict(conn.execute("SELECT sha256, refs FROM blobs").fetchall())
+        reclaimed = 0
+        for sha256 in set(known) - set(refs):
+            conn.execute("DELETE FROM blobs WHERE sha256 = ?", (sha256,))
+            blob_path(sha256).unlink(missing_ok=True)
+            reclaimed += 1
+        now = datetime.now(timezone.utc).isoformat()
+        for sha256, count in refs.items():
+            conn.execute(
+                "INSERT INTO blobs (sha256, size, refs, created_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (sha256) DO UPDATE SET refs = excluded.refs",
+                (sha256, blob_path(sha256).stat().st_size, count, now)
+            )
+    return {"blobs": len(refs), "reclaimed": reclaimed}
+
+
+def main(argv: list[str]) -> int:
+    from services.storage import DATA_ROOT
+
+    project_dirs = sorted(p for p in DATA_ROOT.iterdir() if p.is_dir()) if DATA_ROOT.exists() else []
+    result = rebuild_blob_store(project_dirs)
+    print(f"{result['blobs']} blobs referenced, {result['reclaimed']} reclaimed")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
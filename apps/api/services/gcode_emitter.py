@@ -0,0 +1,271 @@
+from __future__ import annotations
+
+from bisect import bisect_left
+from pathlib import Path
+from typing import Callable, Iterator
+import math
+import os
+import tempfile
+
+import numpy as np
+
+from services.geometry_format import Geometry, is_geometry_file, read_geometry
+from services.vpype_runner import GcodeProfile, run_vpype_to_gcode, run_vpype_to_geometry
+
+# "native" streams G-code from the binary geometry; "vpype" keeps the gwrite path
+GCODE_EMITTER = os.environ.get("VECTRA_GCODE_EMITTER", "native")
+# gwrite's unit = "mm" scale, computed the same way vpype does so coordinates round identically
+_MM_SCALE = 1 / (96.0 / 25.4)
+_MIN_ARC_POINTS = 4
+_MAX_ARC_RADIUS_MM = 10000.0
+_MAX_ARC_SWEEP = 1.9 * math.pi
+_WRITE_BUFFER = 1024 * 1024
+# shortest-run fit checks for the whole geometry run this many windows at a time
+_FIT_BLOCK = 8192
+GCODE_HEADER = "G21\nG90\n"
+GCODE_FOOTER = "M5\nG00 X0 Y0\n"
+
+
+def _grow(start: int, first: int, last: int, fits: Callable[[int, int], bool]) -> int:
+    # furthest end index in [first, last] that still fits, given that first does: gallop
+    # outwards, then bisect
+    good, step = first, 1
+    while good < last:
+        probe = min(good + step, last)
+        if not fits(start, probe):
+            lo, hi = good, probe
+            while hi - lo > 1:
+                mid = (lo + hi) // 2
+                if fits(start, mid):
+                    lo = mid
+                else:
+                    hi = mid
+            return lo
+        good = probe
+        step *= 2
+    return good
+
+
+def _line_fits(points: np.ndarray, tolerance: float) -> Callable[[int, int], bool]:
+    def fits(start: int, end: int) -> bool:
+        direction = points[end] - points[start]
+        length = math.hypot(direction[0], direction[1])
+        if length == 0.0:
+            return False
+        offsets = points[start + 1:end] - points[start]
+        deviation = np.abs(direction[0] * offsets[:, 1] - direction[1] * offsets[:, 0]) / length
+        along = (offsets @ direction) / length
+        # merged points must stay close to the chord and keep moving forward along it
+        return bool(
+            deviation.max() <= tolerance
+            and along[0] >= 0.0
+            and along[-1] <= length
+            and np.all(np.diff(along) >= 0.0)
+        )
+    return fits
+
+
+def _line_window_fits(windows: np.ndarray, tolerance: float) -> np.ndarray:
+    # _line_fits for many runs at once; windows is (n, k, 2), n runs of k points
+    start, direction = windows[:, 0], windows[:, -1] - windows[:, 0]
+    length = np.hypot(direction[:, 0], direction[:, 1])
+    offsets = windows[:, 1:-1] - start[:, None]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cross = direction[:, None, 0] * offsets[..., 1] - direction[:, None, 1] * offsets[..., 0]
+        deviation = np.abs(cross) / length[:, None]
+        along = (offsets * direction[:, None]).sum(axis=2) / length[:, None]
+    # merged points must stay close to the chord and keep moving forward along it
+    return (
+        (length > 0.0)
+        & (deviation.max(axis=1) <= tolerance)
+        & (along[:, 0] >= 0.0)
+        & (along[:, -1] <= length)
+        & np.all(np.diff(along, axis=1) >= 0.0, axis=1)
+    )
+
+
+def _circle(a: np.ndarray, b: np.ndarray, c: np.ndarray) -> tuple[float, float, float] | None:
+    det = 2.0 * (a[0] * (b[1] - c[1]) + b[0] * (c[1] - a[1]) + c[0] * (a[1] - b[1]))
+    if abs(det) < 1e-12:
+        return None
+    a2, b2, c2 = a @ a, b @ b, c @ c
+    cx = (a2 * (b[1] - c[1]) + b2 * (c[1] - a[1]) + c2 * (a[1] - b[1])) / det
+    cy = (a2 * (c[0] - b[0]) + b2 * (a[0] - c[0]) + c2 * (b[0] - a[0])) / det
+    return cx, cy, math.hypot(a[0] - cx, a[1] - cy)
+
+
+def _circles(a: np.ndarray, b: np.ndarray, c: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # circumcircles of (n, 2) point triples; collinear triples get NaN
+    det = 2.0 * (a[:, 0] * (b[:, 1] - c[:, 1]) + b[:, 0] * (c[:, 1] - a[:, 1]) + c[:, 0] * (a[:, 1] - b[:, 1]))
+    det = np.where(np.abs(det) < 1e-12, np.nan, det)
+    a2, b2, c2 = (a * a).sum(axis=1), (b * b).sum(axis=1), (c * c).sum(axis=1)
+    cx = (a2 * (b[:, 1] - c[:, 1]) + b2 * (c[:, 1] - a[:, 1]) + c2 * (a[:, 1] - b[:, 1])) / det
+    cy = (a2 * (c[:, 0] - b[:, 0]) + b2 * (a[:, 0] - c[:, 0]) + c2 * (b[:, 0] - a[:, 0])) / det
+    return cx, cy, np.hypot(a[:, 0] - cx, a[:, 1] - cy)
+
+
+def _arc_fits(points: np.ndarray, tolerance: float) -> Callable[[int, int], bool]:
+    def fits(start: int, end: int) -> bool:
+        circle = _circle(points[start], points[(start + end) // 2], points[end])
+        if circle is None or circle[2] > _MAX_ARC_RADIUS_MM:
+            return False
+        cx, cy, radius = circle
+        rel = points[start:end + 1] - (cx, cy)
+        if np.abs(np.hypot(rel[:, 0], rel[:, 1]) - radius).max() > tolerance:
+            return False
+        cross = rel[:-1, 0] * rel[1:, 1] - rel[:-1, 1] * rel[1:, 0]
+        if not (np.all(cross > 0.0) or np.all(cross < 0.0)):
+            return False
+        dot = (rel[:-1] * rel[1:]).sum(axis=1)
+        if np.abs(np.arctan2(cross, dot)).sum() > _MAX_ARC_SWEEP:
+            return False
+        # the arc bulges past each replaced chord by its sagitta
+        half_chord = np.hypot(*(rel[1:] - rel[:-1]).T) / 2.0
+        sagitta = radius - np.sqrt(np.maximum(radius * radius - half_chord * half_chord, 0.0))
+        return bool(sagitta.max() <= tolerance)
+    return fits
+
+
+def _arc_window_fits(windows: np.ndarray, tolerance: float) -> np.ndarray:
+    # _arc_fits for many runs at once; windows is (n, k, 2), n runs of k points
+    cx, cy, radius = _circles(windows[:, 0], windows[:, (windows.shape[1] - 1) // 2], windows[:, -1])
+    rel = windows - np.stack((cx, cy), axis=1)[:, None]
+    with np.errstate(invalid="ignore"):
+        deviation = np.abs(np.hypot(rel[..., 0], rel[..., 1]) - radius[:, None]).max(axis=1)
+        cross = rel[:, :-1, 0] * rel[:, 1:, 1] - rel[:, :-1, 1] * rel[:, 1:, 0]
+        dot = (rel[:, :-1] * rel[:, 1:]).sum(axis=2)
+        sweep = np.abs(np.arctan2(cross, dot)).sum(axis=1)
+        # the arc bulges past each replaced chord by its sagitta
+        step = np.diff(rel, axis=1)
+        half_chord = np.hypot(step[..., 0], step[..., 1]) / 2.0
+        sagitta = radius[:, None] - np.sqrt(np.maximum(radius[:, None] ** 2 - half_chord * half_chord, 0.0))
+        return (
+            (radius <= _MAX_ARC_RADIUS_MM)
+            & (deviation <= tolerance)
+            & (np.all(cross > 0.0, axis=1) | np.all(cross < 0.0, axis=1))
+            & (sweep <= _MAX_ARC_SWEEP)
+            & (sagitta.max(axis=1) <= tolerance)
+        )
+
+
+def _first_fits(check, points: np.ndarray, path_end: np.ndarray, tolerance: float, size: int) -> np.ndarray:
+    # whether the shortest run from each point fits inside its own path, for every
+    # point of the geometry at once
+    out = np.zeros(len(points), dtype=bool)
+    if len(points) < size:
+        return out
+    windows = np.lib.stride_tricks.sliding_window_view(points, (size, 2))[:, 0]
+    for block in range(0, len(windows), _FIT_BLOCK):
+        end = min(block + _FIT_BLOCK, len(windows))
+        out[block:end] = check(windows[block:end], tolerance)
+    out &= np.arange(len(points)) + size <= path_end
+    return out
+
+
+class _Formats:
+    def __init__(self, profile: GcodeProfile):
+        p = profile.precision
+        self.first = f"G00 X{{:.{p}f}} Y{{:.{p}f}}\n{profile.pen_down_cmd}\nG4 P{profile.pen_dwell_s}\n"
+        self.segment = f"G01 X{{:.{p}f}} Y{{:.{p}f}}\n"
+        self.arc = {
+            True: f"G03 X{{:.{p}f}} Y{{:.{p}f}} I{{:.{p}f}} J{{:.{p}f}}\n",
+            False: f"G02 X{{:.{p}f}} Y{{:.{p}f}} I{{:.{p}f}} J{{:.{p}f}}\n"
+        }
+        self.line_start = "(Start Line)\n"
+        self.line_end = f"{profile.pen_up_cmd}\nG4 P{profile.pen_dwell_s}\n"
+
+
+def _fitted_moves(
+    points: np.ndarray,
+    profile: GcodeProfile,
+    formats: _Formats,
+    arc_first: np.ndarray,
+    line_first: np.ndarray
+) -> Iterator[str]:
+    # only starts whose shortest arc or merged line fits are grown; the points in between
+    # are written as plain segments
+    last = len(points) - 1
+    arc_fits = _arc_fits(points, profile.arc_tolerance_mm)
+    line_fits = _line_fits(points, profile.line_tolerance_mm)
+    starts = np.flatnonzero(arc_first | line_first).tolist() + [last]
+    segment = formats.segment.format
+    i = 0
+    while i < last:
+        nxt = starts[bisect_left(starts, i)]
+        if nxt > i:
+            yield "".join(segment(x, y) for x, y in points[i + 1:nxt + 1].tolist())
+            i = nxt
+            continue
+        arc_end = _grow(i, i + _MIN_ARC_POINTS - 1, last, arc_fits) if arc_first[i] else None
+        line_end = _grow(i, i + 2, last, line_fits) if line_first[i] else None
+        if arc_end is not None and (line_end is None or arc_end > line_end):
+            cx, cy, _ = _circle(points[i], points[(i + arc_end) // 2], points[arc_end])
+            start, end, after = points[i], points[arc_end], points[i + 1]
+            ccw = (start[0] - cx) * (after[1] - cy) - (start[1] - cy) * (after[0] - cx) > 0
+            yield formats.arc[bool(ccw)].format(end[0], end[1], cx - start[0], cy - start[1])
+            i = arc_end
+            continue
+        i = line_end if line_end is not None else i + 1
+        yield segment(points[i][0], points[i][1])
+
+
+def iter_gcode_layers(geometry: Geometry, profile: GcodeProfile) -> Iterator[str]:
+    # the program body, one "(Start Layer)" block per layer; split layers can be emitted
+    # separately and concatenated between one header and footer
+    formats = _Formats(profile)
+    fitting = profile.arc_tolerance_mm > 0 or profile.line_tolerance_mm > 0
+    raw = np.ascontiguousarray(geometry.coords, dtype=np.float64)
+    # gwrite scales the complex line arrays, so do the same to round identically
+    scaled = (raw.view(np.complex128).reshape(-1) * _MM_SCALE).view(np.float64).reshape(-1, 2)
+    offsets = geometry.offsets.tolist()
+    layer_ids = np.asarray(geometry.layer_ids)
+    if fitting:
+        counts = np.diff(np.asarray(geometry.offsets, dtype=np.int64))
+        path_end = np.repeat(np.asarray(geometry.offsets[1:], dtype=np.int64), counts)
+        arc_first = line_first = np.zeros(len(scaled), dtype=bool)
+        if profile.arc_tolerance_mm > 0:
+            arc_first = _first_fits(_arc_window_fits, scaled, path_end, profile.arc_tolerance_mm, _MIN_ARC_POINTS)
+        if profile.line_tolerance_mm > 0:
+            line_first = _first_fits(_line_window_fits, scaled, path_end, profile.line_tolerance_mm, 3)
+
+    for layer_index in range(len(geometry.layers)):
+        yield "(Start Layer)\n"
+        for path_index in np.flatnonzero(layer_ids == layer_index).tolist():
+            points = scaled[offsets[path_index]:offsets[path_index + 1]]
+            chunk = [formats.line_start, formats.first.format(points[0, 0], points[0, 1])]
+            if fitting and len(points) > 2:
+                span = slice(offsets[path_index], offsets[path_index + 1])
+                chunk.extend(_fitted_moves(points, profile, formats, arc_first[span], line_first[span]))
+            else:
+                segment = formats.segment.format
+                chunk.extend(segment(x, y) for x, y in points[1:].tolist())
+            chunk.append(formats.line_end)
+            yield "".join(chunk)
+
+
+def iter_gcode(geometry: Geometry, profile: GcodeProfile) -> Iterator[str]:
+    # mirrors the gwrite profile from write_profile_config chunk for chunk; with fitting
+    # disabled the output is byte-identical to `vpype read ... gwrite`
+    yield GCODE_HEADER
+    yield from iter_gcode_layers(geometry, profile)
+    yield GCODE_FOOTER
+
+
+def write_gcode(geometry: Geometry, output_path: Path, profile: GcodeProfile) -> None:
+    with Path(output_path).open("w", encoding="utf-8", buffering=_WRITE_BUFFER) as f:
+        for chunk in iter_gcode(geometry, profile):
+            f.write(chunk)
+
+
+def emit_gcode(input_path: Path, output_path: Path, profile: GcodeProfile) -> None:
+    fitting = profile.arc_tolerance_mm > 0 or profile.line_tolerance_mm > 0
+    if GCODE_EMITTER == "vpype" and not fitting:
+        run_vpype_to_gcode(input_path, output_path, profile)
+        return
+    if is_geometry_file(input_path):
+        write_gcode(read_geometry(input_path), output_path, profile)
+        return
+    with tempfile.TemporaryDirectory(dir=output_path.parent) as tmp_dir:
+        geometry_path = Path(tmp_dir) / "input.vgeo"
+        run_vpype_to_geometry(input_path, geometry_path)
+        write_gcode(read_geometry(geometry_path), output_path, profile)
@@ -0,0 +1,432 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterable, Iterator
+import json
+import math
+import re
+import struct
+
+import numpy as np
+
+from services.motion_planner import estimate_plot_time
+
+CHUNK_BYTES = 8 * 1024 * 1024
+PREVIEW_MAGIC = b"VPRV"
+PREVIEW_VERSION = 1
+_PREVIEW_HEADER = struct.Struct("<4sHHII")
+_NUMBER_WIDTH = 16
+
+_NEWLINE = 10
+_SEMICOLON = 59
+_WHITESPACE = np.zeros(256, dtype=bool)
+_WHITESPACE[[9, 11, 12, 13, 32]] = True
+_NUMBER_CHARS = np.zeros(256, dtype=bool)
+_NUMBER_CHARS[list(b"0123456789+-.eE")] = True
+_AXIS_X = np.zeros(256, dtype=bool)
+_AXIS_X[list(b"Xx")] = True
+_AXIS_Y = np.zeros(256, dtype=bool)
+_AXIS_Y[list(b"Yy")] = True
+_AXIS_I = np.zeros(256, dtype=bool)
+_AXIS_I[list(b"Ii")] = True
+_AXIS_J = np.zeros(256, dtype=bool)
+_AXIS_J[list(b"Jj")] = True
+_AXIS_F = np.zeros(256, dtype=bool)
+_AXIS_F[list(b"Ff")] = True
+_AXIS_P = np.zeros(256, dtype=bool)
+_AXIS_P[list(b"Pp")] = True
+_LAYER_MARKER = re.compile(rb"\(Start Layer\)")
+# G2/G3 arcs are flattened into chords of about this length for previews
+_ARC_SEGMENT_MM = 0.25
+_ARC_MAX_SEGMENTS = 4096
+
+_EVENT_MOVE = -1
+_EVENT_PEN_UP = 0
+_EVENT_PEN_DOWN = 1
+_EVENT_DWELL = 2
+
+
+@dataclass
+class GcodeMoves:
+    x: np.ndarray = field(default_factory=lambda: np.empty(0, dtype=np.float64))
+    y: np.ndarray = field(default_factory=lambda: np.empty(0, dtype=np.float64))
+    pen: np.ndarray = field(default_factory=lambda: np.empty(0, dtype=bool))
+    distance: float = 0.0
+    pen_lifts: int = 0
+    # per-move motion details for time estimates: G0 vs feed moves, the modal F (NaN
+    # until one is set), whether the machine comes to rest before the move (pen change
+    # or dwell) and the "(Start Layer)" block it belongs to
+    rapid: np.ndarray = field(default_factory=lambda: np.empty(0, dtype=bool))
+    feed: np.ndarray = field(default_factory=lambda: np.empty(0, dtype=np.float64))
+    stop: np.ndarray = field(default_factory=lambda: np.empty(0, dtype=bool))
+    layer: np.ndarray = field(default_factory=lambda: np.empty(0, dtype=np.int32))
+    # summed G4 P values per layer, in the units the firmware reads them in
+    layer_dwell: np.ndarray = field(default_factory=lambda: np.empty(0, dtype=np.float64))
+
+    @property
+    def count(self) -> int:
+        return len(self.x)
+
+
+@dataclass
+class _ParserState:
+    x: float = 0.0
+    y: float = 0.0
+    pen_down: bool = False
+    distance: float = 0.0
+    pen_lifts: int = 0
+    feed: float = math.nan
+    stop: bool = True
+    layers: int = 0
+    layer_dwell: np.ndarray = field(default_factory=lambda: np.zeros(1))
+
+
+def _ffill(values: np.ndarray, present: np.ndarray, initial) -> np.ndarray:
+    idx = np.where(present, np.arange(len(values)), -1)
+    np.maximum.accumulate(idx, out=idx)
+    out = values[np.maximum(idx, 0)]
+    return np.where(idx >= 0, out, initial)
+
+
+def _parse_numbers(buf: np.ndarray, starts: np.ndarray, lengths: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    values = np.full(len(starts), np.nan)
+    ok = np.zeros(len(starts), dtype=bool)
+    # tokens too wide for a fixed window (high-precision output) take the scalar path
+    wide = np.flatnonzero(lengths >= _NUMBER_WIDTH)
+    idx = np.flatnonzero((lengths > 0) & (lengths < _NUMBER_WIDTH))
+    cols = np.arange(_NUMBER_WIDTH, dtype=np.int32)
+    windows = buf[np.minimum(starts[idx, None].astype(np.int32) + cols, len(buf) - 1)]
+    windows[cols >= lengths[idx, None]] = 0
+    simple = _NUMBER_CHARS[windows].sum(axis=1) == lengths[idx]
+    fast = idx[simple]
+    if len(fast):
+        strings = np.ascontiguousarray(windows[simple]).view(f"S{_NUMBER_WIDTH}").ravel()
+        try:
+            values[fast] = strings.astype(np.float64)
+            ok[fast] = True
+        except ValueError:
+            simple[:] = False
+    for k in np.concatenate((idx[~simple], wide)):
+        try:
+            values[k] = float(bytes(buf[starts[k]:starts[k] + lengths[k]]).decode())
+            ok[k] = True
+        except (ValueError, UnicodeDecodeError):
+            continue
+    return values, ok
+
+
+def _last_axis_values(values, ok, token_line, mask, line_count) -> np.ndarray:
+    out = np.full(line_count, np.nan)
+    keep = mask & ok
+    lines = token_line[keep]
+    values = values[keep]
+    if len(lines):
+        last = np.ones(len(lines), dtype=bool)
+        last[:-1] = lines[:-1] != lines[1:]
+        out[lines[last]] = values[last]
+    return out
+
+
+def _expand_arcs(x, y, prev_x, prev_y, arc_dir, i_off, j_off, columns, stop):
+    # columns are copied onto every chord; stop only applies to the first one
+    xs, ys, stops = [], [], []
+    parts = [[] for _ in columns]
+    stop = stop.copy()
+    last = 0
+    for k in np.flatnonzero(arc_dir).tolist():
+        sx, sy, ex, ey = prev_x[k], prev_y[k], x[k], y[k]
+        cx = sx + (0.0 if np.isnan(i_off[k]) else i_off[k])
+        cy = sy + (0.0 if np.isnan(j_off[k]) else j_off[k])
+        radius = math.hypot(sx - cx, sy - cy)
+        start = math.atan2(sy - cy, sx - cx)
+        sweep = math.atan2(ey - cy, ex - cx) - start
+        if arc_dir[k] > 0 and sweep <= 0:
+            sweep += 2 * math.pi
+        elif arc_dir[k] < 0 and sweep >= 0:
+            sweep -= 2 * math.pi
+        steps = min(_ARC_MAX_SEGMENTS, max(1, math.ceil(abs(sweep) * radius / _ARC_SEGMENT_MM)))
+        angles = start + sweep * np.arange(1, steps) / steps
+        xs += [x[last:k], cx + radius * np.cos(angles)]
+        ys += [y[last:k], cy + radius * np.sin(angles)]
+        for part, column in zip(parts, columns):
+            part += [column[last:k], np.full(steps - 1, column[k], dtype=column.dtype)]
+        chords = np.zeros(steps - 1, dtype=bool)
+        if steps > 1:
+            chords[0], stop[k] = stop[k], False
+        stops += [stop[last:k], chords]
+        last = k
+    xs.append(x[last:])
+    ys.append(y[last:])
+    stops.append(stop[last:])
+    for part, column in zip(parts, columns):
+        part.append(column[last:])
+    return (
+        np.concatenate(xs),
+        np.concatenate(ys),
+        [np.concatenate(part) for part in parts],
+        np.concatenate(stops)
+    )
+
+
+def _line_layers(chunk: bytes, newlines: np.ndarray, state: _ParserState) -> np.ndarray:
+    markers = [m.start() for m in _LAYER_MARKER.finditer(chunk)]
+    if not markers:
+        return np.full(len(newlines), max(state.layers - 1, 0), dtype=np.int32)
+    seen = np.cumsum(np.bincount(np.searchsorted(newlines, markers), minlength=len(newlines)))
+    layers = np.maximum(state.layers + seen - 1, 0).astype(np.int32)
+    state.layers += len(markers)
+    return layers
+
+
+def _parse_chunk(chunk: bytes, state: _ParserState) -> GcodeMoves:
+    buf = np.frombuffer(chunk + b"\0" * 4, dtype=np.uint8)
+    size = len(chunk)
+    newlines = np.flatnonzero(buf[:size] == _NEWLINE)
+    line_count = len(newlines)
+    if not line_count:
+        return GcodeMoves()
+    line_starts = np.concatenate(([0], newlines[:-1] + 1))
+    line_ends = newlines.copy()
+
+    semis = np.flatnonzero(buf[:size] == _SEMICOLON)
+    if len(semis):
+        semi_lines = np.searchsorted(newlines, semis)
+        first = np.ones(len(semis), dtype=bool)
+        first[1:] = semi_lines[1:] != semi_lines[:-1]
+        line_ends[semi_lines[first]] = semis[first]
+
+    is_ws = _WHITESPACE[buf]
+    solid = np.flatnonzero(~is_ws[:size] & (buf[:size] != _NEWLINE))
+    if not len(solid):
+        return GcodeMoves()
+    first_idx = np.searchsorted(solid, line_starts)
+    has_token = first_idx < len(solid)
+    cmd = np.where(has_token, solid[np.minimum(first_idx, len(solid) - 1)], size)
+    has_token &= cmd < line_ends
+
+    c0 = buf[cmd] | 0x20
+    c1, c2 = buf[cmd + 1], buf[cmd + 2]
+
+    def _token_ends_at(pos):
+        return (pos >= line_ends) | is_ws[np.minimum(pos, size)]
+
+    short = _token_ends_at(cmd + 2)
+    long = (c1 == ord("0")) & _token_ends_at(cmd + 3)
+    digit = np.where(short, c1, np.where(long, c2, 0))
+    valid_len = has_token & (short | long) & (cmd + 1 < line_ends)
+    is_move = valid_len & (c0 == ord("g")) & (digit >= ord("0")) & (digit <= ord("3"))
+    arc_dir = np.where(is_move & (digit == ord("3")), 1, np.where(is_move & (digit == ord("2")), -1, 0))
+    is_down = valid_len & (c0 == ord("m")) & (digit == ord("3"))
+    is_up = valid_len & (c0 == ord("m")) & (digit == ord("5"))
+    is_dwell = valid_len & (c0 == ord("g")) & (digit == ord("4"))
+
+    line_layer = _line_layers(chunk, newlines, state)
+    relevant = np.flatnonzero(is_move | is_down | is_up | is_dwell)
+    if not len(relevant):
+        return GcodeMoves()
+    events = np.full(len(relevant), _EVENT_MOVE, dtype=np.int8)
+    events[is_down[relevant]] = _EVENT_PEN_DOWN
+    events[is_up[relevant]] = _EVENT_PEN_UP
+    events[is_dwell[relevant]] = _EVENT_DWELL
+
+    pen_events = (events == _EVENT_PEN_DOWN) | (events == _EVENT_PEN_UP)
+    pen_after = _ffill(events == _EVENT_PEN_DOWN, pen_events, state.pen_down)
+    pen_before = np.concatenate(([state.pen_down], pen_after[:-1]))
+    lifts = int(np.count_nonzero((events == _EVENT_PEN_UP) & pen_before))
+    # any pen change or dwell empties the planner queue, so the next move starts at rest
+    moving = events == _EVENT_MOVE
+    after_stop = np.concatenate(([state.stop], ~moving[:-1]))
+
+    move_lines = relevant[moving]
+    move_pen = pen_before[moving]
+    move_stop = after_stop[moving]
+    dwell_lines = relevant[events == _EVENT_DWELL]
+    state.pen_down = bool(pen_after[-1])
+    state.pen_lifts += lifts
+
+    move_arc = arc_dir[move_lines]
+    has_arcs = bool(move_arc.any())
+    axis_mask = _AXIS_X[buf[:size]] | _AXIS_Y[buf[:size]] | _AXIS_F[buf[:size]]
+    if has_arcs:
+        axis_mask |= _AXIS_I[buf[:size]] | _AXIS_J[buf[:size]]
+    if len(dwell_lines):
+        axis_mask |= _AXIS_P[buf[:size]]
+    axis = np.flatnonzero(axis_mask)
+    axis = axis[(axis > 0)]
+    axis = axis[is_ws[axis - 1]]
+    token_line = np.searchsorted(newlines, axis)
+    keep = (is_move | is_dwell)[token_line] & (axis < line_ends[token_line]) & (axis > cmd[token_line])
+    axis, token_line = axis[keep], token_line[keep]
+
+    terminators = np.flatnonzero(is_ws[:size] | (buf[:size] == _NEWLINE) | (buf[:size] == _SEMICOLON))
+    number_end = terminators[np.searchsorted(terminators, axis)]
+
+    letters = buf[axis]
+    values, ok = _parse_numbers(buf, axis + 1, number_end - axis - 1)
+    if len(dwell_lines):
+        dwell_index = np.full(line_count, -1, dtype=np.int64)
+        dwell_index[dwell_lines] = np.arange(len(dwell_lines))
+        token_dwell = dwell_index[token_line]
+        p_tokens = _last_axis_values(values, ok, token_dwell, _AXIS_P[letters] & (token_dwell >= 0), len(dwell_lines))
+        dwell = np.bincount(line_layer[dwell_lines], weights=np.nan_to_num(p_tokens))
+        if len(dwell) > len(state.layer_dwell):
+            state.layer_dwell = np.concatenate((state.layer_dwell, np.zeros(len(dwell) - len(state.layer_dwell))))
+        state.layer_dwell[:len(dwell)] += dwell
+    if not len(move_lines):
+        state.stop = True
+        return GcodeMoves(pen_lifts=lifts)
+
+    move_index = np.full(line_count, -1, dtype=np.int64)
+    move_index[move_lines] = np.arange(len(move_lines))
+    token_move = move_index[token_line]
+    on_move = token_move >= 0
+    x_tokens = _last_axis_values(values, ok, token_move, _AXIS_X[letters] & on_move, len(move_lines))
+    y_tokens = _last_axis_values(values, ok, token_move, _AXIS_Y[letters] & on_move, len(move_lines))
+    f_tokens = _last_axis_values(values, ok, token_move, _AXIS_F[letters] & on_move, len(move_lines))
+
+    x = _ffill(x_tokens, ~np.isnan(x_tokens), state.x)
+    y = _ffill(y_tokens, ~np.isnan(y_tokens), state.y)
+    feed = _ffill(f_tokens, ~np.isnan(f_tokens), state.feed)
+    rapid = digit[move_lines] == ord("0")
+    layer = line_layer[move_lines]
+    prev_x = np.concatenate(([state.x], x[:-1]))
+    prev_y = np.concatenate(([state.y], y[:-1]))
+    if has_arcs:
+        i_tokens = _last_axis_values(values, ok, token_move, _AXIS_I[letters] & on_move, len(move_lines))
+        j_tokens = _last_axis_values(values, ok, token_move, _AXIS_J[letters] & on_move, len(move_lines))
+        x, y, (move_pen, feed, rapid, layer), move_stop = _expand_arcs(
+            x, y, prev_x, prev_y, move_arc, i_tokens, j_tokens, (move_pen, feed, rapid, layer), move_stop
+        )
+        prev_x = np.concatenate(([state.x], x[:-1]))
+        prev_y = np.concatenate(([state.y], y[:-1]))
+    changed = (x != prev_x) | (y != prev_y)
+    kept = np.flatnonzero(changed)
+
+    # moves that go nowhere are dropped, but a stop before them still holds for the next one
+    if len(kept):
+        starts = np.concatenate(([0], kept[:-1] + 1))
+        kept_stop = np.logical_or.reduceat(move_stop[:kept[-1] + 1], starts)
+        trailing = move_stop[kept[-1] + 1:]
+    else:
+        kept_stop = np.empty(0, dtype=bool)
+        trailing = move_stop
+    state.stop = bool(not moving[-1] or trailing.any())
+
+    dx = x[kept] - prev_x[kept]
+    dy = y[kept] - prev_y[kept]
+    steps = np.sqrt(dx * dx + dy * dy)
+    if len(steps):
+        state.distance = float(np.add.accumulate(np.concatenate(([state.distance], steps)))[-1])
+    state.x = float(x[-1])
+    state.y = float(y[-1])
+    state.feed = float(feed[-1])
+    return GcodeMoves(
+        x=x[kept],
+        y=y[kept],
+        pen=move_pen[kept],
+        pen_lifts=lifts,
+        rapid=rapid[kept],
+        feed=feed[kept],
+        stop=kept_stop,
+        layer=layer[kept]
+    )
+
+
+def _iter_chunks(blocks: Iterable[bytes]) -> Iterator[bytes]:
+    carry = b""
+    for block in blocks:
+        data = carry + block
+        if b"\r" in data:
+            data = data.replace(b"\r\n", b"\n").replace(b"\r", b"\n")
+        cut = data.rfind(b"\n") + 1
+        carry = data[cut:]
+        if cut:
+            yield data[:cut]
+    if carry:
+        yield carry + b"\n"
+
+
+def _parse_blocks(blocks: Iterable[bytes]) -> GcodeMoves:
+    state = _ParserState()
+    parts = [_parse_chunk(chunk, state) for chunk in _iter_chunks(blocks)]
+    parts = [p for p in parts if p.count]
+    layer_dwell = np.concatenate((state.layer_dwell, np.zeros(max(state.layers - len(state.layer_dwell), 0))))
+    if not parts:
+        return GcodeMoves(distance=state.distance, pen_lifts=state.pen_lifts, layer_dwell=layer_dwell)
+    return GcodeMoves(
+        x=np.concatenate([p.x for p in parts]),
+        y=np.concatenate([p.y for p in parts]),
+        pen=np.concatenate([p.pen for p in parts]),
+        distance=state.distance,
+        pen_lifts=state.pen_lifts,
+        rapid=np.concatenate([p.rapid for p in parts]),
+        feed=np.concatenate([p.feed for p in parts]),
+        stop=np.concatenate([p.stop for p in parts]),
+        layer=np.concatenate([p.layer for p in parts]),
+        layer_dwell=layer_dwell
+    )
+
+
+def parse_gcode_moves(gcode: bytes | str) -> GcodeMoves:
+    data = gcode.encode() if isinstance(gcode, str) else gcode
+    return _parse_blocks(data[i:i + CHUNK_BYTES] for i in range(0, len(data), CHUNK_BYTES))
+
+
+def parse_gcode_file(path: Path) -> GcodeMoves:
+    def blocks():
+        with Path(path).open("rb") as f:
+            for block in iter(lambda: f.read(CHUNK_BYTES), b""):
+                yield block
+    return _parse_blocks(blocks())
+
+
+def preview_meta(moves: GcodeMoves) -> dict:
+    estimate = estimate_plot_time(moves)
+    return {
+        "estimated_time_s": round(estimate.total_s, 1),
+        "distance_mm": round(moves.distance, 2),
+        "pen_lifts": max(0, moves.pen_lifts - 1),
+        "draw_time_s": round(estimate.draw_s, 1),
+        "travel_time_s": round(estimate.travel_s, 1),
+        "dwell_time_s": round(estimate.dwell_s, 1),
+        "layer_times_s": [round(t, 1) for t in estimate.layer_s]
+    }
+
+
+def encode_preview(moves: GcodeMoves, meta: dict) -> bytes:
+    meta_bytes = json.dumps(meta, separators=(",", ":")).encode()
+    meta_bytes += b" " * (-len(meta_bytes) % 4)
+    header = _PREVIEW_HEADER.pack(PREVIEW_MAGIC, PREVIEW_VERSION, 0, moves.count, len(meta_bytes))
+    return b"".join([
+        header,
+        meta_bytes,
+        moves.x.astype("<f4").tobytes(),
+        moves.y.astype("<f4").tobytes(),
+        np.packbits(moves.pen, bitorder="little").tobytes()
+    ])
+
+
+def _preview_header(data: bytes) -> tuple[int, int]:
+    magic, version, _, count, meta_len = _PREVIEW_HEADER.unpack_from(data, 0)
+    if magic != PREVIEW_MAGIC or version != PREVIEW_VERSION:
+        raise ValueError("Not a Vectra preview buffer")
+    return count, meta_len
+
+
+def decode_preview_meta(data: bytes) -> dict:
+    _, meta_len = _preview_header(data)
+    return json.loads(data[_PREVIEW_HEADER.size:_PREVIEW_HEADER.size + meta_len])
+
+
+def decode_preview(data: bytes) -> tuple[GcodeMoves, dict]:
+    count, meta_len = _preview_header(data)
+    meta = decode_preview_meta(data)
+    offset = _PREVIEW_HEADER.size + meta_len
+    x = np.frombuffer(data, dtype="<f4", count=count, offset=offset)
+    offset += 4 * count
+    y = np.frombuffer(data, dtype="<f4", count=count, offset=offset)
+    offset += 4 * count
+    bits = np.frombuffer(data, dtype=np.uint8, count=(count + 7) // 8, offset=offset)
+    pen = np.unpackbits(bits, count=count, bitorder="little").astype(bool)
+    return GcodeMoves(x=x.astype(np.float64), y=y.astype(np.float64), pen=pen), meta
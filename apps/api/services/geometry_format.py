@@ -0,0 +1,232 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from pathlib import Path
+import json
+import re
+import struct
+
+import numpy as np
+
+from services.svg_geometry import Polyline, SvgDocument
+
+GEOMETRY_SUFFIX = ".vgeo"
+GEOMETRY_MAGIC = b"VGEO"
+GEOMETRY_VERSION = 1
+_HEADER = struct.Struct("<4sHHQQI")
+# CSS px per unit, as vpype converts page sizes
+_PX_PER_UNIT = {"": 1.0, "px": 1.0, "in": 96.0, "mm": 96.0 / 25.4, "cm": 96.0 / 2.54, "pt": 96.0 / 72.0, "pc": 16.0}
+_LENGTH_RE = re.compile(r"\s*([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)\s*([a-z]*)\s*")
+
+
+@dataclass
+class Geometry:
+    coords: np.ndarray = field(default_factory=lambda: np.empty((0, 2), dtype=np.float64))
+    offsets: np.ndarray = field(default_factory=lambda: np.zeros(1, dtype=np.int64))
+    layer_ids: np.ndarray = field(default_factory=lambda: np.empty(0, dtype=np.int32))
+    color_ids: np.ndarray = field(default_factory=lambda: np.empty(0, dtype=np.int32))
+    layers: list[str] = field(default_factory=list)
+    colors: list[str | None] = field(default_factory=list)
+    meta: dict = field(default_factory=dict)
+
+    @property
+    def path_count(self) -> int:
+        return len(self.offsets) - 1
+
+    @property
+    def vertex_count(self) -> int:
+        return len(self.coords)
+
+    def path(self, index: int) -> np.ndarray:
+        return self.coords[self.offsets[index]:self.offsets[index + 1]]
+
+
+def is_geometry_file(path: Path) -> bool:
+    return Path(path).suffix == GEOMETRY_SUFFIX
+
+
+def _table_index(table: list, index: dict, value) -> int:
+    if value not in index:
+        index[value] = len(table)
+        table.append(value)
+    return index[value]
+
+
+def build_geometry(paths: list[tuple[np.ndarray, str, str | None]], meta: dict | None = None) -> Geometry:
+    layers: list[str] = []
+    colors: list[str | None] = []
+    layer_index: dict[str, int] = {}
+    color_index: dict[str | None, int] = {}
+    kept = [(points, layer, color) for points, layer, color in paths if len(points)]
+    counts = np.fromiter((len(points) for points, _, _ in kept), dtype=np.int64, count=len(kept))
+    offsets = np.zeros(len(kept) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    coords = (
+        np.concatenate([np.asarray(points, dtype=np.float64).reshape(-1, 2) for points, _, _ in kept])
+        if kept else np.empty((0, 2), dtype=np.float64)
+    )
+    return Geometry(
+        coords=coords,
+        offsets=offsets,
+        layer_ids=np.array([_table_index(layers, layer_index, layer) for _, layer, _ in kept], dtype=np.int32),
+        color_ids=np.array([_table_index(colors, color_index, color) for _, _, color in kept], dtype=np.int32),
+        layers=layers,
+        colors=colors,
+        meta=dict(meta or {})
+    )
+
+
+def _length_px(value: str | None) -> str | None:
+    # page sizes are kept as plain px numbers, the same as geometry_from_vpype stores them
+    match = _LENGTH_RE.fullmatch(value or "")
+    if match is None or match.group(2) not in _PX_PER_UNIT:
+        return None
+    return f"{float(match.group(1)) * _PX_PER_UNIT[match.group(2)]}"
+
+
+def geometry_from_document(doc: SvgDocument) -> Geometry:
+    return build_geometry(
+        [(p.points, p.layer, p.color) for p in doc.paths],
+        {"width": _length_px(doc.width), "height": _length_px(doc.height), "view_box": doc.view_box}
+    )
+
+
+def geometry_to_document(geometry: Geometry) -> SvgDocument:
+    layer_ids = geometry.layer_ids.tolist()
+    color_ids = geometry.color_ids.tolist()
+    offsets = geometry.offsets.tolist()
+    paths = [
+        Polyline(np.asarray(geometry.coords[offsets[i]:offsets[i + 1]]), geometry.layers[layer_ids[i]], geometry.colors[color_ids[i]])
+        for i in range(geometry.path_count)
+    ]
+    return SvgDocument(
+        paths=paths,
+        width=geometry.meta.get("width"),
+        height=geometry.meta.get("height"),
+        view_box=geometry.meta.get("view_box")
+    )
+
+
+def write_geometry(path: Path, geometry: Geometry) -> None:
+    meta = json.dumps(
+        {"layers": geometry.layers, "colors": geometry.colors, "meta": geometry.meta},
+        separators=(",", ":")
+    ).encode()
+    meta += b" " * (-(_HEADER.size + len(meta)) % 8)
+    with Path(path).open("wb") as f:
+        f.write(_HEADER.pack(GEOMETRY_MAGIC, GEOMETRY_VERSION, 0, geometry.vertex_count, geometry.path_count, len(meta)))
+        f.write(meta)
+        f.write(np.ascontiguousarray(geometry.coords, dtype="<f8").tobytes())
+        f.write(np.ascontiguousarray(geometry.offsets, dtype="<i8").tobytes())
+        f.write(np.ascontiguousarray(geometry.layer_ids, dtype="<i4").tobytes())
+        f.write(np.ascontiguousarray(geometry.color_ids, dtype="<i4").tobytes())
+
+
+def read_geometry(path: Path, mmap: bool = True) -> Geometry:
+    path = Path(path)
+    with path.open("rb") as f:
+        magic, version, _, vertex_count, path_count, meta_len = _HEADER.unpack(f.read(_HEADER.size))
+        if magic != GEOMETRY_MAGIC or version != GEOMETRY_VERSION:
+            raise ValueError(f"{path.name} is not a Vectra geometry file")
+        meta = json.loads(f.read(meta_len))
+        if not mmap:
+            data = f.read()
+
+    offset = _HEADER.size + meta_len
+
+    def array(dtype: str, count: int, shape=None):
+        nonlocal offset
+        start = offset
+        offset += np.dtype(dtype).itemsize * count
+        if count == 0:
+            values = np.empty(0, dtype=dtype)
+        elif mmap:
+            values = np.memmap(path, dtype=dtype, mode="r", offset=start, shape=(count,))
+        else:
+            values = np.frombuffer(data, dtype=dtype, count=count, offset=start - _HEADER.size - meta_len)
+        return values.reshape(shape) if shape is not None else values
+
+    return Geometry(
+        coords=array("<f8", vertex_count * 2, (vertex_count, 2)),
+        offsets=array("<i8", path_count + 1),
+        layer_ids=array("<i4", path_count),
+        color_ids=array("<i4", path_count),
+        layers=meta["layers"],
+        colors=meta["colors"],
+        meta=meta["meta"]
+    )
+
+
+def geometry_from_vpype(document) -> Geometry:
+    # vpype keeps each line as a complex128 array; viewed as float64 pairs they become
+    # coordinate rows without a per-vertex copy
+    lines = []
+    layer_ids = []
+    color_ids = []
+    layers: list[str] = []
+    colors: list[str | None] = []
+    layer_meta = []
+    # keep vpype's layer order, which is the order gwrite emits them in
+    for layer_id, collection in document.layers.items():
+        if not len(collection):
+            continue
+        color = collection.property("vp_color")
+        layers.append(collection.property("vp_name") or str(layer_id))
+        colors.append(color.as_hex() if color is not None else None)
+        layer_meta.append({"id": layer_id, "pen_width": collection.property("vp_pen_width")})
+        lines.extend(collection.lines)
+        layer_ids.append(np.full(len(collection), len(layers) - 1, dtype=np.int32))
+        color_ids.append(np.full(len(collection), len(colors) - 1, dtype=np.int32))
+
+    counts = np.fromiter((len(line) for line in lines), dtype=np.int64, count=len(lines))
+    offsets = np.zeros(len(lines) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    coords = (
+        np.concatenate(lines).astype(np.complex128, copy=False).view(np.float64).reshape(-1, 2)
+        if lines else np.empty((0, 2), dtype=np.float64)
+    )
+    width, height = document.page_size or (None, None)
+    meta = {"vpype_layers": layer_meta}
+    if width is not None:
+        meta.update(width=f"{width}", height=f"{height}", view_box=f"0 0 {width} {height}")
+    return Geometry(
+        coords=coords,
+        offsets=offsets,
+        layer_ids=np.concatenate(layer_ids) if layer_ids else np.empty(0, dtype=np.int32),
+        color_ids=np.concatenate(color_ids) if color_ids else np.empty(0, dtype=np.int32),
+        layers=layers,
+        colors=colors,
+        meta=meta
+    )
+
+
+def geometry_to_vpype(geometry: Geometry):
+    import vpype as vp
+
+    document = vp.Document()
+    points = np.ascontiguousarray(geometry.coords, dtype=np.float64).view(np.complex128).reshape(-1)
+    offsets = geometry.offsets.tolist()
+    layer_ids = np.asarray(geometry.layer_ids)
+    layer_meta = geometry.meta.get("vpype_layers") or []
+    for index, name in enumerate(geometry.layers):
+        selected = np.flatnonzero(layer_ids == index).tolist()
+        if not selected:
+            continue
+        info = layer_meta[index] if index < len(layer_meta) else {}
+        layer_id = info.get("id", index + 1)
+        collection = vp.LineCollection([points[offsets[i]:offsets[i + 1]] for i in selected])
+        if name != str(layer_id):
+            collection.set_property("vp_name", name)
+        color = geometry.colors[int(geometry.color_ids[selected[0]])] if geometry.colors else None
+        if color is not None:
+            collection.set_property("vp_color", vp.Color(color))
+        if info.get("pen_width") is not None:
+            collection.set_property("vp_pen_width", info["pen_width"])
+        document.add(collection, layer_id, with_metadata=True)
+    width, height = geometry.meta.get("width"), geometry.meta.get("height")
+    if width is not None and height is not None:
+        try:
+            document.page_size = (float(width), float(height))
+        except ValueError:
+            pass
+    return document
@@ -0,0 +1,155 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+
+from services.geometry_format import GEOMETRY_SUFFIX, Geometry, read_geometry, write_geometry
+from services.stage_cache import run_cached_stage
+
+# geometry coordinates are CSS pixels, as vpype stores them
+PX_PER_MM = 96.0 / 25.4
+_COLLINEAR_EPSILON_MM = 1e-6
+
+
+@dataclass
+class SimplifyOptions:
+    tolerance_mm: float = 0.0
+    merge_collinear: bool = False
+    min_size_mm: float = 0.0
+
+    @property
+    def is_noop(self) -> bool:
+        return self.tolerance_mm <= 0 and not self.merge_collinear and self.min_size_mm <= 0
+
+
+def _ranges(starts: np.ndarray, ends: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # flattened interior indices of each [start, end] range, with the range each belongs to
+    counts = ends - starts - 1
+    owner = np.repeat(np.arange(len(starts)), counts)
+    first = np.cumsum(counts) - counts
+    index = np.arange(int(counts.sum())) - np.repeat(first, counts) + np.repeat(starts + 1, counts)
+    return index, owner, first
+
+
+def _segment_distance(points: np.ndarray, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    ab = b - a
+    length2 = (ab * ab).sum(axis=1)
+    t = np.clip(((points - a) * ab).sum(axis=1) / np.where(length2 > 0, length2, 1.0), 0.0, 1.0)
+    closest = a + t[:, None] * ab
+    return np.hypot(*(points - closest).T)
+
+
+def douglas_peucker_mask(coords: np.ndarray, offsets: np.ndarray, tolerance: float) -> np.ndarray:
+    # every path is split breadth-first at once, so each round is a handful of array ops
+    # regardless of how many paths there are
+    keep = np.zeros(len(coords), dtype=bool)
+    starts, ends = offsets[:-1], offsets[1:] - 1
+    keep[starts] = True
+    keep[ends] = True
+    open_ = ends - starts > 1
+    starts, ends = starts[open_], ends[open_]
+    while len(starts):
+        index, owner, first = _ranges(starts, ends)
+        distance = _segment_distance(coords[index], coords[starts][owner], coords[ends][owner])
+        peak = np.maximum.reduceat(distance, first)
+        is_peak = distance == peak[owner]
+        peak_pos = np.flatnonzero(is_peak)
+        peak_owner = owner[peak_pos]
+        first_peak = np.ones(len(peak_pos), dtype=bool)
+        first_peak[1:] = peak_owner[1:] != peak_owner[:-1]
+        pivot = index[peak_pos[first_peak]]
+        split = peak > tolerance
+        pivot = pivot[split]
+        keep[pivot] = True
+        starts = np.concatenate([starts[split], pivot])
+        ends = np.concatenate([pivot, ends[split]])
+        open_ = ends - starts > 1
+        starts, ends = starts[open_], ends[open_]
+    return keep
+
+
+def _straight_mask(coords: np.ndarray, offsets: np.ndarray, epsilon: float) -> np.ndarray:
+    keep = np.ones(len(coords), dtype=bool)
+    interior = np.ones(len(coords), dtype=bool)
+    interior[offsets[:-1]] = False
+    interior[offsets[1:] - 1] = False
+    index = np.flatnonzero(interior)
+    prev, point, after = coords[index - 1], coords[index], coords[index + 1]
+    incoming, outgoing, chord = point - prev, after - point, after - prev
+    length = np.hypot(chord[:, 0], chord[:, 1])
+    cross = np.abs(chord[:, 0] * incoming[:, 1] - chord[:, 1] * incoming[:, 0])
+    keep[index[(cross <= epsilon * length) & ((incoming * outgoing).sum(axis=1) > 0)]] = False
+    return keep
+
+
+def collinear_mask(coords: np.ndarray, offsets: np.ndarray, epsilon: float) -> np.ndarray:
+    # repeated vertices go first so they cannot hide a straight run from the turn test
+    keep = np.ones(len(coords), dtype=bool)
+    keep[1:] = (coords[1:] != coords[:-1]).any(axis=1)
+    keep[offsets[:-1]] = True
+    unique = np.flatnonzero(keep)
+    path_of_vertex = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+    counts = np.bincount(path_of_vertex[unique], minlength=len(offsets) - 1)
+    keep[unique] = _straight_mask(coords[unique], np.concatenate(([0], np.cumsum(counts))), epsilon)
+    return keep
+
+
+def _path_extent(coords: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+    starts = offsets[:-1]
+    span = np.maximum.reduceat(coords, starts, axis=0) - np.minimum.reduceat(coords, starts, axis=0)
+    return span.max(axis=1)
+
+
+def _compact(coords: np.ndarray, offsets: np.ndarray, keep: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    path_of_vertex = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+    counts = np.bincount(path_of_vertex[keep], minlength=len(offsets) - 1)
+    return coords[keep], np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+
+
+def simplify_geometry(geometry: Geometry, options: SimplifyOptions) -> Geometry:
+    coords = np.asarray(geometry.coords, dtype=np.float64)
+    offsets = np.asarray(geometry.offsets, dtype=np.int64)
+    layer_ids = np.asarray(geometry.layer_ids)
+    color_ids = np.asarray(geometry.color_ids)
+    if geometry.path_count == 0:
+        return geometry
+
+    if options.min_size_mm > 0:
+        # paths smaller than the pen would only leave a dot
+        kept_paths = _path_extent(coords, offsets) >= options.min_size_mm * PX_PER_MM
+        coords, offsets = _compact(coords, offsets, np.repeat(kept_paths, np.diff(offsets)))
+        offsets = np.concatenate(([0], offsets[1:][kept_paths]))
+        layer_ids, color_ids = layer_ids[kept_paths], color_ids[kept_paths]
+
+    if len(coords) and options.tolerance_mm > 0:
+        coords, offsets = _compact(coords, offsets, douglas_peucker_mask(coords, offsets, options.tolerance_mm * PX_PER_MM))
+    if len(coords) and options.merge_collinear:
+        coords, offsets = _compact(coords, offsets, collinear_mask(coords, offsets, _COLLINEAR_EPSILON_MM * PX_PER_MM))
+
+    return Geometry(
+        coords=coords,
+        offsets=offsets,
+        layer_ids=layer_ids,
+        color_ids=color_ids,
+        layers=geometry.layers,
+        colors=geometry.colors,
+        meta=geometry.meta
+    )
+
+
+def run_simplify_stage(input_path: Path, options: SimplifyOptions) -> tuple[Path, bool | None]:
+    if options.is_noop:
+        return input_path, None
+    return run_cached_stage(
+        "simplify",
+        input_path,
+        options,
+        GEOMETRY_SUFFIX,
+        lambda out: write_geometry(out, simplify_geometry(read_geometry(input_path), options))
+    )
+
+
+def vertex_count(path: Path) -> int:
+    return read_geometry(path).vertex_count
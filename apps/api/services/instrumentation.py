@@ -0,0 +1,146 @@
+from __future__ import annotations
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass
+from functools import wraps
+from pathlib import Path
+from threading import Lock
+from typing import Any, Callable, Iterator
+import os
+import resource
+import subprocess
+import sys
+import time
+
+# ru_maxrss is KiB on Linux and bytes on macOS
+_RSS_UNIT = 1 if sys.platform == "darwin" else 1024
+_usage_lock = Lock()
+
+
+@dataclass
+class StageTiming:
+    calls: int = 0
+    wall_s: float = 0.0
+    cpu_s: float = 0.0
+    child_cpu_s: float = 0.0
+    child_peak_rss_bytes: int = 0
+
+
+class _OpenSpan:
+    def __init__(self):
+        self.child_cpu_s = 0.0
+        self.child_peak_rss_bytes = 0
+
+
+class StageRecorder:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self._timings: dict[str, StageTiming] = {}
+        self._lock = Lock()
+
+    def add(self, name: str, wall_s: float, cpu_s: float, span: _OpenSpan) -> None:
+        with self._lock:
+            timing = self._timings.setdefault(name, StageTiming())
+            timing.calls += 1
+            timing.wall_s += wall_s
+            timing.cpu_s += cpu_s
+            timing.child_cpu_s += span.child_cpu_s
+            timing.child_peak_rss_bytes = max(timing.child_peak_rss_bytes, span.child_peak_rss_bytes)
+
+    @property
+    def elapsed_s(self) -> float:
+        return time.perf_counter() - self.started
+
+    def as_dict(self) -> dict[str, dict[str, Any]]:
+        with self._lock:
+            return {
+                name: {key: round(value, 4) if isinstance(value, float) else value for key, value in asdict(timing).items()}
+                for name, timing in self._timings.items()
+            }
+
+
+_recorder: ContextVar[StageRecorder | None] = ContextVar("stage_recorder", default=None)
+_open_spans: ContextVar[tuple[_OpenSpan, ...]] = ContextVar("open_spans", default=())
+
+
+@contextmanager
+def recording(recorder: StageRecorder | None = None) -> Iterator[StageRecorder]:
+    recorder = recorder or StageRecorder()
+    token = _recorder.set(recorder)
+    try:
+        yield recorder
+    finally:
+        _recorder.reset(token)
+
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    # wall time plus this thread's CPU time; child processes and pool workers started
+    # inside report their own usage through record_child_usage
+    recorder = _recorder.get()
+    if recorder is None:
+        yield
+        return
+    current = _OpenSpan()
+    token = _open_spans.set(_open_spans.get() + (current,))
+    wall, cpu = time.perf_counter(), time.thread_time()
+    try:
+        yield
+    finally:
+        _open_spans.reset(token)
+        recorder.add(name, time.perf_counter() - wall, time.thread_time() - cpu, current)
+
+
+def traced(name: str) -> Callable:
+    def decorate(fn: Callable) -> Callable:
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _recorder.get() is None:
+                return fn(*args, **kwargs)
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def record_child_usage(cpu_s: float, peak_rss_bytes: int) -> None:
+    with _usage_lock:
+        for open_span in _open_spans.get():
+            open_span.child_cpu_s += cpu_s
+            open_span.child_peak_rss_bytes = max(open_span.child_peak_rss_bytes, peak_rss_bytes)
+
+
+def peak_rss_bytes() -> int:
+    # VmHWM is reset by exec, unlike ru_maxrss which a forked child inherits
+    try:
+        for line in Path("/proc/self/status").read_text().splitlines():
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * _RSS_UNIT
+
+
+def process_cpu_s() -> float:
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def run_process(cmd: list[str]) -> None:
+    # subprocess.run(check=True), but reaped with wait4 so the rusage of this one child is
+    # known even while other jobs run tools concurrently
+    if not hasattr(os, "wait4"):
+        subprocess.run(cmd, check=True)
+        return
+    process = subprocess.Popen(cmd)
+    try:
+        _, status, usage = os.wait4(process.pid, 0)
+    except BaseException:
+        process.kill()
+        process.wait()
+        raise
+    process.returncode = os.waitstatus_to_exitcode(status)
+    record_child_usage(usage.ru_utime + usage.ru_stime, usage.ru_maxrss * _RSS_UNIT)
+    if process.returncode:
+        raise subprocess.CalledProcessError(process.returncode, cmd)
@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from threading import Lock
+from typing import Any, Callable
+import asyncio
+import json
+
+from services.job_store import FINISHED_STATUSES
+
+
+@dataclass
+class JobEvent:
+    event_id: int
+    data: str
+    finished: bool
+
+    def encode(self) -> str:
+        return f"id: {self.event_id}\nevent: job\ndata: {self.data}\n\n"
+
+
+@dataclass
+class _Channel:
+    seq: int = 0
+    latest: JobEvent | None = None
+    subscribers: set[tuple[asyncio.AbstractEventLoop, asyncio.Queue]] = field(default_factory=set)
+
+
+def job_event(seq: int, job: dict[str, Any]) -> JobEvent:
+    return JobEvent(seq, json.dumps(job, separators=(",", ":")), job["status"] in FINISHED_STATUSES)
+
+
+class JobEventHub:
+    def __init__(self):
+        self._channels: dict[str, _Channel] = {}
+        self._lock = Lock()
+
+    def publish(self, job_id: str, finished: bool, load: Callable[[], dict[str, Any] | None]) -> None:
+        with self._lock:
+            channel = self._channels.get(job_id)
+            if channel is None:
+                return
+            channel.seq += 1
+            channel.latest = None
+            seq = channel.seq
+            if finished:
+                del self._channels[job_id]
+            if not channel.subscribers:
+                return
+        # the store read stays outside the hub lock so it never stalls other jobs' events
+        job = load()
+        if job is None:
+            return
+        event = job_event(seq, job)
+        with self._lock:
+            # a newer publish is on its way with fresher state
+            if channel.seq != seq:
+                return
+            # serialize once and hand the same event to every listener of this job
+            channel.latest = event
+            for loop, queue in channel.subscribers:
+                try:
+                    loop.call_soon_threadsafe(queue.put_nowait, event)
+                except RuntimeError:
+                    continue
+
+    def _attach(self, job_id: str, channel: _Channel, last_event_id: int | None) -> tuple[asyncio.Queue | None, JobEvent | None]:
+        current = channel.latest
+        if current.finished:
+            if not channel.subscribers and self._channels.get(job_id) is channel:
+                del self._channels[job_id]
+            return None, current
+        queue: asyncio.Queue = asyncio.Queue()
+        channel.subscribers.add((asyncio.get_running_loop(), queue))
+        # job state is cumulative, so a client that missed events only needs the latest one
+        return queue, None if last_event_id == current.event_id else current
+
+    def subscribe(
+        self,
+        job_id: str,
+        last_event_id: int | None,
+        load: Callable[[], dict[str, Any] | None]
+    ) -> tuple[asyncio.Queue | None, JobEvent | None]:
+        # a None queue means nothing in this process will publish for the job: it is
+        # finished, left over from a restart, or run by another worker
+        while True:
+            with self._lock:
+                channel = self._channels.get(job_id)
+                if channel is not None and channel.latest is not None:
+                    return self._attach(job_id, channel, last_event_id)
+                seq = channel.seq if channel is not None else None
+            job = load()
+            if job is None:
+                raise KeyError(job_id)
+            with self._lock:
+                current = self._channels.get(job_id)
+                if current is None and channel is None:
+                    return None, job_event(0, job)
+                if current is not channel or current.seq != seq:
+                    # the job moved on while it was being read
+                    continue
+                if channel.latest is None:
+                    channel.latest = job_event(seq, job)
+                return self._attach(job_id, channel, last_event_id)
+
+    def unsubscribe(self, job_id: str, queue: asyncio.Queue) -> None:
+        with self._lock:
+            channel = self._channels.get(job_id)
+            if channel is None:
+                return
+            channel.subscribers = {entry for entry in channel.subscribers if entry[1] is not queue}
+
+    def track(self, job_id: str) -> None:
+        with self._lock:
+            self._channels.setdefault(job_id, _Channel())
+
+
+hub = JobEventHub()
@@ -1,25 +1,72 @@
 from __future__ import annotations
 
+from pathlib import Path
 from threading import Lock
 from uuid import uuid4
 from typing import Any
+import os
+import time
 
+from services.job_events import hub
+from services.job_store import FINISHED_STATUSES, JobStore, MemoryJobStore, SqliteJobStore
 
-_jobs: dict[str, dict[str, Any]] = {}
-_lock = Lock()
+JOB_STORE = os.environ.get("VECTRA_JOB_STORE", "sqlite")
+JOB_DB_PATH = Path(os.environ.get("VECTRA_JOB_DB", "data/jobs.sqlite"))
+JOB_TTL_S = float(os.environ.get("VECTRA_JOB_TTL_S", str(24 * 3600)))
+_EVICT_INTERVAL_S = 60.0
 
+_store: JobStore | None = None
+_store_lock = Lock()
+_last_eviction = 0.0
 
-def create_job() -> str:
+
+def _create_store() -> JobStore:
+    if JOB_STORE == "memory":
+        return MemoryJobStore()
+    if JOB_STORE == "sqlite":
+        return SqliteJobStore(JOB_DB_PATH)
+    raise ValueError(f"Unknown job store: {JOB_STORE}")
+
+
+def get_store() -> JobStore:
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = _create_store()
+    return _store
+
+
+def set_store(store: JobStore) -> None:
+    global _store
+    with _store_lock:
+        _store = store
+
+
+def recover_interrupted_jobs() -> int:
+    return get_store().fail_orphaned()
+
+
+def evict_expired_jobs(ttl_s: float | None = None) -> int:
+    global _last_eviction
+    _last_eviction = time.time()
+    return get_store().evict_finished(_last_eviction - (JOB_TTL_S if ttl_s is None else ttl_s))
+
+
+def create_job(project_id: str | None = None) -> str:
     job_id = uuid4().hex
-    with _lock:
-        _jobs[job_id] = {
-            "job_id": job_id,
-            "status": "queued",
-            "progress": 0,
-            "message": "Queued",
-            "result": None,
-            "error": None
-        }
+    if time.time() - _last_eviction > _EVICT_INTERVAL_S:
+        evict_expired_jobs()
+    get_store().create({
+        "job_id": job_id,
+        "project_id": project_id,
+        "status": "queued",
+        "progress": 0,
+        "message": "Queued",
+        "result": None,
+        "error": None
+    })
+    hub.track(job_id)
     return job_id
 
 
@@ -32,27 +79,22 @@ def update_job(
     result: dict[str, Any] | None = None,
     error: str | None = None
 ) -> None:
-    with _lock:
-        if job_id not in _jobs:
-            return
-        job = _jobs[job_id]
-        if status is not None:
-            job["status"] = status
-        if progress is not None:
-            job["progress"] = max(0, min(100, progress))
-        if message is not None:
-            job["message"] = message
-        if result is not None:
-            current = job.get("result") or {}
-            current.update(result)
-            job["result"] = current
-        if error is not None:
-            job["error"] = error
+    changes: dict[str, Any] = {}
+    if status is not None:
+        changes["status"] = status
+    if progress is not None:
+        changes["progress"] = max(0, min(100, progress))
+    if message is not None:
+        changes["message"] = message
+    if error is not None:
+        changes["error"] = error
+    get_store().update(job_id, changes, result)
+    hub.publish(job_id, status in FINISHED_STATUSES, lambda: get_job(job_id))
 
 
 def get_job(job_id: str) -> dict[str, Any] | None:
-    with _lock:
-        job = _jobs.get(job_id)
-        if job is None:
-            return None
-        return dict(job)
+    return get_store().get(job_id)
+
+
+def list_project_jobs(project_id: str, limit: int = 50) -> list[dict[str, Any]]:
+    return get_store().list_project(project_id, limit)
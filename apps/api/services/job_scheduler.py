@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from itertools import count
+from threading import Condition, Thread
+from typing import Callable
+import os
+
+JOB_WORKERS = int(os.environ.get("VECTRA_JOB_WORKERS", str(os.cpu_count() or 2)))
+JOB_PER_PROJECT_LIMIT = int(os.environ.get("VECTRA_JOB_PER_PROJECT", str(max(1, JOB_WORKERS // 2))))
+
+
+@dataclass(order=True)
+class _QueuedJob:
+    sort_key: tuple[int, int]
+    job_id: str = field(compare=False)
+    project_id: str = field(compare=False)
+    run: Callable[[], None] = field(compare=False)
+
+
+class JobScheduler:
+    def __init__(self, workers: int = JOB_WORKERS, per_project_limit: int = JOB_PER_PROJECT_LIMIT):
+        self.workers = max(1, workers)
+        self.per_project_limit = max(1, per_project_limit)
+        self._queue: list[_QueuedJob] = []
+        self._running: dict[str, int] = {}
+        self._seq = count()
+        self._cond = Condition()
+        self._threads: list[Thread] = []
+
+    def submit(self, job_id: str, project_id: str, run: Callable[[], None], priority: int = 0) -> None:
+        with self._cond:
+            self._queue.append(_QueuedJob((-priority, next(self._seq)), job_id, project_id, run))
+            self._queue.sort()
+            self._start_workers()
+            self._cond.notify()
+
+    def queue_position(self, job_id: str) -> int | None:
+        with self._cond:
+            for position, queued in enumerate(self._queue):
+                if queued.job_id == job_id:
+                    return position
+        return None
+
+    def _start_workers(self) -> None:
+        while len(self._threads) < self.workers:
+            thread = Thread(target=self._work, name=f"job-worker-{len(self._threads)}", daemon=True)
+            self._threads.append(thread)
+            thread.start()
+
+    def _next_job(self) -> _QueuedJob | None:
+        for index, queued in enumerate(self._queue):
+            if self._running.get(queued.project_id, 0) < self.per_project_limit:
+                return self._queue.pop(index)
+        return None
+
+    def _work(self) -> None:
+        while True:
+            with self._cond:
+                job = self._next_job()
+                while job is None:
+                    self._cond.wait()
+                    job = self._next_job()
+                self._running[job.project_id] = self._running.get(job.project_id, 0) + 1
+            try:
+                job.run()
+            finally:
+                with self._cond:
+                    remaining = self._running[job.project_id] - 1
+                    if remaining:
+                        self._running[job.project_id] = remaining
+                    else:
+                        del self._running[job.project_id]
+                    self._cond.notify_all()
+
+
+scheduler = JobScheduler()
@@ -0,0 +1,248 @@
+from __future__ import annotations
+
+from abc import ABC, abstractmethod
+from pathlib import Path
+from threading import Lock, local
+from typing import Any
+import json
+import os
+import sqlite3
+import time
+
+FINISHED_STATUSES = ("completed", "failed")
+_FIELDS = ("job_id", "project_id", "status", "progress", "message", "result", "error")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    project_id TEXT,
+    status TEXT NOT NULL,
+    progress INTEGER NOT NULL,
+    message TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    finished_at REAL,
+    owner TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_project ON jobs (project_id, created_at);
+CREATE INDEX IF NOT EXISTS jobs_finished ON jobs (finished_at) WHERE finished_at IS NOT NULL;
+"""
+
+
+def _boot_id() -> str:
+    try:
+        return Path("/proc/sys/kernel/random/boot_id").read_text().strip()
+    except OSError:
+        return ""
+
+
+def _process_start(pid: int) -> str:
+    # field 22 of /proc/<pid>/stat, in clock ticks since boot; together with the pid it
+    # names one process even after the pid is reused
+    try:
+        stat = Path(f"/proc/{pid}/stat").read_text()
+    except OSError:
+        return ""
+    fields = stat.rpartition(")")[2].split()
+    return fields[19] if len(fields) > 19 else ""
+
+
+def process_owner() -> str:
+    pid = os.getpid()
+    return f"{_boot_id()}:{pid}:{_process_start(pid)}"
+
+
+def _owner_alive(owner: str | None, boot_id: str) -> bool:
+    parts = (owner or "").rsplit(":", 2)
+    if len(parts) != 3 or parts[0] != boot_id:
+        return False
+    _, pid, started = parts
+    try:
+        pid_number = int(pid)
+    except ValueError:
+        return False
+    if started:
+        return _process_start(pid_number) == started
+    # no /proc to tell processes apart, so a live pid has to do
+    try:
+        os.kill(pid_number, 0)
+    except PermissionError:
+        return True
+    except ProcessLookupError:
+        return False
+    return True
+
+
+class JobStore(ABC):
+    @abstractmethod
+    def create(self, job: dict[str, Any]) -> None: ...
+
+    @abstractmethod
+    def update(self, job_id: str, changes: dict[str, Any], result: dict[str, Any] | None) -> None: ...
+
+    @abstractmethod
+    def get(self, job_id: str) -> dict[str, Any] | None: ...
+
+    @abstractmethod
+    def list_project(self, project_id: str, limit: int) -> list[dict[str, Any]]: ...
+
+    @abstractmethod
+    def evict_finished(self, older_than: float) -> int: ...
+
+    @abstractmethod
+    def fail_orphaned(self) -> int: ...
+
+
+class MemoryJobStore(JobStore):
+    def __init__(self):
+        self._jobs: dict[str, dict[str, Any]] = {}
+        self._finished_at: dict[str, float] = {}
+        self._lock = Lock()
+
+    def create(self, job: dict[str, Any]) -> None:
+        with self._lock:
+            self._jobs[job["job_id"]] = dict(job)
+
+    def update(self, job_id: str, changes: dict[str, Any], result: dict[str, Any] | None) -> None:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            # replace rather than mutate so readers can hand out the old dict without a copy
+            job = {**job, **changes}
+            if result is not None:
+                job["result"] = {**(job.get("result") or {}), **result}
+            self._jobs[job_id] = job
+            if job["status"] in FINISHED_STATUSES:
+                self._finished_at.setdefault(job_id, time.time())
+
+    def get(self, job_id: str) -> dict[str, Any] | None:
+        job = self._jobs.get(job_id)
+        return dict(job) if job is not None else None
+
+    def list_project(self, project_id: str, limit: int) -> list[dict[str, Any]]:
+        jobs = [dict(job) for job in list(self._jobs.values()) if job.get("project_id") == project_id]
+        return jobs[::-1][:limit]
+
+    def evict_finished(self, older_than: float) -> int:
+        with self._lock:
+            expired = [job_id for job_id, finished in self._finished_at.items() if finished < older_than]
+            for job_id in expired:
+                del self._finished_at[job_id]
+                self._jobs.pop(job_id, None)
+        return len(expired)
+
+    def fail_orphaned(self) -> int:
+        # in-memory jobs never outlive the process that runs them
+        return 0
+
+
+class SqliteJobStore(JobStore):
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._local = local()
+        self.owner = process_owner()
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=5000")
+            conn.executescript(_SCHEMA)
+            if "owner" not in {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}:
+                conn.execute("ALTER TABLE jobs ADD COLUMN owner TEXT")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _row_to_job(row: tuple) -> dict[str, Any]:
+        job = dict(zip(_FIELDS, row))
+        job["result"] = json.loads(job["result"]) if job["result"] is not None else None
+        return job
+
+    def create(self, job: dict[str, Any]) -> None:
+        now = time.time()
+        self._connection().execute(
+            "INSERT INTO jobs (job_id, project_id, status, progress, message, result, error, created_at, updated_at, owner) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                job["job_id"],
+                job.get("project_id"),
+                job["status"],
+                job["progress"],
+                job["message"],
+                json.dumps(job["result"]) if job.get("result") is not None else None,
+                job.get("error"),
+                now,
+                now,
+                self.owner
+            )
+        )
+
+    def update(self, job_id: str, changes: dict[str, Any], result: dict[str, Any] | None) -> None:
+        conn = self._connection()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if result is not None:
+                row = conn.execute("SELECT result FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+                if row is None:
+                    conn.execute("ROLLBACK")
+                    return
+                merged = json.loads(row[0]) if row[0] is not None else {}
+                merged.update(result)
+                changes = {**changes, "result": json.dumps(merged)}
+            assignments = ", ".join(f"{name} = ?" for name in changes)
+            params = list(changes.values())
+            finished = changes.get("status") in FINISHED_STATUSES
+            conn.execute(
+                f"UPDATE jobs SET {assignments + ', ' if assignments else ''}updated_at = ?"
+                f"{', finished_at = COALESCE(finished_at, ?)' if finished else ''} WHERE job_id = ?",
+                params + [now] + ([now] if finished else []) + [job_id]
+            )
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def get(self, job_id: str) -> dict[str, Any] | None:
+        row = self._connection().execute(
+            f"SELECT {', '.join(_FIELDS)} FROM jobs WHERE job_id = ?",
+            (job_id,)
+        ).fetchone()
+        return self._row_to_job(row) if row is not None else None
+
+    def list_project(self, project_id: str, limit: int) -> list[dict[str, Any]]:
+        rows = self._connection().execute(
+            f"SELECT {', '.join(_FIELDS)} FROM jobs WHERE project_id = ? ORDER BY created_at DESC LIMIT ?",
+            (project_id, limit)
+        ).fetchall()
+        return [self._row_to_job(row) for row in rows]
+
+    def evict_finished(self, older_than: float) -> int:
+        cursor = self._connection().execute(
+            "DELETE FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?",
+            (older_than,)
+        )
+        return cursor.rowcount
+
+    def fail_orphaned(self) -> int:
+        # unfinished jobs whose process is gone (or whose owner predates pid start times)
+        # will never finish; jobs other live workers are running are left alone
+        conn = self._connection()
+        boot_id = _boot_id()
+        rows = conn.execute("SELECT job_id, owner FROM jobs WHERE finished_at IS NULL").fetchall()
+        orphaned = [job_id for job_id, owner in rows if not _owner_alive(owner, boot_id)]
+        now = time.time()
+        conn.executemany(
+            "UPDATE jobs SET status = 'failed', progress = 100, message = 'Interrupted', "
+            "error = 'Job was interrupted by a server restart', updated_at = ?, finished_at = ? "
+            "WHERE job_id = ? AND finished_at IS NULL",
+            [(now, now, job_id) for job_id in orphaned]
+        )
+        return len(orphaned)
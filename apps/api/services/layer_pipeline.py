@@ -0,0 +1,230 @@
+from __future__ import annotations
+
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from threading import Lock
+import multiprocessing
+import os
+import re
+import tempfile
+
+import numpy as np
+
+from services.gcode_emitter import GCODE_EMITTER, GCODE_FOOTER, GCODE_HEADER, emit_gcode
+from services.geometry_format import GEOMETRY_SUFFIX, Geometry, build_geometry, geometry_to_document, read_geometry, write_geometry
+from services.instrumentation import record_child_usage
+from services.stage_cache import run_cached_stage
+from services.toolpath_optimizer import OptimizeOptions, optimize_paths
+from services.vpype_runner import GcodeProfile
+
+LAYER_WORKERS = int(os.environ.get("VECTRA_LAYER_WORKERS", str(os.cpu_count() or 2)))
+SPLIT_MODES = ("layer", "color")
+_MAX_POOL_FAILURES = 3
+_COPY_CHUNK = 1024 * 1024
+
+_pool: ProcessPoolExecutor | None = None
+_pool_lock = Lock()
+_pool_failures = 0
+_inline = False
+
+
+@dataclass
+class PlotLayer:
+    name: str
+    color: str | None
+    filename: str
+    path_count: int
+    gcode_path: Path
+    cached: bool
+
+
+def _subset(geometry: Geometry, selected: np.ndarray, name: str) -> Geometry:
+    offsets = np.asarray(geometry.offsets, dtype=np.int64)
+    counts = np.diff(offsets)[selected]
+    sub_offsets = np.zeros(len(selected) + 1, dtype=np.int64)
+    np.cumsum(counts, out=sub_offsets[1:])
+    index = np.arange(sub_offsets[-1]) - np.repeat(sub_offsets[:-1], counts) + np.repeat(offsets[:-1][selected], counts)
+    used, color_ids = np.unique(np.asarray(geometry.color_ids)[selected], return_inverse=True)
+    return Geometry(
+        coords=np.asarray(geometry.coords)[index],
+        offsets=sub_offsets,
+        layer_ids=np.zeros(len(selected), dtype=np.int32),
+        color_ids=color_ids.astype(np.int32),
+        layers=[name],
+        colors=[geometry.colors[i] for i in used.tolist()],
+        # only page metadata, so a group's bytes change only when its own paths do
+        meta={key: value for key, value in geometry.meta.items() if key != "vpype_layers"}
+    )
+
+
+def split_geometry(geometry: Geometry, by: str) -> list[Geometry]:
+    if by not in SPLIT_MODES:
+        raise ValueError(f"Unknown split mode {by!r}")
+    if by == "layer":
+        # empty layers are kept so the combined program has the same "(Start Layer)"
+        # blocks as an unsplit one
+        ids = np.asarray(geometry.layer_ids)
+        return [_subset(geometry, np.flatnonzero(ids == i), name) for i, name in enumerate(geometry.layers)]
+    keys = list(dict.fromkeys(geometry.colors))
+    group_of_color = np.array([keys.index(color) for color in geometry.colors], dtype=np.int32)
+    ids = group_of_color[np.asarray(geometry.color_ids)] if geometry.path_count else np.empty(0, dtype=np.int32)
+    groups = [_subset(geometry, np.flatnonzero(ids == i), color or "default") for i, color in enumerate(keys)]
+    return [group for group in groups if group.path_count]
+
+
+def optimize_geometry(geometry: Geometry, options: OptimizeOptions) -> Geometry:
+    if geometry.path_count == 0:
+        return geometry
+    paths, _ = optimize_paths(geometry_to_document(geometry).paths, options)
+    return build_geometry([(p.points, p.layer, p.color) for p in paths], geometry.meta)
+
+
+def _render_layer(group_path: str, profile: GcodeProfile, optimize: OptimizeOptions | None) -> tuple[str, bool]:
+    source = Path(group_path)
+    if optimize is not None:
+        group = source
+        source, _ = run_cached_stage(
+            "layer-optimize",
+            group,
+            optimize,
+            GEOMETRY_SUFFIX,
+            lambda out: write_geometry(out, optimize_geometry(read_geometry(group), optimize))
+        )
+    # emit_gcode honours VECTRA_GCODE_EMITTER; gwrite frames every program with the same
+    # header and footer, so either emitter's layer files join the same way
+    gcode_path, hit = run_cached_stage(
+        "layer-gcode",
+        source,
+        {"profile": asdict(profile), "emitter": GCODE_EMITTER},
+        ".gcode",
+        lambda out: emit_gcode(source, out, profile)
+    )
+    return str(gcode_path.resolve()), hit
+
+
+def _measured_render(*args) -> tuple[tuple[str, bool], float, int]:
+    from services.instrumentation import peak_rss_bytes, process_cpu_s
+
+    started = process_cpu_s()
+    result = _render_layer(*args)
+    return result, process_cpu_s() - started, peak_rss_bytes()
+
+
+def _init_layer_worker() -> None:
+    from services.vpype_worker import use_inline_execution
+
+    use_inline_execution()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=LAYER_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_layer_worker
+            )
+        return _pool
+
+
+def _discard_pool(pool: ProcessPoolExecutor) -> None:
+    global _pool, _pool_failures
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+            _pool_failures += 1
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def use_inline_execution() -> None:
+    # batch workers already run one pipeline per core
+    global _inline
+    _inline = True
+
+
+def _render_all(tasks: list[tuple]) -> list[tuple[str, bool]]:
+    if _inline or LAYER_WORKERS <= 1 or len(tasks) < 2 or _pool_failures >= _MAX_POOL_FAILURES:
+        return [_render_layer(*task) for task in tasks]
+    pool = _get_pool()
+    try:
+        futures = [pool.submit(_measured_render, *task) for task in tasks]
+        results = []
+        for future in futures:
+            result, cpu_s, peak_rss = future.result()
+            record_child_usage(cpu_s, peak_rss)
+            results.append(result)
+    except BrokenProcessPool:
+        _discard_pool(pool)
+        return [_render_layer(*task) for task in tasks]
+    return results
+
+
+def _filename(index: int, name: str) -> str:
+    slug = re.sub(r"[^A-Za-z0-9]+", "-", name).strip("-").lower() or "layer"
+    return f"plot-{index + 1:02d}-{slug}.gcode"
+
+
+def _write_combined(layers: list[PlotLayer], output_path: Path) -> None:
+    # every layer file is a complete program; the combined one keeps their bodies
+    # between a single header and footer
+    header, footer = len(GCODE_HEADER.encode()), len(GCODE_FOOTER.encode())
+    with Path(output_path).open("wb") as out:
+        out.write(GCODE_HEADER.encode())
+        for layer in layers:
+            with layer.gcode_path.open("rb") as f:
+                f.seek(header)
+                remaining = layer.gcode_path.stat().st_size - header - footer
+                while remaining > 0:
+                    chunk = f.read(min(_COPY_CHUNK, remaining))
+                    if not chunk:
+                        break
+                    out.write(chunk)
+                    remaining -= len(chunk)
+        out.write(GCODE_FOOTER.encode())
+
+
+def run_layer_pipeline(
+    geometry_path: Path,
+    split_by: str,
+    profile: GcodeProfile,
+    optimize: OptimizeOptions | None = None
+) -> tuple[list[PlotLayer], Path, bool]:
+    # each layer is emitted from its own geometry file, so the stage cache keys it by
+    # that layer's content and a re-run only regenerates the layers that changed
+    geometry = read_geometry(geometry_path)
+    groups = split_geometry(geometry, split_by)
+    with tempfile.TemporaryDirectory(prefix="layers-") as tmp_dir:
+        group_paths = []
+        for index, group in enumerate(groups):
+            group_path = Path(tmp_dir) / f"{index}{GEOMETRY_SUFFIX}"
+            write_geometry(group_path, group)
+            group_paths.append(str(group_path))
+        rendered = _render_all([(path, profile, optimize) for path in group_paths])
+    layers = [
+        PlotLayer(
+            name=group.layers[0],
+            color=group.colors[0] if len(group.colors) == 1 else None,
+            filename=_filename(index, group.layers[0]),
+            path_count=group.path_count,
+            gcode_path=Path(gcode_path),
+            cached=hit
+        )
+        for index, (group, (gcode_path, hit)) in enumerate(zip(groups, rendered))
+    ]
+    options = {
+        "profile": asdict(profile),
+        "emitter": GCODE_EMITTER,
+        "split_by": split_by,
+        "optimize": asdict(optimize) if optimize is not None else None
+    }
+    combined_path, hit = run_cached_stage(
+        "gcode",
+        geometry_path,
+        options,
+        ".gcode",
+        lambda out: _write_combined(layers, out)
+    )
+    return layers, combined_path, hit
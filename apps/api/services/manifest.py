@@ -0,0 +1,256 @@
+from __future__ import annotations
+
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from threading import local
+import hashlib
+import os
+import secrets
+import sqlite3
+import sys
+
+MANIFEST_NAME = "manifest.sqlite"
+ARTIFACT_KINDS = ("source", "intermediate", "outputs")
+# open manifests kept per thread; the least recently used one is closed past this
+MANIFEST_CONNECTIONS = max(2, int(os.environ.get("VECTRA_MANIFEST_CONNECTIONS", "8")))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS artifacts (
+    kind TEXT NOT NULL,
+    file_id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    sha256 TEXT,
+    created_at TEXT NOT NULL,
+    PRIMARY KEY (kind, file_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS artifacts_sha256 ON artifacts (kind, sha256);
+CREATE INDEX IF NOT EXISTS artifacts_name ON artifacts (kind, name);
+CREATE TABLE IF NOT EXISTS runs (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS state (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+) WITHOUT ROWID;
+"""
+
+_local = local()
+
+
+def _connection(project_dir: Path) -> sqlite3.Connection:
+    connections: OrderedDict[str, sqlite3.Connection] | None = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = OrderedDict()
+    db_path = project_dir / MANIFEST_NAME
+    key = str(db_path)
+    conn = connections.get(key)
+    if conn is not None:
+        connections.move_to_end(key)
+        return conn
+    conn = sqlite3.connect(key, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(_SCHEMA)
+    # a per-database epoch keeps version counters from repeating if the manifest is recreated
+    conn.execute("INSERT OR IGNORE INTO state (key, value) VALUES ('epoch', ?)", (secrets.randbits(48),))
+    if conn.execute("PRAGMA user_version").fetchone()[0] == 0:
+        _scan_into(conn, project_dir, only_if_unscanned=True)
+    connections[key] = conn
+    while len(connections) > MANIFEST_CONNECTIONS:
+        _, evicted = connections.popitem(last=False)
+        evicted.close()
+    return conn
+
+
+@contextmanager
+def manifest_transaction(project_dir: Path):
+    conn = _connection(project_dir)
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+
+def _bump_version(conn: sqlite3.Connection, key: str) -> None:
+    conn.execute(
+        "INSERT INTO state (key, value) VALUES (?, 1) ON CONFLICT (key) DO UPDATE SET value = value + 1",
+        (key,)
+    )
+
+
+def manifest_versions(project_dir: Path) -> dict[str, int]:
+    return dict(_connection(project_dir).execute("SELECT key, value FROM state").fetchall())
+
+
+def record_artifact(
+    conn: sqlite3.Connection,
+    kind: str,
+    file_id: str,
+    name: str,
+    size: int,
+    sha256: str | None,
+    created_at: str | None = None
+) -> None:
+    conn.execute(
+        "INSERT OR REPLACE INTO artifacts (kind, file_id, name, size, sha256, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+        (kind, file_id, name, size, sha256, created_at or datetime.now(timezone.utc).isoformat())
+    )
+    _bump_version(conn, "artifacts")
+
+
+def lookup_artifact_record(project_dir: Path, kind: str, file_id: str) -> tuple[Path, str | None] | None:
+    if not project_dir.exists():
+        return None
+    row = _connection(project_dir).execute(
+        "SELECT name, sha256 FROM artifacts WHERE kind = ? AND file_id = ?",
+        (kind, file_id)
+    ).fetchone()
+    return (project_dir / kind / row[0], row[1]) if row else None
+
+
+def lookup_artifact(project_dir: Path, kind: str, file_id: str) -> Path | None:
+    record = lookup_artifact_record(project_dir, kind, file_id)
+    return record[0] if record else None
+
+
+def remove_artifact(conn: sqlite3.Connection, kind: str, file_id: str) -> tuple[str, str | None] | None:
+    row = conn.execute(
+        "SELECT name, sha256 FROM artifacts WHERE kind = ? AND file_id = ?",
+        (kind, file_id)
+    ).fetchone()
+    if row is None:
+        return None
+    conn.execute("DELETE FROM artifacts WHERE kind = ? AND file_id = ?", (kind, file_id))
+    _bump_version(conn, "artifacts")
+    return row[0], row[1]
+
+
+def list_artifact_page(
+    project_dir: Path,
+    kind: str,
+    limit: int | None = None,
+    after: str | None = None
+) -> list[tuple[str, str, int]]:
+    return _connection(project_dir).execute(
+        "SELECT file_id, name, size FROM artifacts WHERE kind = ? AND name > ? ORDER BY name LIMIT ?",
+        (kind, after or "", -1 if limit is None else limit)
+    ).fetchall()
+
+
+def list_artifact_records(project_dir: Path) -> list[tuple[str, str, str | None]]:
+    return _connection(project_dir).execute("SELECT kind, name, sha256 FROM artifacts").fetchall()
+
+
+def find_by_hash(conn: sqlite3.Connection, kind: str, sha256: str) -> tuple[str, str] | None:
+    row = conn.execute(
+        "SELECT file_id, name FROM artifacts WHERE kind = ? AND sha256 = ? ORDER BY created_at LIMIT 1",
+        (kind, sha256)
+    ).fetchone()
+    return (row[0], row[1]) if row else None
+
+
+def insert_runs(conn: sqlite3.Connection, runs: list[tuple[str, str]]) -> None:
+    conn.executemany("INSERT INTO runs (created_at, data) VALUES (?, ?)", runs)
+    _bump_version(conn, "runs")
+
+
+def list_runs(project_dir: Path, limit: int, before: int | None = None) -> list[tuple[int, str, str]]:
+    # seq is the rowid, so newest-first pages walk the table b-tree backwards
+    return _connection(project_dir).execute(
+        "SELECT seq, created_at, data FROM runs WHERE seq < ? ORDER BY seq DESC LIMIT ?",
+        (before if before is not None else sys.maxsize, limit)
+    ).fetchall()
+
+
+def prune_runs(conn: sqlite3.Connection, keep: int) -> int:
+    removed = conn.execute(
+        "DELETE FROM runs WHERE seq <= (SELECT seq FROM runs ORDER BY seq DESC LIMIT 1 OFFSET ?)",
+        (keep,)
+    ).rowcount
+    if removed:
+        _bump_version(conn, "runs")
+    return removed
+
+
+def hash_file(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _scan_into(conn: sqlite3.Connection, project_dir: Path, only_if_unscanned: bool = False) -> int:
+    count = 0
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if only_if_unscanned and conn.execute("PRAGMA user_version").fetchone()[0] != 0:
+            conn.execute("ROLLBACK")
+            return 0
+        conn.execute("DELETE FROM artifacts")
+        for kind in ARTIFACT_KINDS:
+            kind_dir = project_dir / kind
+            if not kind_dir.exists():
+                continue
+            for path in sorted(kind_dir.iterdir(), key=lambda p: p.name):
+                if not path.is_file() or path.name.startswith(".") or "_" not in path.name:
+                    continue
+                stat = path.stat()
+                conn.execute(
+                    "INSERT OR IGNORE INTO artifacts (kind, file_id, name, size, sha256, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                    (
+                        kind,
+                        path.name.split("_", 1)[0],
+                        path.name,
+                        stat.st_size,
+                        hash_file(path),
+                        datetime.fromtimestamp(stat.st_mtime, timezone.utc).isoformat()
+                    )
+                )
+                count += 1
+        _bump_version(conn, "artifacts")
+        conn.execute("PRAGMA user_version = 1")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+    return count
+
+
+def rebuild_manifest(project_dir: Path) -> int:
+    from services.blob_store import reconcile_project_refs
+
+    before = Counter(sha256 for _, _, sha256 in list_artifact_records(project_dir) if sha256)
+    count = _scan_into(_connection(project_dir), project_dir)
+    reconcile_project_refs(project_dir, before)
+    return count
+
+
+def main(argv: list[str]) -> int:
+    from services.storage import DATA_ROOT
+
+    if argv:
+        project_ids = argv
+    elif DATA_ROOT.exists():
+        project_ids = sorted(p.name for p in DATA_ROOT.iterdir() if p.is_dir())
+    else:
+        project_ids = []
+    for project_id in project_ids:
+        project_dir = DATA_ROOT / project_id
+        if not project_dir.is_dir():
+            print(f"{project_id}: not found", file=sys.stderr)
+            continue
+        print(f"{project_id}: {rebuild_manifest(project_dir)} artifacts")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
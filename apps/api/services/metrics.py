@@ -0,0 +1,146 @@
+from __future__ import annotations
+
+from threading import Lock
+from typing import Any
+import math
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+RSS_BUCKETS = tuple(float(2 ** power) for power in range(24, 35))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace("\"", "\\\"")
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    pairs = [f"{name}=\"{_escape(value)}\"" for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, description: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self._lock = Lock()
+
+    def _key(self, labels: dict[str, Any]) -> tuple[str, ...]:
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def render(self) -> list[str]:
+        return [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, description: str, labels: tuple[str, ...] = ()):
+        super().__init__(name, description, labels)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> list[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return super().render() + [
+            f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}" for key, value in values
+        ]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, description: str, buckets: tuple[float, ...], labels: tuple[str, ...] = ()):
+        super().__init__(name, description, labels)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._series: dict[tuple[str, ...], tuple[list[int], list[float]]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._series.setdefault(key, ([0] * len(self.buckets), [0.0]))
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+            total[0] += value
+
+    def render(self) -> list[str]:
+        with self._lock:
+            series = sorted((key, list(counts), total[0]) for key, (counts, total) in self._series.items())
+        lines = super().render()
+        for key, counts, total in series:
+            for bound, count in zip(self.buckets, counts):
+                le = f"le=\"{_format_value(bound)}\""
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {counts[-1]}")
+        return lines
+
+
+STAGE_SECONDS = Histogram(
+    "vectra_stage_duration_seconds",
+    "Wall time spent in each pipeline stage or storage call per run.",
+    DURATION_BUCKETS,
+    ("stage",)
+)
+STAGE_CPU_SECONDS = Counter(
+    "vectra_stage_cpu_seconds_total",
+    "CPU time spent in each pipeline stage, by the job thread or by child processes.",
+    ("stage", "source")
+)
+STAGE_CALLS = Counter("vectra_stage_calls_total", "Number of times each pipeline stage ran.", ("stage",))
+STAGE_CHILD_RSS_BYTES = Histogram(
+    "vectra_stage_child_peak_rss_bytes",
+    "Peak resident memory of the child processes a stage started.",
+    RSS_BUCKETS,
+    ("stage",)
+)
+PIPELINE_RUNS = Counter("vectra_pipeline_runs_total", "Finished pipeline runs.", ("status",))
+PIPELINE_SECONDS = Histogram("vectra_pipeline_duration_seconds", "Wall time of completed pipeline runs.", DURATION_BUCKETS)
+
+REGISTRY: list[_Metric] = [
+    PIPELINE_RUNS,
+    PIPELINE_SECONDS,
+    STAGE_CALLS,
+    STAGE_SECONDS,
+    STAGE_CPU_SECONDS,
+    STAGE_CHILD_RSS_BYTES
+]
+
+
+def observe_run(run: dict[str, Any]) -> None:
+    # fed from the run dict rather than live spans so batch items, which execute in
+    # worker processes, land in the API process's registry too
+    PIPELINE_RUNS.inc(status="completed")
+    if run.get("duration_s") is not None:
+        PIPELINE_SECONDS.observe(run["duration_s"])
+    for stage, timing in (run.get("timings") or {}).items():
+        STAGE_CALLS.inc(timing["calls"], stage=stage)
+        STAGE_SECONDS.observe(timing["wall_s"], stage=stage)
+        STAGE_CPU_SECONDS.inc(timing["cpu_s"], stage=stage, source="self")
+        STAGE_CPU_SECONDS.inc(timing["child_cpu_s"], stage=stage, source="children")
+        if timing["child_peak_rss_bytes"]:
+            STAGE_CHILD_RSS_BYTES.observe(timing["child_peak_rss_bytes"], stage=stage)
+
+
+def observe_failed_run() -> None:
+    PIPELINE_RUNS.inc(status="failed")
+
+
+def render_metrics() -> str:
+    return "\n".join(line for metric in REGISTRY for line in metric.render()) + "\n"
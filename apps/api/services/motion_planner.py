@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field, fields
+from functools import lru_cache
+from pathlib import Path
+from typing import TYPE_CHECKING
+import json
+import os
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from services.gcode_parser import GcodeMoves
+
+# JSON file with MachineProfile fields describing the plotter the G-code is sent to
+MACHINE_PROFILE_PATH = os.environ.get("VECTRA_MACHINE_PROFILE", "")
+
+
+@dataclass
+class MachineProfile:
+    # feed used for G1/G2/G3 until the program sets F
+    draw_feed_mm_min: float = 3000.0
+    # G0 rate
+    travel_feed_mm_min: float = 6000.0
+    max_feed_mm_min: float = 10000.0
+    acceleration_mm_s2: float = 500.0
+    junction_deviation_mm: float = 0.01
+    # seconds per G4 P unit: 1 for grbl, 0.001 for Marlin
+    dwell_p_scale: float = 1.0
+    # servo travel on top of any programmed dwell, per pen up or down
+    pen_change_s: float = 0.0
+
+
+@dataclass
+class PlotTimeEstimate:
+    total_s: float = 0.0
+    draw_s: float = 0.0
+    travel_s: float = 0.0
+    dwell_s: float = 0.0
+    layer_s: list[float] = field(default_factory=list)
+
+
+@lru_cache(maxsize=None)
+def load_machine_profile(path: str = MACHINE_PROFILE_PATH) -> MachineProfile:
+    if not path:
+        return MachineProfile()
+    data = json.loads(Path(path).read_text())
+    known = {f.name for f in fields(MachineProfile)}
+    return MachineProfile(**{key: float(value) for key, value in data.items() if key in known})
+
+
+def nominal_speeds(moves: GcodeMoves, profile: MachineProfile) -> np.ndarray:
+    feed = np.where(np.isnan(moves.feed) | (moves.feed <= 0), profile.draw_feed_mm_min, moves.feed)
+    feed = np.where(moves.rapid, profile.travel_feed_mm_min, feed)
+    return np.minimum(feed, profile.max_feed_mm_min) / 60.0
+
+
+def junction_limits(ux: np.ndarray, uy: np.ndarray, nominal: np.ndarray, stop: np.ndarray, profile: MachineProfile) -> np.ndarray:
+    # squared speed allowed at each of the n + 1 move boundaries, using grbl's junction
+    # deviation model; the program starts and ends at rest, as does every stop
+    count = len(ux)
+    limits = np.zeros(count + 1)
+    if count > 1:
+        cos_theta = np.clip(-(ux[:-1] * ux[1:] + uy[:-1] * uy[1:]), -1.0, 1.0)
+        sin_half = np.sqrt(0.5 * (1.0 - cos_theta))
+        with np.errstate(divide="ignore"):
+            corner = profile.acceleration_mm_s2 * profile.junction_deviation_mm * sin_half / (1.0 - sin_half)
+        nominal_sq = nominal * nominal
+        limits[1:count] = np.minimum(corner, np.minimum(nominal_sq[:-1], nominal_sq[1:]))
+    limits[:count][stop] = 0.0
+    limits[0] = 0.0
+    return limits
+
+
+def plan_speeds(lengths: np.ndarray, limits: np.ndarray, acceleration: float) -> np.ndarray:
+    # the forward (accelerate) and backward (decelerate) passes of a look-ahead planner
+    # have a closed form: the squared speed at boundary k is min_j(limit_j + 2a|s_k - s_j|),
+    # split into prefix and suffix minima so both passes are a single accumulate each
+    reach = 2.0 * acceleration * np.concatenate(([0.0], np.cumsum(lengths)))
+    forward = reach + np.minimum.accumulate(limits - reach)
+    backward = np.minimum.accumulate((limits + reach)[::-1])[::-1] - reach
+    return np.maximum(np.minimum(forward, backward), 0.0)
+
+
+def segment_times(lengths: np.ndarray, nominal: np.ndarray, speeds_sq: np.ndarray, acceleration: float) -> np.ndarray:
+    if acceleration <= 0:
+        return lengths / nominal
+    entry_sq, exit_sq = speeds_sq[:-1], speeds_sq[1:]
+    nominal_sq = nominal * nominal
+    # trapezoid when there is room to cruise, otherwise a triangle peaking below nominal
+    cruise = lengths - (2.0 * nominal_sq - entry_sq - exit_sq) / (2.0 * acceleration)
+    peak = np.sqrt(np.minimum(nominal_sq, 0.5 * (entry_sq + exit_sq) + acceleration * lengths))
+    ramps = (2.0 * peak - np.sqrt(entry_sq) - np.sqrt(exit_sq)) / acceleration
+    return ramps + np.maximum(cruise, 0.0) / nominal
+
+
+def estimate_plot_time(moves: GcodeMoves, profile: MachineProfile | None = None) -> PlotTimeEstimate:
+    profile = profile or load_machine_profile()
+    layer_count = max(len(moves.layer_dwell), int(moves.layer.max()) + 1 if moves.count else 1)
+    dwell = np.zeros(layer_count)
+    dwell[:len(moves.layer_dwell)] = moves.layer_dwell * profile.dwell_p_scale
+    if moves.count:
+        changes = np.flatnonzero(np.diff(moves.pen.astype(np.int8), prepend=0))
+        dwell += profile.pen_change_s * np.bincount(moves.layer[changes], minlength=layer_count)
+    if not moves.count:
+        return PlotTimeEstimate(total_s=float(dwell.sum()), dwell_s=float(dwell.sum()), layer_s=dwell.tolist())
+
+    dx = np.diff(moves.x, prepend=0.0)
+    dy = np.diff(moves.y, prepend=0.0)
+    lengths = np.hypot(dx, dy)
+    safe = np.where(lengths > 0, lengths, 1.0)
+    nominal = nominal_speeds(moves, profile)
+    limits = junction_limits(dx / safe, dy / safe, nominal, moves.stop, profile)
+    speeds_sq = plan_speeds(lengths, limits, profile.acceleration_mm_s2)
+    times = segment_times(lengths, nominal, speeds_sq, profile.acceleration_mm_s2)
+
+    layer_s = np.bincount(moves.layer, weights=times, minlength=layer_count) + dwell
+    draw_s = float(times[moves.pen].sum())
+    travel_s = float(times.sum()) - draw_s
+    return PlotTimeEstimate(
+        total_s=float(layer_s.sum()),
+        draw_s=draw_s,
+        travel_s=travel_s,
+        dwell_s=float(dwell.sum()),
+        layer_s=layer_s.tolist()
+    )
@@ -1,17 +1,28 @@
 from pathlib import Path
+from typing import Any, Callable
 
 from models.schemas import PipelineJobRequest
+from services.gcode_emitter import emit_gcode
+from services.geometry_format import GEOMETRY_SUFFIX
+from services.geometry_simplify import SimplifyOptions, run_simplify_stage, vertex_count
 from services.ingestion import ingest_to_svg_stub
+from services.instrumentation import recording, span
 from services.job_manager import update_job
+from services.layer_pipeline import run_layer_pipeline
+from services.metrics import observe_failed_run, observe_run
+from services.preview_pyramid import ensure_pyramid
+from services.raster_preprocess import RasterPreprocessOptions, run_preprocess_stage
+from services.stage_cache import run_cached_stage
 from services.storage import (
     append_run,
     ensure_project_dir,
     find_intermediate_file,
     find_source_file,
-    save_intermediate,
-    save_output
+    save_intermediate_file,
+    save_output_file
 )
-from services.vpype_runner import GcodeProfile, run_vpype_to_gcode, run_vpype_to_svg
+from services.toolpath_optimizer import OptimizeOptions
+from services.vpype_runner import GcodeProfile, run_vpype_to_geometry
 from services.vtracer_runner import VtracerOptions, run_vtracer_to_svg
 
 
@@ -22,13 +33,20 @@ def _resolve_svg_path(project_id: str, svg_id: str):
     return path
 
 
-def run_pipeline_job(job_id: str, payload: PipelineJobRequest) -> None:
-    update_job(job_id, status="running", progress=5, message="Starting job")
-    project_dir = ensure_project_dir(payload.project_id)
+def execute_pipeline(job_id: str, payload: PipelineJobRequest, report: Callable[..., None]) -> dict[str, Any]:
+    with recording() as recorder:
+        run = _execute_stages(job_id, payload, report)
+    run["duration_s"] = round(recorder.elapsed_s, 4)
+    run["timings"] = recorder.as_dict()
+    return run
 
-    ingest_svg_id, source_kind = ingest_to_svg_stub(payload.project_id, payload.file_id, payload.filename)
-    update_job(
-        job_id,
+
+def _execute_stages(job_id: str, payload: PipelineJobRequest, report: Callable[..., None]) -> dict[str, Any]:
+    cache: dict[str, str] = {}
+
+    with span("ingest"):
+        ingest_svg_id, source_kind = ingest_to_svg_stub(payload.project_id, payload.file_id, payload.filename)
+    report(
         progress=20,
         message=f"Ingestion complete ({source_kind})",
         result={"ingest_svg_id": ingest_svg_id, "source_kind": source_kind}
@@ -36,11 +54,21 @@ def run_pipeline_job(job_id: str, payload: PipelineJobRequest) -> None:
 
     working_svg_id = ingest_svg_id
     if source_kind == "raster":
-        update_job(job_id, progress=30, message="Vectorizing raster")
+        report(progress=30, message="Vectorizing raster")
         source_path = find_source_file(payload.project_id, payload.file_id)
         if source_path is None:
             raise RuntimeError("Source raster not found")
-        vectorized_path = project_dir / "intermediate" / f"{payload.file_id}_vectorized.svg"
+        p_opts = RasterPreprocessOptions(
+            plot_width_mm=payload.plot_width_mm,
+            pen_width_mm=payload.pen_width_mm,
+            quantize_colors=payload.quantize_colors,
+            threshold=payload.threshold,
+            denoise=payload.denoise
+        )
+        with span("preprocess"):
+            raster_path, hit = run_preprocess_stage(Path(source_path), p_opts)
+        if hit is not None:
+            cache["preprocess"] = "hit" if hit else "miss"
         v_opts = VtracerOptions(
             mode=payload.mode,
             colormode=payload.colormode,
@@ -50,51 +78,145 @@ def run_pipeline_job(job_id: str, payload: PipelineJobRequest) -> None:
             length_threshold=payload.length_threshold,
             corner_threshold=payload.corner_threshold,
             segment_length=payload.segment_length,
-            spiro=payload.spiro
+            spiro=payload.spiro,
+            tile_size=payload.tile_size,
+            tile_overlap=payload.tile_overlap
+        )
+        with span("vectorize"):
+            vectorized_path, hit = run_cached_stage(
+                "vectorize",
+                raster_path,
+                v_opts,
+                ".svg",
+                lambda out: run_vtracer_to_svg(raster_path, out, v_opts)
+            )
+        cache["vectorize"] = "hit" if hit else "miss"
+        working_svg_id = save_intermediate_file(payload.project_id, "vectorized.svg", vectorized_path, link=True)
+        report(
+            progress=45,
+            message="Vectorization complete",
+            result={"ingest_svg_id": working_svg_id, "cache": dict(cache)}
         )
-        run_vtracer_to_svg(Path(source_path), vectorized_path, v_opts)
-        working_svg_id = save_intermediate(payload.project_id, "vectorized.svg", vectorized_path.read_text())
-        update_job(job_id, progress=45, message="Vectorization complete", result={"ingest_svg_id": working_svg_id})
 
-    update_job(job_id, progress=55, message="Running vpype processing")
+    report(progress=55, message="Running vpype processing")
     source_svg_path = _resolve_svg_path(payload.project_id, working_svg_id)
     if source_svg_path is None:
         raise RuntimeError("SVG input for processing not found")
-    processed_path = project_dir / "intermediate" / f"{working_svg_id}_processed.svg"
-    run_vpype_to_svg(Path(source_svg_path), processed_path)
-    processed_svg_id = save_intermediate(payload.project_id, "processed.svg", processed_path.read_text())
-    update_job(job_id, progress=75, message="Processing complete", result={"processed_svg_id": processed_svg_id})
+    # processed geometry stays in the binary format; SVG is only rendered when someone asks for it
+    with span("process"):
+        processed_path, hit = run_cached_stage(
+            "process",
+            Path(source_svg_path),
+            None,
+            GEOMETRY_SUFFIX,
+            lambda out: run_vpype_to_geometry(Path(source_svg_path), out)
+        )
+    cache["process"] = "hit" if hit else "miss"
+    s_opts = SimplifyOptions(
+        tolerance_mm=payload.simplify_tolerance_mm,
+        merge_collinear=payload.merge_collinear,
+        min_size_mm=payload.min_path_size_mm
+    )
+    with span("simplify"):
+        vertices_before = vertex_count(processed_path)
+        processed_path, hit = run_simplify_stage(processed_path, s_opts)
+        vertices_after = vertex_count(processed_path) if hit is not None else vertices_before
+    if hit is not None:
+        cache["simplify"] = "hit" if hit else "miss"
+    processed_svg_id = save_intermediate_file(payload.project_id, f"processed{GEOMETRY_SUFFIX}", processed_path, link=True)
+    report(
+        progress=75,
+        message="Processing complete",
+        result={
+            "processed_svg_id": processed_svg_id,
+            "vertices_before": vertices_before,
+            "vertices_after": vertices_after,
+            "cache": dict(cache)
+        }
+    )
 
-    update_job(job_id, progress=82, message="Generating G-code")
+    report(progress=82, message="Generating G-code")
     processed_svg_path = _resolve_svg_path(payload.project_id, processed_svg_id)
     if processed_svg_path is None:
-        raise RuntimeError("Processed SVG not found")
-    gcode_path = project_dir / "outputs" / f"{processed_svg_id}.gcode"
+        raise RuntimeError("Processed geometry not found")
     g_profile = GcodeProfile(
         pen_down_cmd=payload.pen_down_cmd,
         pen_up_cmd=payload.pen_up_cmd,
         pen_dwell_s=payload.pen_dwell_s,
-        vertical_flip=payload.vertical_flip
-    )
-    run_vpype_to_gcode(Path(processed_svg_path), gcode_path, g_profile)
-    gcode_id = save_output(payload.project_id, "plot.gcode", gcode_path.read_text())
-    append_run(
-        payload.project_id,
-        {
-            "job_id": job_id,
-            "source_kind": source_kind,
-            "source_file_id": payload.file_id,
-            "ingest_svg_id": working_svg_id,
-            "processed_svg_id": processed_svg_id,
-            "gcode_id": gcode_id,
-            "status": "completed"
-        }
+        vertical_flip=payload.vertical_flip,
+        arc_tolerance_mm=payload.arc_tolerance_mm,
+        line_tolerance_mm=payload.line_tolerance_mm,
+        precision=payload.gcode_precision
     )
+    with span("gcode"):
+        if payload.split_by == "none":
+            gcode_path, hit = run_cached_stage(
+                "gcode",
+                Path(processed_svg_path),
+                g_profile,
+                ".gcode",
+                lambda out: emit_gcode(Path(processed_svg_path), out, g_profile)
+            )
+        else:
+            plot_layers, gcode_path, hit = run_layer_pipeline(
+                Path(processed_svg_path),
+                payload.split_by,
+                g_profile,
+                OptimizeOptions() if payload.optimize_toolpaths else None
+            )
+    cache["gcode"] = "hit" if hit else "miss"
+    gcode_id = save_output_file(payload.project_id, "plot.gcode", gcode_path, link=True)
+    layers: list[dict[str, Any]] = []
+    if payload.split_by != "none":
+        # one file per pen; a single layer is the combined file already
+        for layer in plot_layers:
+            layers.append({
+                "name": layer.name,
+                "color": layer.color,
+                "path_count": layer.path_count,
+                "gcode_id": (
+                    save_output_file(payload.project_id, layer.filename, layer.gcode_path, link=True)
+                    if len(plot_layers) > 1 else gcode_id
+                ),
+                "cache": "hit" if layer.cached else "miss"
+            })
+    report(progress=92, message="Building preview")
+    with span("preview"):
+        ensure_pyramid(ensure_project_dir(payload.project_id), gcode_id, gcode_path)
+    return {
+        "job_id": job_id,
+        "source_kind": source_kind,
+        "source_file_id": payload.file_id,
+        "ingest_svg_id": working_svg_id,
+        "processed_svg_id": processed_svg_id,
+        "gcode_id": gcode_id,
+        "layers": layers,
+        "vertices_before": vertices_before,
+        "vertices_after": vertices_after,
+        "cache": cache,
+        "status": "completed"
+    }
+
 
+def run_pipeline_job(job_id: str, payload: PipelineJobRequest) -> None:
+    update_job(job_id, status="running", progress=5, message="Starting job")
+    try:
+        run = execute_pipeline(job_id, payload, lambda **changes: update_job(job_id, **changes))
+    except Exception:
+        observe_failed_run()
+        raise
+    observe_run(run)
+    append_run(payload.project_id, run)
     update_job(
         job_id,
         status="completed",
         progress=100,
         message="Pipeline completed",
-        result={"gcode_id": gcode_id}
+        result={
+            "gcode_id": run["gcode_id"],
+            "layers": run["layers"],
+            "cache": dict(run["cache"]),
+            "duration_s": run["duration_s"],
+            "timings": run["timings"]
+        }
     )
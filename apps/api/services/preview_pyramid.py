@@ -0,0 +1,130 @@
+from __future__ import annotations
+
+from pathlib import Path
+from uuid import uuid4
+import math
+import os
+import struct
+
+import numpy as np
+
+from services.gcode_parser import GcodeMoves, encode_preview, parse_gcode_file, preview_meta
+
+PYRAMID_MAGIC = b"VPYR"
+PYRAMID_VERSION = 2
+PYRAMID_BASE_PIXELS = 4096
+PYRAMID_MIN_POINTS = 2048
+PYRAMID_MAX_LEVELS = 12
+_PYRAMID_HEADER = struct.Struct("<4sHH")
+_LEVEL_ENTRY = struct.Struct("<QQId")
+
+
+def simplify_moves(moves: GcodeMoves, tolerance: float) -> GcodeMoves:
+    if moves.count < 3 or tolerance <= 0:
+        return moves
+    # drop consecutive moves that stay inside one tolerance-sized cell, but never
+    # the first or last move of a pen-up/pen-down run
+    cell = tolerance / math.sqrt(2)
+    qx = np.floor(moves.x / cell).astype(np.int64)
+    qy = np.floor(moves.y / cell).astype(np.int64)
+    pen = moves.pen
+    keep = np.ones(moves.count, dtype=bool)
+    keep[1:] = (qx[1:] != qx[:-1]) | (qy[1:] != qy[:-1]) | (pen[1:] != pen[:-1])
+    keep[:-1] |= pen[:-1] != pen[1:]
+    keep[-1] = True
+    return GcodeMoves(
+        x=moves.x[keep],
+        y=moves.y[keep],
+        pen=pen[keep],
+        distance=moves.distance,
+        pen_lifts=moves.pen_lifts
+    )
+
+
+def build_levels(moves: GcodeMoves) -> list[tuple[float, GcodeMoves]]:
+    levels = [(0.0, moves)]
+    if moves.count <= PYRAMID_MIN_POINTS:
+        return levels
+    extent = max(float(np.ptp(moves.x)), float(np.ptp(moves.y)), 1e-9)
+    tolerance = extent / PYRAMID_BASE_PIXELS
+    current = moves
+    while current.count > PYRAMID_MIN_POINTS and len(levels) < PYRAMID_MAX_LEVELS and tolerance <= extent:
+        coarser = simplify_moves(current, tolerance)
+        tolerance *= 2
+        if coarser.count > current.count * 0.9:
+            continue
+        levels.append((tolerance / 2, coarser))
+        current = coarser
+    return levels
+
+
+def pyramid_path(project_dir: Path, gcode_id: str) -> Path:
+    return project_dir / "previews" / f"{gcode_id}.vpyr"
+
+
+def write_pyramid(path: Path, moves: GcodeMoves) -> None:
+    meta = preview_meta(moves)
+    levels = build_levels(moves)
+    blobs = [encode_preview(level_moves, meta) for _, level_moves in levels]
+    offset = _PYRAMID_HEADER.size + _LEVEL_ENTRY.size * len(levels)
+    index = []
+    for (tolerance, level_moves), blob in zip(levels, blobs):
+        index.append(_LEVEL_ENTRY.pack(offset, len(blob), level_moves.count, tolerance))
+        offset += len(blob)
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{uuid4().hex}.tmp")
+    try:
+        with tmp_path.open("wb") as f:
+            f.write(_PYRAMID_HEADER.pack(PYRAMID_MAGIC, PYRAMID_VERSION, len(levels)))
+            f.writelines(index)
+            f.writelines(blobs)
+        os.replace(tmp_path, path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+
+def _is_current(path: Path) -> bool:
+    try:
+        with path.open("rb") as f:
+            magic, version, _ = _PYRAMID_HEADER.unpack(f.read(_PYRAMID_HEADER.size))
+    except (OSError, struct.error):
+        return False
+    return magic == PYRAMID_MAGIC and version == PYRAMID_VERSION
+
+
+def ensure_pyramid(project_dir: Path, gcode_id: str, gcode_path: Path) -> Path:
+    # pyramids from older versions carry stale metadata, so they are rebuilt in place
+    path = pyramid_path(project_dir, gcode_id)
+    if not _is_current(path):
+        write_pyramid(path, parse_gcode_file(gcode_path))
+    return path
+
+
+def read_level_index(path: Path) -> list[tuple[int, int, int, float]]:
+    with path.open("rb") as f:
+        magic, version, count = _PYRAMID_HEADER.unpack(f.read(_PYRAMID_HEADER.size))
+        if magic != PYRAMID_MAGIC or version != PYRAMID_VERSION:
+            raise ValueError("Not a Vectra preview pyramid")
+        data = f.read(_LEVEL_ENTRY.size * count)
+    return [_LEVEL_ENTRY.unpack_from(data, i * _LEVEL_ENTRY.size) for i in range(count)]
+
+
+def select_level(index: list[tuple[int, int, int, float]], level: int | None, max_points: int | None) -> int:
+    if level is not None:
+        return min(level, len(index) - 1)
+    if max_points is not None:
+        for i, (_, _, count, _) in enumerate(index):
+            if count <= max_points:
+                return i
+        return len(index) - 1
+    return 0
+
+
+def read_level(path: Path, level: int | None = None, max_points: int | None = None) -> tuple[bytes, int, int]:
+    index = read_level_index(path)
+    selected = select_level(index, level, max_points)
+    offset, length, _, _ = index[selected]
+    with path.open("rb") as f:
+        f.seek(offset)
+        return f.read(length), selected, len(index)
@@ -0,0 +1,121 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from pathlib import Path
+import math
+
+import numpy as np
+
+from services.stage_cache import run_cached_stage
+
+
+@dataclass
+class RasterPreprocessOptions:
+    plot_width_mm: float = 0.0
+    pen_width_mm: float = 0.3
+    samples_per_pen: float = 2.0
+    quantize_colors: int = 0
+    threshold: int | None = None
+    denoise: int = 0
+
+    @property
+    def is_noop(self) -> bool:
+        return (
+            self.plot_width_mm <= 0
+            and self.quantize_colors <= 0
+            and self.threshold is None
+            and self.denoise <= 1
+        )
+
+    def target_width(self) -> int | None:
+        if self.plot_width_mm <= 0 or self.pen_width_mm <= 0:
+            return None
+        return max(1, math.ceil(self.plot_width_mm / self.pen_width_mm * self.samples_per_pen))
+
+
+def _open_rgb(input_path: Path, target_width: int | None):
+    from PIL import Image
+
+    with Image.open(input_path) as source:
+        if target_width is not None and target_width < source.width:
+            size = (target_width, max(1, round(source.height * target_width / source.width)))
+            # lets the JPEG decoder skip straight to a reduced scale instead of decoding every pixel
+            source.draft("RGB", size)
+        has_alpha = source.mode in ("RGBA", "LA", "PA") or "transparency" in source.info
+        image = source.convert("RGBA" if has_alpha else "RGB")
+
+    if target_width is not None and target_width < image.width:
+        size = (target_width, max(1, round(image.height * target_width / image.width)))
+        image = image.resize(size, Image.Resampling.LANCZOS, reducing_gap=3.0)
+    return image, has_alpha
+
+
+def _filter_and_save(image, has_alpha: bool, output_path: Path, denoise: int, threshold: int | None, quantize_colors: int) -> None:
+    from PIL import Image, ImageFilter
+
+    alpha = image.getchannel("A") if has_alpha else None
+    rgb = image.convert("RGB") if has_alpha else image
+
+    if denoise > 1:
+        size = denoise | 1
+        rgb = rgb.filter(ImageFilter.MedianFilter(size))
+        if alpha is not None:
+            alpha = alpha.filter(ImageFilter.MedianFilter(size))
+
+    if threshold is not None:
+        gray = np.asarray(rgb.convert("L"))
+        binary = np.where(gray >= threshold, 255, 0).astype(np.uint8)
+        rgb = Image.fromarray(binary, mode="L").convert("RGB")
+    elif quantize_colors > 0:
+        colors = max(2, min(256, quantize_colors))
+        rgb = rgb.quantize(colors=colors, method=Image.Quantize.MEDIANCUT, dither=Image.Dither.NONE).convert("RGB")
+
+    if alpha is not None:
+        rgb.putalpha(alpha)
+    rgb.save(output_path, format="PNG", compress_level=1)
+
+
+def preprocess_raster(input_path: Path, output_path: Path, options: RasterPreprocessOptions) -> None:
+    image, has_alpha = _open_rgb(input_path, options.target_width())
+    _filter_and_save(image, has_alpha, output_path, options.denoise, options.threshold, options.quantize_colors)
+
+
+@dataclass
+class RasterProxyOptions:
+    max_size: int = 512
+    quantize_colors: int = 0
+    threshold: int | None = None
+    denoise: int = 0
+
+
+def build_proxy_raster(input_path: Path, output_path: Path, options: RasterProxyOptions) -> None:
+    # a small stand-in for the source, with the preset's colour filters already applied,
+    # for trying out vectorize settings quickly
+    from PIL import Image
+
+    with Image.open(input_path) as source:
+        width, height = source.size
+    image, has_alpha = _open_rgb(input_path, max(1, round(width * min(1.0, options.max_size / max(width, height)))))
+    _filter_and_save(image, has_alpha, output_path, options.denoise, options.threshold, options.quantize_colors)
+
+
+def run_proxy_stage(input_path: Path, options: RasterProxyOptions) -> tuple[Path, bool]:
+    return run_cached_stage(
+        "raster-proxy",
+        input_path,
+        options,
+        ".png",
+        lambda out: build_proxy_raster(input_path, out, options)
+    )
+
+
+def run_preprocess_stage(input_path: Path, options: RasterPreprocessOptions) -> tuple[Path, bool | None]:
+    if options.is_noop:
+        return input_path, None
+    return run_cached_stage(
+        "preprocess",
+        input_path,
+        options,
+        ".png",
+        lambda out: preprocess_raster(input_path, out, options)
+    )
@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+from dataclasses import asdict, is_dataclass
+from pathlib import Path
+from threading import Lock
+from typing import Any, Callable
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+CACHE_ROOT = Path("data/cache/stages")
+CACHE_MAX_BYTES = int(os.environ.get("VECTRA_STAGE_CACHE_MAX_BYTES", str(2 * 1024 ** 3)))
+
+_evict_lock = Lock()
+
+
+def _normalize_options(options: Any) -> str:
+    if is_dataclass(options):
+        options = asdict(options)
+    return json.dumps(options, sort_keys=True, separators=(",", ":"), default=str)
+
+
+def stage_key(stage: str, input_path: Path, options: Any = None) -> str:
+    digest = hashlib.sha256()
+    digest.update(stage.encode())
+    digest.update(b"\0")
+    digest.update(_normalize_options(options).encode())
+    digest.update(b"\0")
+    with Path(input_path).open("rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _entry_path(key: str, suffix: str) -> Path:
+    return CACHE_ROOT / key[:2] / f"{key}{suffix}"
+
+
+def run_cached_stage(
+    stage: str,
+    input_path: Path,
+    options: Any,
+    suffix: str,
+    run: Callable[[Path], None]
+) -> tuple[Path, bool]:
+    key = stage_key(stage, input_path, options)
+    entry = _entry_path(key, suffix)
+    try:
+        os.utime(entry)
+        return entry, True
+    except FileNotFoundError:
+        pass
+
+    entry.parent.mkdir(parents=True, exist_ok=True)
+    work_dir = Path(tempfile.mkdtemp(prefix=f"{stage}-", dir=entry.parent))
+    try:
+        output_path = work_dir / f"output{suffix}"
+        run(output_path)
+        if not output_path.exists():
+            raise RuntimeError(f"Stage {stage} produced no output")
+        os.replace(output_path, entry)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    evict_stage_cache(keep=entry)
+    return entry, False
+
+
+def evict_stage_cache(max_bytes: int | None = None, keep: Path | None = None) -> int:
+    limit = CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    if not CACHE_ROOT.exists():
+        return 0
+    with _evict_lock:
+        entries = []
+        total = 0
+        for bucket in os.scandir(CACHE_ROOT):
+            if not bucket.is_dir():
+                continue
+            for item in os.scandir(bucket.path):
+                if not item.is_file():
+                    continue
+                stat = item.stat()
+                entries.append((stat.st_mtime, stat.st_size, item.path))
+                total += stat.st_size
+        removed = 0
+        keep_path = str(keep) if keep is not None else None
+        for _, size, path in sorted(entries):
+            if total <= limit:
+                break
+            if path == keep_path:
+                continue
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                continue
+            total -= size
+            removed += 1
+        return removed
@@ -1,80 +1,195 @@
+from contextlib import contextmanager
 from pathlib import Path
 from uuid import uuid4
+import hashlib
+import os
 import shutil
-from typing import Optional
+from typing import Callable, Optional
 import json
 from datetime import datetime, timezone
 
+from services.artifact_variants import available_encodings, schedule_variants, variant_path
+from services.blob_store import blob_transaction, release_blob, store_blob
+from services.instrumentation import traced
+from services.manifest import (
+    ARTIFACT_KINDS,
+    find_by_hash,
+    hash_file,
+    insert_runs,
+    list_artifact_page,
+    list_runs,
+    lookup_artifact,
+    lookup_artifact_record,
+    manifest_transaction,
+    manifest_versions,
+    prune_runs,
+    record_artifact,
+    remove_artifact
+)
+from services.preview_pyramid import pyramid_path
+
 DATA_ROOT = Path("data/projects")
+# number of runs kept per project; 0 keeps the full history
+RUN_RETENTION = int(os.environ.get("VECTRA_RUN_RETENTION", "0"))
+_known_project_dirs: set[Path] = set()
 
 
 def ensure_project_dir(project_id: str) -> Path:
     project_dir = DATA_ROOT / project_id
+    if project_dir in _known_project_dirs:
+        return project_dir
     project_dir.mkdir(parents=True, exist_ok=True)
     (project_dir / "source").mkdir(exist_ok=True)
     (project_dir / "intermediate").mkdir(exist_ok=True)
     (project_dir / "outputs").mkdir(exist_ok=True)
+    _known_project_dirs.add(project_dir)
     return project_dir
 
 
+@contextmanager
+def staged_output(path: Path):
+    # working files in a project dir are swapped in whole rather than rewritten: a manifest
+    # rescan may have adopted the previous file into the blob store, and writing through
+    # that link would change every artifact sharing the blob
+    tmp_path = path.with_name(f".{uuid4().hex}-{path.name}")
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+
 def create_project() -> str:
     project_id = uuid4().hex
     ensure_project_dir(project_id)
     return project_id
 
 
-def save_upload(project_id: str, filename: str, file_obj) -> str:
+@traced("storage.save")
+def _save_artifact(
+    project_id: str,
+    kind: str,
+    filename: str,
+    fill: Callable[[Path], str],
+    dedupe: bool = False
+) -> str:
     file_id = uuid4().hex
     project_dir = ensure_project_dir(project_id)
-    dest_path = project_dir / "source" / f"{file_id}_{filename}"
-    with dest_path.open("wb") as f:
-        shutil.copyfileobj(file_obj, f)
+    dest_path = project_dir / kind / f"{file_id}_{filename}"
+    tmp_path = project_dir / kind / f".{file_id}.tmp"
+    try:
+        content_hash = fill(tmp_path)
+        with manifest_transaction(project_dir) as conn:
+            existing = find_by_hash(conn, kind, content_hash) if dedupe else None
+            if existing is not None and (project_dir / kind / existing[1]).exists():
+                return existing[0]
+            record_artifact(conn, kind, file_id, dest_path.name, tmp_path.stat().st_size, content_hash)
+            # project files are links into the content-addressed store, so identical bytes
+            # occupy disk once no matter how many runs produce them
+            with blob_transaction() as blobs:
+                store_blob(blobs, tmp_path, content_hash, dest_path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+    if kind != "source":
+        schedule_variants(dest_path)
     return file_id
 
 
+def _write_bytes(data: bytes) -> Callable[[Path], str]:
+    def fill(path: Path) -> str:
+        path.write_bytes(data)
+        return hashlib.sha256(data).hexdigest()
+    return fill
+
+
+def _copy_or_link(source_path: Path, link: bool) -> Callable[[Path], str]:
+    def fill(path: Path) -> str:
+        if link:
+            try:
+                os.link(source_path, path)
+                return hash_file(path)
+            except OSError:
+                pass
+        shutil.copyfile(source_path, path)
+        return hash_file(path)
+    return fill
+
+
+def save_upload(project_id: str, filename: str, file_obj) -> str:
+    def fill(path: Path) -> str:
+        digest = hashlib.sha256()
+        with path.open("wb") as f:
+            for chunk in iter(lambda: file_obj.read(1024 * 1024), b""):
+                digest.update(chunk)
+                f.write(chunk)
+        return digest.hexdigest()
+    return _save_artifact(project_id, "source", filename, fill, dedupe=True)
+
+
+def save_staged_upload(project_id: str, filename: str, staged_path: Path, sha256: str) -> str:
+    def fill(path: Path) -> str:
+        os.replace(staged_path, path)
+        return sha256
+    try:
+        return _save_artifact(project_id, "source", filename, fill, dedupe=True)
+    finally:
+        staged_path.unlink(missing_ok=True)
+
+
 def save_intermediate(project_id: str, filename: str, content: str) -> str:
-    file_id = uuid4().hex
-    project_dir = ensure_project_dir(project_id)
-    dest_path = project_dir / "intermediate" / f"{file_id}_{filename}"
-    dest_path.write_text(content)
-    return file_id
+    return _save_artifact(project_id, "intermediate", filename, _write_bytes(content.encode()))
 
 
-def save_intermediate_file(project_id: str, filename: str, source_path: Path) -> str:
-    file_id = uuid4().hex
-    project_dir = ensure_project_dir(project_id)
-    dest_path = project_dir / "intermediate" / f"{file_id}_{filename}"
-    shutil.copyfile(source_path, dest_path)
-    return file_id
+def save_intermediate_file(project_id: str, filename: str, source_path: Path, link: bool = False) -> str:
+    return _save_artifact(project_id, "intermediate", filename, _copy_or_link(source_path, link))
 
 
 def save_output(project_id: str, filename: str, content: str) -> str:
-    file_id = uuid4().hex
-    project_dir = ensure_project_dir(project_id)
-    dest_path = project_dir / "outputs" / f"{file_id}_{filename}"
-    dest_path.write_text(content)
-    return file_id
+    return _save_artifact(project_id, "outputs", filename, _write_bytes(content.encode()))
+
 
+def save_output_file(project_id: str, filename: str, source_path: Path, link: bool = False) -> str:
+    return _save_artifact(project_id, "outputs", filename, _copy_or_link(source_path, link))
 
+
+@traced("storage.lookup")
 def find_source_file(project_id: str, file_id: str) -> Optional[Path]:
-    project_dir = ensure_project_dir(project_id)
-    source_dir = project_dir / "source"
-    matches = list(source_dir.glob(f"{file_id}_*"))
-    return matches[0] if matches else None
+    return lookup_artifact(DATA_ROOT / project_id, "source", file_id)
 
 
+@traced("storage.lookup")
 def find_output_file(project_id: str, file_id: str) -> Optional[Path]:
-    project_dir = ensure_project_dir(project_id)
-    output_dir = project_dir / "outputs"
-    matches = list(output_dir.glob(f"{file_id}_*"))
-    return matches[0] if matches else None
+    return lookup_artifact(DATA_ROOT / project_id, "outputs", file_id)
 
 
+@traced("storage.lookup")
 def find_intermediate_file(project_id: str, file_id: str) -> Optional[Path]:
-    project_dir = ensure_project_dir(project_id)
-    intermediate_dir = project_dir / "intermediate"
-    matches = list(intermediate_dir.glob(f"{file_id}_*"))
-    return matches[0] if matches else None
+    return lookup_artifact(DATA_ROOT / project_id, "intermediate", file_id)
+
+
+def find_artifact(project_id: str, kind: str, file_id: str) -> Optional[tuple[Path, Optional[str]]]:
+    return lookup_artifact_record(DATA_ROOT / project_id, kind, file_id)
+
+
+def delete_artifact(project_id: str, kind: str, file_id: str) -> bool:
+    project_dir = DATA_ROOT / project_id
+    if not project_dir.exists():
+        return False
+    with manifest_transaction(project_dir) as conn:
+        removed = remove_artifact(conn, kind, file_id)
+        if removed is None:
+            return False
+        name, content_hash = removed
+        path = project_dir / kind / name
+        path.unlink(missing_ok=True)
+        for encoding in available_encodings():
+            variant_path(path, encoding).unlink(missing_ok=True)
+        if kind == "outputs":
+            pyramid_path(project_dir, file_id).unlink(missing_ok=True)
+        if content_hash:
+            with blob_transaction() as blobs:
+                release_blob(blobs, content_hash)
+    return True
 
 
 def load_presets(project_id: str) -> list:
@@ -94,48 +209,83 @@ def save_presets(project_id: str, presets: list) -> None:
     preset_path.write_text(json.dumps(presets, indent=2))
 
 
-def _list_dir_items(path: Path) -> list[dict]:
-    if not path.exists():
-        return []
-    items = []
-    for p in sorted(path.iterdir(), key=lambda x: x.name.lower()):
-        if p.is_file():
-            items.append(
-                {
-                    "id": p.name.split("_", 1)[0] if "_" in p.name else p.stem,
-                    "name": p.name,
-                    "size": p.stat().st_size
-                }
-            )
-    return items
-
-
-def load_project_tree(project_id: str) -> dict:
+def load_project_tree(
+    project_id: str,
+    kind: Optional[str] = None,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None
+) -> dict:
+    # served from the manifest, which every save_* and delete keeps current, instead of
+    # listing and stat()ing the project directories
+    if cursor is not None and kind is None:
+        raise ValueError("cursor requires kind")
     project_dir = ensure_project_dir(project_id)
-    return {
-        "project_id": project_id,
-        "source": _list_dir_items(project_dir / "source"),
-        "intermediate": _list_dir_items(project_dir / "intermediate"),
-        "outputs": _list_dir_items(project_dir / "outputs")
-    }
+    tree: dict = {"project_id": project_id}
+    next_cursors = {}
+    for item_kind in ARTIFACT_KINDS if kind is None else (kind,):
+        rows = list_artifact_page(project_dir, item_kind, None if limit is None else limit + 1, cursor)
+        items = [{"id": file_id, "name": name, "size": size} for file_id, name, size in rows[:limit]]
+        tree[item_kind] = items
+        next_cursors[item_kind] = items[-1]["name"] if limit is not None and len(rows) > limit else None
+    if limit is not None:
+        tree["next_cursor"] = next_cursors
+    return tree
 
 
-def load_runs(project_id: str) -> list:
+def project_versions(project_id: str) -> dict[str, int]:
     project_dir = ensure_project_dir(project_id)
+    _ensure_run_log(project_dir)
+    return manifest_versions(project_dir)
+
+
+def _import_legacy_runs(project_dir: Path, conn) -> None:
+    # runs.json (newest first, capped at 100) predates the manifest run log
     runs_path = project_dir / "runs.json"
     if not runs_path.exists():
-        return []
+        return
     try:
         data = json.loads(runs_path.read_text())
-        return data if isinstance(data, list) else []
     except json.JSONDecodeError:
-        return []
+        data = []
+    if isinstance(data, list):
+        insert_runs(conn, [
+            (str(run.get("created_at", "")), json.dumps({k: v for k, v in run.items() if k != "created_at"}))
+            for run in reversed(data)
+            if isinstance(run, dict)
+        ])
+    os.replace(runs_path, runs_path.with_name("runs.json.imported"))
 
 
-def append_run(project_id: str, run: dict) -> None:
+def _ensure_run_log(project_dir: Path) -> None:
+    if (project_dir / "runs.json").exists():
+        with manifest_transaction(project_dir) as conn:
+            _import_legacy_runs(project_dir, conn)
+
+
+def load_runs_page(project_id: str, limit: int = 100, cursor: int | None = None) -> tuple[list[dict], int | None]:
     project_dir = ensure_project_dir(project_id)
-    runs_path = project_dir / "runs.json"
-    runs = load_runs(project_id)
-    stamped = {"created_at": datetime.now(timezone.utc).isoformat(), **run}
-    runs.insert(0, stamped)
-    runs_path.write_text(json.dumps(runs[:100], indent=2))
+    _ensure_run_log(project_dir)
+    rows = list_runs(project_dir, max(1, limit) + 1, cursor)
+    runs = [{"seq": seq, "created_at": created_at, **json.loads(data)} for seq, created_at, data in rows[:max(1, limit)]]
+    next_cursor = runs[-1]["seq"] if len(rows) > len(runs) else None
+    return runs, next_cursor
+
+
+def load_runs(project_id: str, limit: int = 100, cursor: int | None = None) -> list:
+    return load_runs_page(project_id, limit, cursor)[0]
+
+
+def append_runs(project_id: str, new_runs: list[dict]) -> None:
+    if not new_runs:
+        return
+    project_dir = ensure_project_dir(project_id)
+    created_at = datetime.now(timezone.utc).isoformat()
+    with manifest_transaction(project_dir) as conn:
+        _import_legacy_runs(project_dir, conn)
+        insert_runs(conn, [(created_at, json.dumps(run)) for run in new_runs])
+        if RUN_RETENTION > 0:
+            prune_runs(conn, RUN_RETENTION)
+
+
+def append_run(project_id: str, run: dict) -> None:
+    append_runs(project_id, [run])
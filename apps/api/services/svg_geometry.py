@@ -0,0 +1,413 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from pathlib import Path
+import math
+import re
+import xml.etree.ElementTree as ET
+
+import numpy as np
+
+
+SVG_NS = "http://www.w3.org/2000/svg"
+INKSCAPE_NS = "http://www.inkscape.org/namespaces/inkscape"
+
+_NUMBER_RE = re.compile(r"[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?")
+_PATH_TOKEN_RE = re.compile(r"([MmLlHhVvCcSsQqTtAaZz])|([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)")
+_TRANSFORM_RE = re.compile(r"(matrix|translate|scale|rotate|skewX|skewY)\s*\(([^)]*)\)")
+_CURVE_STEPS = 8
+
+Affine = tuple[float, float, float, float, float, float]
+_IDENTITY: Affine = (1.0, 0.0, 0.0, 1.0, 0.0, 0.0)
+
+
+@dataclass
+class Polyline:
+    points: np.ndarray
+    layer: str = ""
+    color: str | None = None
+
+    @property
+    def start(self) -> np.ndarray:
+        return self.points[0]
+
+    @property
+    def end(self) -> np.ndarray:
+        return self.points[-1]
+
+
+@dataclass
+class SvgDocument:
+    paths: list[Polyline] = field(default_factory=list)
+    width: str | None = None
+    height: str | None = None
+    view_box: str | None = None
+
+    @property
+    def vertex_count(self) -> int:
+        return sum(len(p.points) for p in self.paths)
+
+
+def _local(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1]
+
+
+def _numbers(text: str | None) -> list[float]:
+    if not text:
+        return []
+    return [float(v) for v in _NUMBER_RE.findall(text)]
+
+
+def _compose(outer: Affine, inner: Affine) -> Affine:
+    a1, b1, c1, d1, e1, f1 = outer
+    a2, b2, c2, d2, e2, f2 = inner
+    return (
+        a1 * a2 + c1 * b2,
+        b1 * a2 + d1 * b2,
+        a1 * c2 + c1 * d2,
+        b1 * c2 + d1 * d2,
+        a1 * e2 + c1 * f2 + e1,
+        b1 * e2 + d1 * f2 + f1
+    )
+
+
+def parse_transform(text: str | None) -> Affine:
+    result = _IDENTITY
+    if not text:
+        return result
+    for name, args in _TRANSFORM_RE.findall(text):
+        values = _numbers(args)
+        if name == "matrix" and len(values) == 6:
+            step = tuple(values)
+        elif name == "translate" and values:
+            step = (1.0, 0.0, 0.0, 1.0, values[0], values[1] if len(values) > 1 else 0.0)
+        elif name == "scale" and values:
+            sy = values[1] if len(values) > 1 else values[0]
+            step = (values[0], 0.0, 0.0, sy, 0.0, 0.0)
+        elif name == "rotate" and values:
+            angle = math.radians(values[0])
+            cos, sin = math.cos(angle), math.sin(angle)
+            step = (cos, sin, -sin, cos, 0.0, 0.0)
+            if len(values) == 3:
+                cx, cy = values[1], values[2]
+                step = _compose((1.0, 0.0, 0.0, 1.0, cx, cy), _compose(step, (1.0, 0.0, 0.0, 1.0, -cx, -cy)))
+        elif name == "skewX" and values:
+            step = (1.0, 0.0, math.tan(math.radians(values[0])), 1.0, 0.0, 0.0)
+        elif name == "skewY" and values:
+            step = (1.0, math.tan(math.radians(values[0])), 0.0, 1.0, 0.0, 0.0)
+        else:
+            continue
+        result = _compose(result, step)
+    return result
+
+
+def _apply(points: np.ndarray, transform: Affine) -> np.ndarray:
+    if transform == _IDENTITY:
+        return points
+    a, b, c, d, e, f = transform
+    out = np.empty_like(points)
+    out[:, 0] = a * points[:, 0] + c * points[:, 1] + e
+    out[:, 1] = b * points[:, 0] + d * points[:, 1] + f
+    return out
+
+
+def _cubic(p0, p1, p2, p3) -> list[tuple[float, float]]:
+    pts = []
+    for i in range(1, _CURVE_STEPS + 1):
+        t = i / _CURVE_STEPS
+        mt = 1 - t
+        pts.append((
+            mt ** 3 * p0[0] + 3 * mt ** 2 * t * p1[0] + 3 * mt * t ** 2 * p2[0] + t ** 3 * p3[0],
+            mt ** 3 * p0[1] + 3 * mt ** 2 * t * p1[1] + 3 * mt * t ** 2 * p2[1] + t ** 3 * p3[1]
+        ))
+    return pts
+
+
+def _quadratic(p0, p1, p2) -> list[tuple[float, float]]:
+    pts = []
+    for i in range(1, _CURVE_STEPS + 1):
+        t = i / _CURVE_STEPS
+        mt = 1 - t
+        pts.append((
+            mt ** 2 * p0[0] + 2 * mt * t * p1[0] + t ** 2 * p2[0],
+            mt ** 2 * p0[1] + 2 * mt * t * p1[1] + t ** 2 * p2[1]
+        ))
+    return pts
+
+
+def _arc(p0, rx, ry, phi_deg, large_arc, sweep, p1) -> list[tuple[float, float]]:
+    if rx == 0 or ry == 0 or p0 == p1:
+        return [p1]
+    rx, ry = abs(rx), abs(ry)
+    phi = math.radians(phi_deg)
+    cos_phi, sin_phi = math.cos(phi), math.sin(phi)
+    dx, dy = (p0[0] - p1[0]) / 2, (p0[1] - p1[1]) / 2
+    x1p = cos_phi * dx + sin_phi * dy
+    y1p = -sin_phi * dx + cos_phi * dy
+    scale = (x1p ** 2) / (rx ** 2) + (y1p ** 2) / (ry ** 2)
+    if scale > 1:
+        rx *= math.sqrt(scale)
+        ry *= math.sqrt(scale)
+    num = rx ** 2 * ry ** 2 - rx ** 2 * y1p ** 2 - ry ** 2 * x1p ** 2
+    den = rx ** 2 * y1p ** 2 + ry ** 2 * x1p ** 2
+    coef = math.sqrt(max(0.0, num / den)) if den else 0.0
+    if large_arc == sweep:
+        coef = -coef
+    cxp = coef * rx * y1p / ry
+    cyp = -coef * ry * x1p / rx
+    cx = cos_phi * cxp - sin_phi * cyp + (p0[0] + p1[0]) / 2
+    cy = sin_phi * cxp + cos_phi * cyp + (p0[1] + p1[1]) / 2
+    theta1 = math.atan2((y1p - cyp) / ry, (x1p - cxp) / rx)
+    theta2 = math.atan2((-y1p - cyp) / ry, (-x1p - cxp) / rx)
+    delta = theta2 - theta1
+    if sweep and delta < 0:
+        delta += 2 * math.pi
+    elif not sweep and delta > 0:
+        delta -= 2 * math.pi
+    steps = max(2, int(math.ceil(abs(delta) / (math.pi / 8))))
+    pts = []
+    for i in range(1, steps + 1):
+        theta = theta1 + delta * i / steps
+        x = rx * math.cos(theta)
+        y = ry * math.sin(theta)
+        pts.append((cos_phi * x - sin_phi * y + cx, sin_phi * x + cos_phi * y + cy))
+    pts[-1] = p1
+    return pts
+
+
+def parse_path_data(d: str) -> list[list[tuple[float, float]]]:
+    subpaths: list[list[tuple[float, float]]] = []
+    current: list[tuple[float, float]] = []
+    pos = (0.0, 0.0)
+    start = (0.0, 0.0)
+    last_ctrl = None
+    cmd = ""
+    prev_cmd = ""
+    tokens = _PATH_TOKEN_RE.findall(d or "")
+    i = 0
+    while i < len(tokens):
+        letter = tokens[i][0]
+        if letter:
+            cmd = letter
+            i += 1
+            if cmd in "Zz":
+                if len(current) > 1 and current[-1] != start:
+                    current.append(start)
+                if len(current) > 1:
+                    subpaths.append(current)
+                current = []
+                pos = start
+                prev_cmd = cmd
+                last_ctrl = None
+                continue
+        need = _ARG_COUNTS.get(cmd.upper(), 0)
+        if need == 0:
+            i += 1
+            continue
+        args: list[float] = []
+        while len(args) < need and i < len(tokens) and not tokens[i][0]:
+            args.append(float(tokens[i][1]))
+            i += 1
+        if len(args) < need:
+            continue
+        rel = cmd.islower()
+        ox, oy = pos if rel else (0.0, 0.0)
+        upper = cmd.upper()
+        if upper == "M":
+            if len(current) > 1:
+                subpaths.append(current)
+            pos = (args[0] + ox, args[1] + oy)
+            start = pos
+            current = [pos]
+            cmd = "l" if rel else "L"
+            last_ctrl = None
+            prev_cmd = "M"
+            continue
+        if not current:
+            current = [pos]
+        if upper == "L":
+            pos = (args[0] + ox, args[1] + oy)
+            current.append(pos)
+            last_ctrl = None
+        elif upper == "H":
+            pos = (args[0] + ox, pos[1])
+            current.append(pos)
+            last_ctrl = None
+        elif upper == "V":
+            pos = (pos[0], args[0] + oy)
+            current.append(pos)
+            last_ctrl = None
+        elif upper in ("C", "S"):
+            if upper == "C":
+                c1 = (args[0] + ox, args[1] + oy)
+                c2 = (args[2] + ox, args[3] + oy)
+                end = (args[4] + ox, args[5] + oy)
+            else:
+                if last_ctrl is not None and prev_cmd.upper() in ("C", "S"):
+                    c1 = (2 * pos[0] - last_ctrl[0], 2 * pos[1] - last_ctrl[1])
+                else:
+                    c1 = pos
+                c2 = (args[0] + ox, args[1] + oy)
+                end = (args[2] + ox, args[3] + oy)
+            current.extend(_cubic(pos, c1, c2, end))
+            last_ctrl = c2
+            pos = end
+        elif upper in ("Q", "T"):
+            if upper == "Q":
+                c1 = (args[0] + ox, args[1] + oy)
+                end = (args[2] + ox, args[3] + oy)
+            else:
+                if last_ctrl is not None and prev_cmd.upper() in ("Q", "T"):
+                    c1 = (2 * pos[0] - last_ctrl[0], 2 * pos[1] - last_ctrl[1])
+                else:
+                    c1 = pos
+                end = (args[0] + ox, args[1] + oy)
+            current.extend(_quadratic(pos, c1, end))
+            last_ctrl = c1
+            pos = end
+        elif upper == "A":
+            end = (args[5] + ox, args[6] + oy)
+            current.extend(_arc(pos, args[0], args[1], args[2], bool(args[3]), bool(args[4]), end))
+            last_ctrl = None
+            pos = end
+        prev_cmd = cmd
+    if len(current) > 1:
+        subpaths.append(current)
+    return subpaths
+
+
+_ARG_COUNTS = {"M": 2, "L": 2, "H": 1, "V": 1, "C": 6, "S": 4, "Q": 4, "T": 2, "A": 7, "Z": 0}
+
+
+def _ellipse(cx: float, cy: float, rx: float, ry: float) -> list[tuple[float, float]]:
+    steps = 32
+    pts = [
+        (cx + rx * math.cos(2 * math.pi * i / steps), cy + ry * math.sin(2 * math.pi * i / steps))
+        for i in range(steps)
+    ]
+    pts.append(pts[0])
+    return pts
+
+
+def _element_subpaths(elem: ET.Element, tag: str) -> list[list[tuple[float, float]]]:
+    get = elem.attrib.get
+    if tag == "path":
+        return parse_path_data(get("d", ""))
+    if tag in ("polyline", "polygon"):
+        values = _numbers(get("points"))
+        pts = list(zip(values[0::2], values[1::2]))
+        if tag == "polygon" and len(pts) > 1 and pts[0] != pts[-1]:
+            pts.append(pts[0])
+        return [pts] if len(pts) > 1 else []
+    if tag == "line":
+        x1, y1, x2, y2 = (float(get(k, 0)) for k in ("x1", "y1", "x2", "y2"))
+        return [[(x1, y1), (x2, y2)]]
+    if tag == "rect":
+        x, y = float(get("x", 0)), float(get("y", 0))
+        w, h = float(get("width", 0)), float(get("height", 0))
+        if w <= 0 or h <= 0:
+            return []
+        return [[(x, y), (x + w, y), (x + w, y + h), (x, y + h), (x, y)]]
+    if tag == "circle":
+        r = float(get("r", 0))
+        return [_ellipse(float(get("cx", 0)), float(get("cy", 0)), r, r)] if r > 0 else []
+    if tag == "ellipse":
+        rx, ry = float(get("rx", 0)), float(get("ry", 0))
+        return [_ellipse(float(get("cx", 0)), float(get("cy", 0)), rx, ry)] if rx > 0 and ry > 0 else []
+    return []
+
+
+def element_polylines(elem: ET.Element, transform: Affine = _IDENTITY) -> list[np.ndarray]:
+    transform = _compose(transform, parse_transform(elem.attrib.get("transform")))
+    return [_apply(np.asarray(pts, dtype=np.float64), transform) for pts in _element_subpaths(elem, _local(elem.tag))]
+
+
+def element_bounds(elem: ET.Element, transform: Affine = _IDENTITY) -> tuple[float, float, float, float] | None:
+    subpaths = element_polylines(elem, transform)
+    if not subpaths:
+        return None
+    points = np.concatenate(subpaths)
+    (x0, y0), (x1, y1) = points.min(axis=0), points.max(axis=0)
+    return float(x0), float(y0), float(x1), float(y1)
+
+
+def _paint(elem: ET.Element, inherited: str | None) -> str | None:
+    for key in ("stroke", "fill"):
+        value = elem.attrib.get(key)
+        if value and value != "none":
+            return value
+    return inherited
+
+
+def _layer_name(elem: ET.Element, index: int) -> str:
+    return (
+        elem.attrib.get(f"{{{INKSCAPE_NS}}}label")
+        or elem.attrib.get("id")
+        or str(index + 1)
+    )
+
+
+def _walk(elem, transform, layer, color, out: list[Polyline]) -> None:
+    for child in elem:
+        tag = _local(child.tag)
+        if tag in ("defs", "metadata", "title", "desc", "clipPath", "mask", "symbol", "style", "text"):
+            continue
+        child_transform = _compose(transform, parse_transform(child.attrib.get("transform")))
+        child_color = _paint(child, color)
+        if tag == "g":
+            _walk(child, child_transform, layer, child_color, out)
+            continue
+        for pts in _element_subpaths(child, tag):
+            out.append(Polyline(_apply(np.asarray(pts, dtype=np.float64), child_transform), layer, child_color))
+
+
+def read_svg(path: Path) -> SvgDocument:
+    root = ET.parse(path).getroot()
+    doc = SvgDocument(
+        width=root.attrib.get("width"),
+        height=root.attrib.get("height"),
+        view_box=root.attrib.get("viewBox")
+    )
+    group_index = 0
+    for child in root:
+        if _local(child.tag) == "g":
+            transform = parse_transform(child.attrib.get("transform"))
+            _walk(child, transform, _layer_name(child, group_index), _paint(child, None), doc.paths)
+            group_index += 1
+        else:
+            holder = ET.Element("g")
+            holder.append(child)
+            _walk(holder, _IDENTITY, "", None, doc.paths)
+    return doc
+
+
+def _fmt(value: float) -> str:
+    text = f"{value:.4f}".rstrip("0").rstrip(".")
+    return "0" if text in ("", "-0") else text
+
+
+def _escape(value: str) -> str:
+    return value.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;").replace("\"", "&quot;")
+
+
+def render_svg(doc: SvgDocument) -> str:
+    root_attrs = [f"xmlns=\"{SVG_NS}\"", f"xmlns:inkscape=\"{INKSCAPE_NS}\""]
+    for key, value in (("width", doc.width), ("height", doc.height), ("viewBox", doc.view_box)):
+        if value:
+            root_attrs.append(f"{key}=\"{_escape(value)}\"")
+    lines = [f"<svg {' '.join(root_attrs)}>"]
+    layers: dict[str, list[Polyline]] = {}
+    for path in doc.paths:
+        layers.setdefault(path.layer, []).append(path)
+    for index, (layer, paths) in enumerate(layers.items()):
+        label = _escape(layer or str(index + 1))
+        lines.append(
+            f"<g id=\"layer{index + 1}\" inkscape:groupmode=\"layer\" inkscape:label=\"{label}\" fill=\"none\" stroke=\"#000000\">"
+        )
+        for path in paths:
+            points = " ".join(f"{_fmt(x)},{_fmt(y)}" for x, y in path.points)
+            stroke = f" stroke=\"{_escape(path.color)}\"" if path.color else ""
+            lines.append(f"<polyline points=\"{points}\"{stroke}/>")
+        lines.append("</g>")
+    lines.append("</svg>")
+    return "\n".join(lines) + "\n"
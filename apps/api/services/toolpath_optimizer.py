@@ -0,0 +1,265 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+import math
+import time
+
+import numpy as np
+
+from services.svg_geometry import Polyline
+
+
+@dataclass
+class OptimizeOptions:
+    allow_reverse: bool = True
+    merge_tolerance: float = 0.05
+    two_opt_window: int = 32
+    two_opt_passes: int = 2
+    two_opt_budget_s: float = 2.0
+
+
+@dataclass
+class OptimizeStats:
+    path_count_before: int = 0
+    path_count_after: int = 0
+    pen_up_distance_before: float = 0.0
+    pen_up_distance_after: float = 0.0
+    pen_lifts_before: int = 0
+    pen_lifts_after: int = 0
+
+
+def pen_up_distance(paths: list[Polyline], origin: tuple[float, float] = (0.0, 0.0)) -> float:
+    if not paths:
+        return 0.0
+    starts = np.array([p.points[0] for p in paths])
+    ends = np.array([p.points[-1] for p in paths])
+    prev = np.vstack([np.asarray(origin, dtype=np.float64), ends[:-1]])
+    return float(np.hypot(*(starts - prev).T).sum())
+
+
+class _EndpointGrid:
+    def __init__(self, starts: np.ndarray, ends: np.ndarray, allow_reverse: bool):
+        self.count = len(starts)
+        self.starts = starts
+        self.ends = ends
+        self.allow_reverse = allow_reverse
+        self.used = bytearray(self.count)
+        self.remaining = self.count
+        points = np.vstack([starts, ends]) if allow_reverse else starts
+        self.coords = [tuple(p) for p in points.tolist()]
+        self._build(points, np.arange(len(points)))
+
+    def _build(self, points: np.ndarray, entries: np.ndarray) -> None:
+        live = points[entries]
+        lo = live.min(axis=0)
+        span = np.maximum(live.max(axis=0) - lo, 1e-9)
+        self.cell = max(math.sqrt(float(span[0] * span[1]) / self.remaining), float(span.max()) / 4096, 1e-9)
+        self.origin = (float(lo[0]), float(lo[1]))
+        self.max_ring = int(math.ceil(float(span.max()) / self.cell)) + 1
+        self.built_for = self.remaining
+        keys = np.floor((live - lo) / self.cell).astype(np.int64)
+        self.cells: dict[tuple[int, int], list[int]] = {}
+        for entry, key in zip(entries.tolist(), map(tuple, keys.tolist())):
+            self.cells.setdefault(key, []).append(entry)
+
+    def take(self, index: int) -> None:
+        self.used[index] = 1
+        self.remaining -= 1
+        # coarsen the grid as it empties so each lookup keeps touching only a few cells
+        if self.remaining > 64 and self.remaining * 4 < self.built_for:
+            unused = np.flatnonzero(np.frombuffer(self.used, dtype=np.uint8) == 0)
+            entries = np.concatenate([unused, unused + self.count]) if self.allow_reverse else unused
+            self._build(np.vstack([self.starts, self.ends]) if self.allow_reverse else self.starts, entries)
+
+    def _brute_force(self, x: float, y: float) -> tuple[int, bool]:
+        candidates = np.flatnonzero(np.frombuffer(self.used, dtype=np.uint8) == 0)
+        d_start = np.hypot(self.starts[candidates, 0] - x, self.starts[candidates, 1] - y)
+        best = int(np.argmin(d_start))
+        if self.allow_reverse:
+            d_end = np.hypot(self.ends[candidates, 0] - x, self.ends[candidates, 1] - y)
+            best_end = int(np.argmin(d_end))
+            if d_end[best_end] < d_start[best]:
+                return int(candidates[best_end]), True
+        return int(candidates[best]), False
+
+    def nearest(self, x: float, y: float) -> tuple[int, bool]:
+        fx = (x - self.origin[0]) / self.cell
+        fy = (y - self.origin[1]) / self.cell
+        qx = math.floor(fx)
+        qy = math.floor(fy)
+        # distance from the query point to the edge of its own cell, in cell units
+        margin = min(fx - qx, qx + 1 - fx, fy - qy, qy + 1 - fy)
+        count = self.count
+        used = self.used
+        coords = self.coords
+        best_entry = -1
+        best_dist = math.inf
+        ring = 0
+        while ring <= self.max_ring:
+            if (2 * ring + 1) ** 2 > 4 * self.remaining + 64:
+                return self._brute_force(x, y)
+            for key in self._ring_keys(qx, qy, ring):
+                entries = self.cells.get(key)
+                if entries is None:
+                    continue
+                live = [e for e in entries if not used[e % count]]
+                if not live:
+                    del self.cells[key]
+                    continue
+                if len(live) != len(entries):
+                    self.cells[key] = live
+                for entry in live:
+                    px, py = coords[entry]
+                    dist = (px - x) ** 2 + (py - y) ** 2
+                    if dist < best_dist:
+                        best_dist = dist
+                        best_entry = entry
+            if best_entry >= 0 and math.sqrt(best_dist) <= (ring + margin) * self.cell:
+                break
+            ring += 1
+        if best_entry < 0:
+            return self._brute_force(x, y)
+        return best_entry % count, best_entry >= count
+
+    @staticmethod
+    def _ring_keys(qx: int, qy: int, ring: int) -> list[tuple[int, int]]:
+        if ring >= len(_RING_OFFSETS):
+            _RING_OFFSETS.extend(_ring_offsets(r) for r in range(len(_RING_OFFSETS), ring + 1))
+        return [(qx + dx, qy + dy) for dx, dy in _RING_OFFSETS[ring]]
+
+
+def _ring_offsets(ring: int) -> list[tuple[int, int]]:
+    if ring == 0:
+        return [(0, 0)]
+    offsets = []
+    for dx in range(-ring, ring + 1):
+        offsets.append((dx, -ring))
+        offsets.append((dx, ring))
+    for dy in range(-ring + 1, ring):
+        offsets.append((-ring, dy))
+        offsets.append((ring, dy))
+    return offsets
+
+
+_RING_OFFSETS: list[list[tuple[int, int]]] = []
+
+
+def _greedy_order(paths: list[Polyline], start: tuple[float, float], allow_reverse: bool) -> list[tuple[int, bool]]:
+    starts = np.array([p.points[0] for p in paths], dtype=np.float64)
+    ends = np.array([p.points[-1] for p in paths], dtype=np.float64)
+    grid = _EndpointGrid(starts, ends, allow_reverse)
+    order = []
+    start_xy = starts.tolist()
+    end_xy = ends.tolist()
+    x, y = start
+    for _ in range(len(paths)):
+        index, reverse = grid.nearest(x, y)
+        grid.take(index)
+        order.append((index, reverse))
+        x, y = start_xy[index] if reverse else end_xy[index]
+    return order
+
+
+def _two_opt(starts: np.ndarray, ends: np.ndarray, order: np.ndarray, flipped: np.ndarray, origin, options: OptimizeOptions) -> None:
+    n = len(order)
+    if n < 3:
+        return
+    deadline = time.monotonic() + options.two_opt_budget_s
+    window = max(2, options.two_opt_window)
+    for _ in range(options.two_opt_passes):
+        improved = False
+        # seq_s/seq_e hold the oriented start/end of each slot in the current order
+        seq_s = np.where(flipped[:, None], ends[order], starts[order])
+        seq_e = np.where(flipped[:, None], starts[order], ends[order])
+        for i in range(-1, n - 1):
+            if time.monotonic() > deadline:
+                return
+            a = seq_e[i] if i >= 0 else np.asarray(origin, dtype=np.float64)
+            j_hi = min(n, i + 1 + window)
+            js = np.arange(i + 1, j_hi)
+            if not len(js):
+                continue
+            s_next = seq_s[i + 1]
+            d_old_first = math.hypot(*(a - s_next))
+            tail = js + 1 < n
+            nxt = np.where(tail, js + 1, js)
+            old_second = np.where(tail, np.hypot(*(seq_e[js] - seq_s[nxt]).T), 0.0)
+            new_first = np.hypot(*(seq_e[js] - a).T)
+            new_second = np.where(tail, np.hypot(*(seq_s[nxt] - s_next).T), 0.0)
+            delta = new_first + new_second - d_old_first - old_second
+            k = int(np.argmin(delta))
+            if delta[k] < -1e-9:
+                j = int(js[k])
+                order[i + 1:j + 1] = order[i + 1:j + 1][::-1].copy()
+                flipped[i + 1:j + 1] = ~flipped[i + 1:j + 1][::-1]
+                seg_s = seq_s[i + 1:j + 1][::-1].copy()
+                seq_s[i + 1:j + 1] = seq_e[i + 1:j + 1][::-1]
+                seq_e[i + 1:j + 1] = seg_s
+                improved = True
+        if not improved:
+            return
+
+
+def _merge(paths: list[Polyline], tolerance: float) -> list[Polyline]:
+    groups: list[list[np.ndarray]] = []
+    heads: list[Polyline] = []
+    last_end = None
+    for path in paths:
+        if heads:
+            gap = float(np.hypot(*(path.points[0] - last_end)))
+            if gap <= tolerance and heads[-1].color == path.color:
+                groups[-1].append(path.points[1:] if gap == 0.0 else path.points)
+                last_end = path.points[-1]
+                continue
+        heads.append(path)
+        groups.append([path.points])
+        last_end = path.points[-1]
+    return [
+        head if len(chunks) == 1 else Polyline(np.vstack(chunks), head.layer, head.color)
+        for head, chunks in zip(heads, groups)
+    ]
+
+
+def _optimize_layer(paths: list[Polyline], origin, options: OptimizeOptions) -> list[Polyline]:
+    greedy = _greedy_order(paths, origin, options.allow_reverse)
+    order = np.array([i for i, _ in greedy], dtype=np.int64)
+    flipped = np.array([r for _, r in greedy], dtype=bool)
+    if options.allow_reverse and options.two_opt_passes > 0:
+        starts = np.array([p.points[0] for p in paths], dtype=np.float64)
+        ends = np.array([p.points[-1] for p in paths], dtype=np.float64)
+        _two_opt(starts, ends, order, flipped, origin, options)
+    ordered = [
+        Polyline(paths[i].points[::-1] if flip else paths[i].points, paths[i].layer, paths[i].color)
+        for i, flip in zip(order.tolist(), flipped.tolist())
+    ]
+    if options.merge_tolerance >= 0:
+        ordered = _merge(ordered, options.merge_tolerance)
+    return ordered
+
+
+def optimize_paths(
+    paths: list[Polyline],
+    options: OptimizeOptions | None = None,
+    origin: tuple[float, float] = (0.0, 0.0)
+) -> tuple[list[Polyline], OptimizeStats]:
+    options = options or OptimizeOptions()
+    stats = OptimizeStats(
+        path_count_before=len(paths),
+        pen_up_distance_before=pen_up_distance(paths, origin),
+        pen_lifts_before=len(paths)
+    )
+    layers: dict[str, list[Polyline]] = {}
+    for path in paths:
+        layers.setdefault(path.layer, []).append(path)
+
+    result: list[Polyline] = []
+    position = origin
+    for layer_paths in layers.values():
+        ordered = _optimize_layer(layer_paths, position, options)
+        result.extend(ordered)
+        position = tuple(ordered[-1].points[-1]) if ordered else position
+
+    stats.path_count_after = len(result)
+    stats.pen_up_distance_after = pen_up_distance(result, origin)
+    stats.pen_lifts_after = len(result)
+    return result, stats
@@ -0,0 +1,179 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from pathlib import Path
+from uuid import uuid4
+import hashlib
+import os
+
+from multipart.exceptions import MultipartParseError
+from multipart.multipart import MultipartParser, parse_options_header
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+
+UPLOAD_MAX_BYTES = int(os.environ.get("VECTRA_UPLOAD_MAX_BYTES", str(1024 ** 3)))
+UPLOAD_STAGING_ROOT = Path("data/uploads")
+_FIELD_MAX_BYTES = 64 * 1024
+_FLUSH_BYTES = 1024 * 1024
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class InvalidUpload(ValueError):
+    pass
+
+
+@dataclass
+class StagedUpload:
+    filename: str
+    path: Path
+    size: int = 0
+    sha256: str = ""
+
+
+@dataclass
+class _PartState:
+    headers: dict[bytes, bytes] = field(default_factory=dict)
+    header_field: bytes = b""
+    header_value: bytes = b""
+    name: str | None = None
+    filename: str | None = None
+    data: list[bytes] = field(default_factory=list)
+    size: int = 0
+
+
+class _FileSink:
+    def __init__(self, path: Path):
+        self.path = path
+        self.file = path.open("wb")
+        self.digest = hashlib.sha256()
+        self.size = 0
+
+    def write(self, chunks: list[bytes]) -> None:
+        for chunk in chunks:
+            self.digest.update(chunk)
+            self.file.write(chunk)
+
+
+def _part_disposition(headers: dict[bytes, bytes]) -> tuple[str | None, str | None]:
+    _, params = parse_options_header(headers.get(b"content-disposition", b""))
+    name = params.get(b"name")
+    filename = params.get(b"filename")
+    return (
+        name.decode("utf-8", "replace") if name is not None else None,
+        Path(filename.decode("utf-8", "replace")).name if filename is not None else None
+    )
+
+
+async def stream_upload(
+    request: Request,
+    file_field: str = "file",
+    max_bytes: int | None = None
+) -> tuple[StagedUpload | None, dict[str, str]]:
+    max_bytes = UPLOAD_MAX_BYTES if max_bytes is None else max_bytes
+    declared = request.headers.get("content-length")
+    if declared is not None and declared.isdigit() and int(declared) > max_bytes + _FIELD_MAX_BYTES:
+        raise UploadTooLarge(f"Upload exceeds {max_bytes} bytes")
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    boundary = params.get(b"boundary")
+    if content_type != b"multipart/form-data" or not boundary:
+        raise InvalidUpload("Expected a multipart/form-data body")
+
+    fields: dict[str, str] = {}
+    part = _PartState()
+    staged: StagedUpload | None = None
+    sink: _FileSink | None = None
+    file_part: _PartState | None = None
+    pending: list[bytes] = []
+    finished: list[_PartState] = []
+
+    def on_part_begin():
+        nonlocal part
+        part = _PartState()
+
+    def on_header_field(data, start, end):
+        part.header_field += data[start:end]
+
+    def on_header_value(data, start, end):
+        part.header_value += data[start:end]
+
+    def on_header_end():
+        part.headers[part.header_field.lower()] = part.header_value
+        part.header_field = b""
+        part.header_value = b""
+
+    def on_headers_finished():
+        part.name, part.filename = _part_disposition(part.headers)
+
+    def on_part_data(data, start, end):
+        part.data.append(data[start:end])
+        part.size += end - start
+        if part.filename is None and part.size > _FIELD_MAX_BYTES:
+            raise InvalidUpload(f"Form field {part.name} is too large")
+
+    def on_part_end():
+        finished.append(part)
+
+    parser = MultipartParser(boundary, {
+        "on_part_begin": on_part_begin,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end
+    })
+
+    async def flush(final: bool = False) -> None:
+        nonlocal pending
+        if sink is not None and pending and (final or sum(map(len, pending)) >= _FLUSH_BYTES):
+            chunks, pending = pending, []
+            # hashing and disk writes happen off the event loop
+            await run_in_threadpool(sink.write, chunks)
+
+    def take_file_data(state: _PartState) -> None:
+        nonlocal staged, sink, file_part
+        if file_part is None and state.name == file_field and state.filename is not None:
+            UPLOAD_STAGING_ROOT.mkdir(parents=True, exist_ok=True)
+            file_part = state
+            staged = StagedUpload(state.filename, UPLOAD_STAGING_ROOT / f".{uuid4().hex}.upload")
+            sink = _FileSink(staged.path)
+        if state is not file_part:
+            if state.filename is not None:
+                state.data = []
+            return
+        for chunk in state.data:
+            sink.size += len(chunk)
+            if sink.size > max_bytes:
+                raise UploadTooLarge(f"Upload exceeds {max_bytes} bytes")
+            pending.append(chunk)
+        state.data = []
+
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+            take_file_data(part)
+            for done in finished:
+                take_file_data(done)
+                if done.name is not None and done.filename is None:
+                    fields[done.name] = b"".join(done.data).decode("utf-8", "replace")
+            finished.clear()
+            await flush()
+        parser.finalize()
+        await flush(final=True)
+    except BaseException as exc:
+        if sink is not None:
+            sink.file.close()
+            sink.path.unlink(missing_ok=True)
+        if isinstance(exc, MultipartParseError):
+            raise InvalidUpload(f"Malformed multipart body: {exc}") from exc
+        raise
+
+    if staged is None or sink is None:
+        return None, fields
+    sink.file.close()
+    staged.size = sink.size
+    staged.sha256 = sink.digest.hexdigest()
+    return staged, fields
@@ -0,0 +1,132 @@
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, fields, replace
+from itertools import product
+from pathlib import Path
+from typing import Any
+import base64
+import io
+import math
+import os
+
+from services.raster_preprocess import RasterProxyOptions, run_proxy_stage
+from services.stage_cache import run_cached_stage
+from services.svg_geometry import SvgDocument, read_svg
+from services.vtracer_runner import VTRACER_WORKERS, VtracerOptions, run_vtracer_to_svg
+
+SWEEP_MAX_VARIANTS = int(os.environ.get("VECTRA_SWEEP_MAX_VARIANTS", "64"))
+# tiling only pays off on full-size rasters, never on a proxy
+SWEEP_PARAMETERS = tuple(f.name for f in fields(VtracerOptions) if f.name not in ("tile_size", "tile_overlap"))
+
+
+@dataclass
+class SweepVariant:
+    parameters: dict[str, Any]
+    path_count: int = 0
+    vertex_count: int = 0
+    thumbnail: str | None = None
+    cached: bool = False
+    error: str | None = None
+
+
+def _coerce(name: str, default: Any, value: Any) -> Any:
+    if isinstance(default, bool):
+        if not isinstance(value, bool):
+            raise ValueError(f"{name} values must be true or false")
+        return value
+    if isinstance(default, (int, float)):
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ValueError(f"{name} values must be numbers")
+        if not math.isfinite(value):
+            raise ValueError(f"{name} values must be finite")
+        if isinstance(default, int) and value != int(value):
+            raise ValueError(f"{name} values must be whole numbers")
+        return type(default)(value)
+    return str(value)
+
+
+def expand_sweep(base: VtracerOptions, parameters: dict[str, list[Any]]) -> list[tuple[dict[str, Any], VtracerOptions]]:
+    unknown = sorted(set(parameters) - set(SWEEP_PARAMETERS))
+    if unknown:
+        raise ValueError(f"Cannot sweep {', '.join(unknown)}")
+    names = list(parameters)
+    values = [[_coerce(name, getattr(base, name), v) for v in dict.fromkeys(parameters[name])] for name in names]
+    if any(not options for options in values):
+        raise ValueError("Every swept parameter needs at least one value")
+    total = 1
+    for options in values:
+        total *= len(options)
+    if total > SWEEP_MAX_VARIANTS:
+        raise ValueError(f"Sweep has {total} variants; the limit is {SWEEP_MAX_VARIANTS}")
+    base = replace(base, tile_size=0)
+    return [(dict(zip(names, combo)), replace(base, **dict(zip(names, combo)))) for combo in product(*values)]
+
+
+def render_thumbnail(doc: SvgDocument, size: tuple[int, int], max_size: int) -> str:
+    from PIL import Image, ImageColor, ImageDraw
+
+    scale = min(1.0, max_size / max(size))
+    thumb = Image.new("RGB", (max(1, round(size[0] * scale)), max(1, round(size[1] * scale))), "white")
+    draw = ImageDraw.Draw(thumb)
+    for path in doc.paths:
+        points = [tuple(p) for p in (path.points * scale).tolist()]
+        try:
+            color = ImageColor.getrgb(path.color) if path.color else (0, 0, 0)
+        except ValueError:
+            color = (0, 0, 0)
+        if len(points) > 2:
+            draw.polygon(points, fill=color)
+        elif len(points) == 2:
+            draw.line(points, fill=color)
+    buffer = io.BytesIO()
+    thumb.save(buffer, format="PNG", optimize=True)
+    return "data:image/png;base64," + base64.b64encode(buffer.getvalue()).decode()
+
+
+def _run_variant(proxy_path: Path, proxy_size: tuple[int, int], overrides: dict[str, Any], options: VtracerOptions, thumbnail_size: int) -> SweepVariant:
+    variant = SweepVariant(parameters=overrides)
+    try:
+        svg_path, variant.cached = run_cached_stage(
+            "vectorize",
+            proxy_path,
+            options,
+            ".svg",
+            lambda out: run_vtracer_to_svg(proxy_path, out, options)
+        )
+        doc = read_svg(svg_path)
+    except Exception as exc:
+        variant.error = f"vtracer failed: {exc}"
+        return variant
+    variant.path_count = len(doc.paths)
+    variant.vertex_count = doc.vertex_count
+    if thumbnail_size > 0:
+        variant.thumbnail = render_thumbnail(doc, proxy_size, thumbnail_size)
+    return variant
+
+
+def run_sweep(
+    source_path: Path,
+    base: VtracerOptions,
+    proxy_options: RasterProxyOptions,
+    parameters: dict[str, list[Any]],
+    thumbnail_size: int
+) -> tuple[tuple[int, int], bool, list[SweepVariant]]:
+    from PIL import Image, UnidentifiedImageError
+
+    variants = expand_sweep(base, parameters)
+    # the decoded, downscaled proxy is cached by source content and filters, so repeated
+    # sweeps over the same image skip decoding the original entirely
+    try:
+        proxy_path, proxy_cached = run_proxy_stage(source_path, proxy_options)
+    except UnidentifiedImageError:
+        raise ValueError("Source file is not a raster image") from None
+    with Image.open(proxy_path) as proxy:
+        proxy_size = proxy.size
+    with ThreadPoolExecutor(max_workers=max(1, min(VTRACER_WORKERS, len(variants)))) as executor:
+        futures = [
+            executor.submit(_run_variant, proxy_path, proxy_size, overrides, options, thumbnail_size)
+            for overrides, options in variants
+        ]
+        results = [future.result() for future in futures]
+    return proxy_size, proxy_cached, results
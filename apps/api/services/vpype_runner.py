@@ -1,28 +1,48 @@
 from pathlib import Path
-import subprocess
-from dataclasses import dataclass
+from dataclasses import astuple, dataclass
+from functools import lru_cache
+import hashlib
+import os
+import tempfile
+from uuid import uuid4
 
+from services.geometry_format import (
+    geometry_from_document,
+    geometry_to_document,
+    is_geometry_file,
+    read_geometry,
+    write_geometry
+)
+from services.instrumentation import run_process
+from services.svg_geometry import read_svg, render_svg
+from services.vpype_worker import gwrite_geometry_in_worker, read_geometry_in_worker, run_in_worker
 
-@dataclass
+PROFILE_DIR = Path("data/cache/vpype_profiles")
+
+
+@dataclass(frozen=True)
 class GcodeProfile:
     pen_down_cmd: str = "M3 S1000"
     pen_up_cmd: str = "M5"
     pen_dwell_s: float = 0.1
     vertical_flip: bool = True
+    arc_tolerance_mm: float = 0.0
+    line_tolerance_mm: float = 0.0
+    precision: int = 3
 
 
-def write_profile_config(path: Path, profile: GcodeProfile) -> None:
+def write_profile_config(path: Path, profile: GcodeProfile, name: str = "vectra_plotter") -> None:
     path.write_text(
-        "[gwrite.vectra_plotter]\n"
+        f"[gwrite.{name}]\n"
         "unit = \"mm\"\n"
         "document_start = \"\"\"G21\nG90\n\"\"\"\n"
         "layer_start = \"(Start Layer)\\n\"\n"
         "line_start = \"(Start Line)\\n\"\n"
-        f"segment_first = \"\"\"G00 X{{x:.3f}} Y{{y:.3f}}\n"
+        f"segment_first = \"\"\"G00 X{{x:.{profile.precision}f}} Y{{y:.{profile.precision}f}}\n"
         f"{profile.pen_down_cmd}\n"
         f"G4 P{profile.pen_dwell_s}\n"
         "\"\"\"\n"
-        "segment = \"G01 X{x:.3f} Y{y:.3f}\\n\"\n"
+        f"segment = \"G01 X{{x:.{profile.precision}f}} Y{{y:.{profile.precision}f}}\\n\"\n"
         f"line_end = \"\"\"{profile.pen_up_cmd}\n"
         f"G4 P{profile.pen_dwell_s}\n"
         "\"\"\"\n"
@@ -31,29 +51,72 @@ def write_profile_config(path: Path, profile: GcodeProfile) -> None:
     )
 
 
+@lru_cache(maxsize=128)
+def _profile_name(profile: GcodeProfile) -> str:
+    return "vectra_" + hashlib.sha256(repr(astuple(profile)).encode()).hexdigest()[:16]
+
+
+def compile_profile(profile: GcodeProfile) -> tuple[str, Path]:
+    name = _profile_name(profile)
+    path = PROFILE_DIR / f"{name}.toml"
+    if not path.exists():
+        PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f"{name}.{uuid4().hex}.tmp")
+        write_profile_config(tmp_path, profile, name)
+        os.replace(tmp_path, path)
+    return name, path
+
+
+def _run_vpype(args: list[str], config_path: Path | None = None) -> None:
+    if run_in_worker(args, config_path):
+        return
+    cmd = ["vpype"]
+    if config_path is not None:
+        cmd += ["--config", str(config_path)]
+    run_process(cmd + args)
+
+
 def run_vpype_to_svg(input_path: Path, output_path: Path) -> None:
-    cmd = [
-        "vpype",
+    _run_vpype([
         "read",
         str(input_path),
         "write",
         str(output_path)
-    ]
-    subprocess.run(cmd, check=True)
+    ])
+
+
+def run_vpype_to_geometry(input_path: Path, output_path: Path) -> None:
+    if read_geometry_in_worker(input_path, output_path):
+        return
+    with tempfile.TemporaryDirectory(dir=output_path.parent) as tmp_dir:
+        svg_path = Path(tmp_dir) / "processed.svg"
+        run_vpype_to_svg(input_path, svg_path)
+        write_geometry(output_path, geometry_from_document(read_svg(svg_path)))
+
+
+def materialize_svg(geometry_path: Path, output_path: Path) -> None:
+    output_path.write_text(render_svg(geometry_to_document(read_geometry(geometry_path))))
 
 
 def run_vpype_to_gcode(input_path: Path, output_path: Path, profile: GcodeProfile) -> None:
-    config_path = output_path.parent / "vpype.toml"
-    write_profile_config(config_path, profile)
-    cmd = [
-        "vpype",
-        "--config",
-        str(config_path),
-        "read",
-        str(input_path),
-        "gwrite",
-        "--profile",
-        "vectra_plotter",
-        str(output_path)
-    ]
-    subprocess.run(cmd, check=True)
+    name, config_path = compile_profile(profile)
+    if is_geometry_file(input_path):
+        if gwrite_geometry_in_worker(input_path, output_path, name, config_path):
+            return
+        # the vpype CLI only reads SVG, so the subprocess fallback goes through a temporary one
+        with tempfile.TemporaryDirectory(dir=output_path.parent) as tmp_dir:
+            svg_path = Path(tmp_dir) / "input.svg"
+            materialize_svg(input_path, svg_path)
+            run_vpype_to_gcode(svg_path, output_path, profile)
+        return
+    _run_vpype(
+        [
+            "read",
+            str(input_path),
+            "gwrite",
+            "--profile",
+            name,
+            str(output_path)
+        ],
+        config_path
+    )
@@ -0,0 +1,155 @@
+from __future__ import annotations
+
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from threading import Lock
+import multiprocessing
+import os
+import shlex
+
+from services.instrumentation import record_child_usage
+
+VPYPE_WORKERS = int(os.environ.get("VECTRA_VPYPE_WORKERS", "2"))
+_MAX_POOL_FAILURES = 3
+
+_pool: ProcessPoolExecutor | None = None
+_pool_lock = Lock()
+_pool_failures = 0
+_loaded_configs: set[str] = set()
+_inline = False
+
+
+def _warm_up() -> None:
+    import vpype_cli  # noqa: F401
+
+
+def _load_config(config_path: str | None) -> None:
+    import vpype as vp
+
+    if config_path is not None and config_path not in _loaded_configs:
+        vp.config_manager.load_config_file(config_path)
+        _loaded_configs.add(config_path)
+
+
+def _execute(args: list[str], config_path: str | None) -> None:
+    import vpype_cli
+
+    try:
+        _load_config(config_path)
+        vpype_cli.execute(shlex.join(args))
+    except (Exception, SystemExit) as exc:
+        raise RuntimeError(f"vpype {' '.join(args[:1])} failed: {exc}") from None
+
+
+def _read_to_geometry(input_path: str, output_path: str) -> None:
+    import vpype_cli
+
+    from services.geometry_format import geometry_from_vpype, write_geometry
+
+    try:
+        document = vpype_cli.execute(shlex.join(["read", input_path]))
+    except (Exception, SystemExit) as exc:
+        raise RuntimeError(f"vpype read failed: {exc}") from None
+    write_geometry(Path(output_path), geometry_from_vpype(document))
+
+
+def _gwrite_geometry(input_path: str, output_path: str, profile_name: str, config_path: str | None) -> None:
+    import vpype_cli
+
+    from services.geometry_format import geometry_to_vpype, read_geometry
+
+    document = geometry_to_vpype(read_geometry(Path(input_path)))
+    try:
+        _load_config(config_path)
+        vpype_cli.execute(shlex.join(["gwrite", "--profile", profile_name, output_path]), document=document)
+    except (Exception, SystemExit) as exc:
+        raise RuntimeError(f"vpype gwrite failed: {exc}") from None
+
+
+def _measured(fn, *args) -> tuple[float, int]:
+    # pool workers run one task at a time, so the CPU delta belongs to this task; the
+    # peak is the worker's own high-water mark
+    from services.instrumentation import peak_rss_bytes, process_cpu_s
+
+    started = process_cpu_s()
+    fn(*args)
+    return process_cpu_s() - started, peak_rss_bytes()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=VPYPE_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_warm_up
+            )
+        return _pool
+
+
+def _discard_pool(pool: ProcessPoolExecutor) -> None:
+    global _pool, _pool_failures
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+            _pool_failures += 1
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _noop() -> None:
+    return None
+
+
+def warm_up_workers() -> None:
+    if VPYPE_WORKERS <= 0:
+        return
+    pool = _get_pool()
+    for _ in range(VPYPE_WORKERS):
+        pool.submit(_noop)
+
+
+def use_inline_execution() -> None:
+    # for processes that are already pool workers themselves: run vpype in-process
+    # instead of nesting another pool
+    global _inline
+    _inline = True
+
+
+def _run_task(fn, *args) -> bool:
+    if _inline:
+        fn(*args)
+        return True
+    if VPYPE_WORKERS <= 0 or _pool_failures >= _MAX_POOL_FAILURES:
+        return False
+    pool = _get_pool()
+    try:
+        future = pool.submit(_measured, fn, *args)
+        cpu_s, peak_rss = future.result()
+    except BrokenProcessPool:
+        _discard_pool(pool)
+        return False
+    record_child_usage(cpu_s, peak_rss)
+    return True
+
+
+def _config_arg(config_path: Path | None) -> str | None:
+    return str(config_path) if config_path is not None else None
+
+
+def run_in_worker(args: list[str], config_path: Path | None = None) -> bool:
+    return _run_task(_execute, list(args), _config_arg(config_path))
+
+
+def read_geometry_in_worker(input_path: Path, output_path: Path) -> bool:
+    return _run_task(_read_to_geometry, str(input_path), str(output_path))
+
+
+def gwrite_geometry_in_worker(
+    input_path: Path,
+    output_path: Path,
+    profile_name: str,
+    config_path: Path | None = None
+) -> bool:
+    return _run_task(_gwrite_geometry, str(input_path), str(output_path), profile_name, _config_arg(config_path))
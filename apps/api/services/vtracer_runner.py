@@ -1,7 +1,23 @@
+from collections import defaultdict
 from pathlib import Path
-import subprocess
+import math
+import os
+import tempfile
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
 from dataclasses import dataclass
 
+import numpy as np
+
+from services.instrumentation import run_process
+from services.svg_geometry import SVG_NS, element_bounds, element_polylines, parse_transform
+
+VTRACER_WORKERS = int(os.environ.get("VECTRA_VTRACER_WORKERS", str(os.cpu_count() or 2)))
+# neighbouring tiles trace a seam-crossing contour independently, so its pieces can end
+# this far apart on the seam and still be joined
+SEAM_JOIN_PX = float(os.environ.get("VECTRA_SEAM_JOIN_PX", "2.0"))
+
 
 @dataclass
 class VtracerOptions:
@@ -14,9 +30,11 @@ class VtracerOptions:
     corner_threshold: float = 60.0
     segment_length: float = 4.0
     spiro: bool = True
+    tile_size: int = 0
+    tile_overlap: int = 32
 
 
-def run_vtracer_to_svg(input_path: Path, output_path: Path, options: VtracerOptions) -> None:
+def _vtracer_command(input_path: Path, output_path: Path, options: VtracerOptions) -> list[str]:
     cmd = [
         "vtracer",
         "--input",
@@ -42,4 +60,208 @@ def run_vtracer_to_svg(input_path: Path, output_path: Path, options: VtracerOpti
         cmd.append("--hierarchical")
     if options.spiro:
         cmd.append("--spiro")
-    subprocess.run(cmd, check=True)
+    return cmd
+
+
+def run_vtracer_to_svg(input_path: Path, output_path: Path, options: VtracerOptions) -> None:
+    if options.tile_size > 0:
+        from PIL import Image
+
+        with Image.open(input_path) as image:
+            width, height = image.size
+        if max(width, height) > options.tile_size:
+            _run_vtracer_tiled(input_path, output_path, options)
+            return
+    run_process(_vtracer_command(input_path, output_path, options))
+
+
+Box = tuple[int, int, int, int]
+
+
+def _tile_grid(width: int, height: int, tile_size: int, overlap: int) -> list[tuple[Box, Box]]:
+    tiles = []
+    for y0 in range(0, height, tile_size):
+        for x0 in range(0, width, tile_size):
+            core = (x0, y0, min(x0 + tile_size, width), min(y0 + tile_size, height))
+            crop = (
+                max(0, core[0] - overlap),
+                max(0, core[1] - overlap),
+                min(width, core[2] + overlap),
+                min(height, core[3] + overlap)
+            )
+            tiles.append((core, crop))
+    return tiles
+
+
+def _run_vtracer_tiled(input_path: Path, output_path: Path, options: VtracerOptions) -> None:
+    from PIL import Image
+
+    with tempfile.TemporaryDirectory(prefix="vtracer-tiles-", dir=output_path.parent) as tmp:
+        work_dir = Path(tmp)
+        with Image.open(input_path) as image:
+            image.load()
+            width, height = image.size
+            tiles = _tile_grid(width, height, options.tile_size, max(0, options.tile_overlap))
+
+            def trace(index: int) -> Path:
+                tile_png = work_dir / f"tile_{index}.png"
+                tile_svg = work_dir / f"tile_{index}.svg"
+                image.crop(tiles[index][1]).save(tile_png, compress_level=1)
+                run_process(_vtracer_command(tile_png, tile_svg, options))
+                tile_png.unlink()
+                return tile_svg
+
+            with ThreadPoolExecutor(max_workers=max(1, VTRACER_WORKERS)) as executor:
+                # each tile carries the caller's context so its vtracer usage lands in the open span
+                futures = [executor.submit(copy_context().run, trace, index) for index in range(len(tiles))]
+                tile_svgs = [future.result() for future in futures]
+
+        output_path.write_text(_stitch_tiles(width, height, tiles, tile_svgs))
+
+
+def _strip_namespace(elem: ET.Element) -> ET.Element:
+    for node in elem.iter():
+        node.tag = node.tag.rsplit("}", 1)[-1]
+    return elem
+
+
+def _clip_polyline(points: np.ndarray, box: tuple[float, float, float, float]) -> list[np.ndarray]:
+    # Liang-Barsky on every segment at once; consecutive surviving segments that stay
+    # joined at their shared vertex are chained back into one run
+    start, end = points[:-1], points[1:]
+    delta = end - start
+    t0 = np.zeros(len(delta))
+    t1 = np.ones(len(delta))
+    keep = np.ones(len(delta), dtype=bool)
+    for axis, lo, hi in ((0, box[0], box[2]), (1, box[1], box[3])):
+        d = delta[:, axis]
+        for p, q in ((-d, start[:, axis] - lo), (d, hi - start[:, axis])):
+            parallel = p == 0
+            keep &= ~(parallel & (q < 0))
+            with np.errstate(divide="ignore", invalid="ignore"):
+                r = q / p
+            t0 = np.where(~parallel & (p < 0), np.maximum(t0, r), t0)
+            t1 = np.where(~parallel & (p > 0), np.minimum(t1, r), t1)
+    keep &= t0 < t1
+    runs: list[np.ndarray] = []
+    current: list[np.ndarray] = []
+    for i in np.flatnonzero(keep).tolist():
+        a = start[i] + t0[i] * delta[i]
+        b = start[i] + t1[i] * delta[i]
+        if current and (t0[i] > 0 or not keep[i - 1] or t1[i - 1] < 1):
+            runs.append(np.array(current))
+            current = []
+        if not current:
+            current.append(a)
+        current.append(b)
+    if current:
+        runs.append(np.array(current))
+    # a closed outline cut open at its first vertex continues through it
+    closed = len(points) > 2 and np.array_equal(points[0], points[-1])
+    if closed and len(runs) > 1 and np.array_equal(runs[0][0], points[0]) and np.array_equal(runs[-1][-1], points[-1]):
+        runs[0] = np.vstack([runs.pop()[:-1], runs[0]])
+    return runs
+
+
+def _fmt_points(points: np.ndarray) -> str:
+    return " L".join(f"{x:.3f} {y:.3f}" for x, y in points.tolist())
+
+
+def _seam_links(pieces: list[tuple[int, str, np.ndarray]]) -> dict[int, int]:
+    # endpoint 2k is the start of piece k and 2k+1 its end; pairs closer than SEAM_JOIN_PX
+    # from different tiles are linked nearest first, matching colors before mixed ones
+    # (tiles quantize colors separately)
+    ends = [(run[0], run[-1]) for _, _, run in pieces]
+    cells = defaultdict(list)
+    for k, (start, end) in enumerate(ends):
+        for side, point in enumerate((start, end)):
+            cells[(math.floor(point[0] / SEAM_JOIN_PX), math.floor(point[1] / SEAM_JOIN_PX))].append(2 * k + side)
+    pairs = []
+    for (cx, cy), members in cells.items():
+        for a in members:
+            for dx in (-1, 0, 1):
+                for dy in (-1, 0, 1):
+                    for b in cells.get((cx + dx, cy + dy), ()):
+                        if b <= a or pieces[a // 2][0] == pieces[b // 2][0]:
+                            continue
+                        distance = float(np.hypot(*(ends[a // 2][a % 2] - ends[b // 2][b % 2])))
+                        if distance <= SEAM_JOIN_PX:
+                            pairs.append((pieces[a // 2][1] != pieces[b // 2][1], distance, a, b))
+    links: dict[int, int] = {}
+    for _, _, a, b in sorted(pairs):
+        if a not in links and b not in links:
+            links[a] = b
+            links[b] = a
+    return links
+
+
+def _join_seam_pieces(pieces: list[tuple[int, str, np.ndarray]]) -> list[tuple[str, np.ndarray, bool]]:
+    # chains clipped runs back into whole contours across seams; a chain that comes back
+    # to where it started is a re-closed outline
+    links = _seam_links(pieces)
+    used = [False] * len(pieces)
+    # open chains are walked from a free end first, so what is left over are loops
+    order = [k for k in range(len(pieces)) if 2 * k not in links or 2 * k + 1 not in links]
+    order += range(len(pieces))
+    joined = []
+    for k in order:
+        if used[k]:
+            continue
+        side = 1 if 2 * k in links and 2 * k + 1 not in links else 0
+        first, parts = 2 * k + side, []
+        while True:
+            used[k] = True
+            run = pieces[k][2]
+            parts.append(run if side == 0 else run[::-1])
+            nxt = links.get(2 * k + 1 - side)
+            if nxt is None or used[nxt // 2]:
+                break
+            k, side = nxt // 2, nxt % 2
+        joined.append((pieces[first // 2][1], np.vstack(parts), len(parts) > 1 and nxt == first))
+    return joined
+
+
+def _stitch_tiles(width: int, height: int, tiles: list[tuple[Box, Box]], tile_svgs: list[Path]) -> str:
+    # everything goes into one top-level group: vpype and read_svg treat top-level groups as layers
+    body = []
+    crossing = []
+    for index, ((core, crop), tile_svg) in enumerate(zip(tiles, tile_svgs)):
+        offset = parse_transform(f"translate({crop[0]},{crop[1]})")
+        # interior right and bottom edges are exclusive, so an outline lying exactly on a
+        # seam is drawn by one tile only
+        clip_box = (
+            core[0],
+            core[1],
+            core[2] - 1e-6 if core[2] < width else core[2],
+            core[3] - 1e-6 if core[3] < height else core[3]
+        )
+        inside = []
+        for elem in ET.parse(tile_svg).getroot():
+            bounds = element_bounds(elem, offset)
+            if bounds is None:
+                continue
+            x0, y0, x1, y1 = bounds
+            # shapes that live entirely in the overlap margin belong to the neighbouring tile
+            if x1 <= core[0] or y1 <= core[1] or x0 >= core[2] or y0 >= core[3]:
+                continue
+            if x0 >= core[0] and y0 >= core[1] and x1 <= core[2] and y1 <= core[3]:
+                inside.append(ET.tostring(_strip_namespace(elem), encoding="unicode").strip())
+                continue
+            # a plotter draws outlines and ignores clip paths, so a seam-crossing shape is cut
+            # to the part of its outline inside this tile and the neighbour supplies the rest
+            color = elem.attrib.get("fill") or elem.attrib.get("stroke") or "black"
+            crossing.extend(
+                (index, color, run) for points in element_polylines(elem, offset)
+                for run in _clip_polyline(points, clip_box) if len(run) > 1
+            )
+        if inside:
+            body.append(f"<g transform=\"translate({crop[0]},{crop[1]})\">{''.join(inside)}</g>")
+    # the pieces of each contour are joined where they meet on a seam; a contour that
+    # closes again is written closed, pieces left without a partner stay open
+    for color, points, closed in _join_seam_pieces(crossing):
+        d = f"M{_fmt_points(points)}{' Z' if closed else ''}"
+        body.append(f"<path d=\"{d}\" fill=\"none\" stroke=\"{color}\"/>")
+    return (
+        f"<svg xmlns=\"{SVG_NS}\" version=\"1.1\" width=\"{width}\" height=\"{height}\" "
+        f"viewBox=\"0 0 {width} {height}\"><g>{''.join(body)}</g></svg>\n"
+    )
@@ -0,0 +1,73 @@
+import math
+import random
+
+import numpy as np
+import pytest
+
+from services.gcode_parser import parse_gcode_moves
+
+
+def _reference_moves(gcode: str):
+    # the per-line parser the NumPy one replaced
+    frames = []
+    cx, cy = 0.0, 0.0
+    pen_down = False
+    distance = 0.0
+    pen_lifts = 0
+    for raw in gcode.splitlines():
+        line = raw.split(";")[0].strip()
+        if not line:
+            continue
+        parts = line.split()
+        cmd = parts[0].upper()
+        if cmd in ("M3", "M03"):
+            pen_down = True
+        if cmd in ("M5", "M05"):
+            if pen_down:
+                pen_down = False
+                pen_lifts += 1
+        if cmd not in ("G0", "G00", "G1", "G01"):
+            continue
+        x, y = cx, cy
+        for part in parts[1:]:
+            axis = part[0].upper()
+            try:
+                value = float(part[1:])
+            except ValueError:
+                continue
+            if axis == "X":
+                x = value
+            if axis == "Y":
+                y = value
+        if x != cx or y != cy:
+            distance += math.hypot(x - cx, y - cy)
+            cx, cy = x, y
+            frames.append((x, y, pen_down))
+    return frames, distance, pen_lifts
+
+
+def _program(precision: int, seed: int = 7) -> str:
+    rng = random.Random(seed)
+    fmt = f"{{:.{precision}f}}"
+    lines = ["G21", "G90"]
+    for _ in range(200):
+        lines.append(f"G00 X{fmt.format(rng.uniform(-500, 500))} Y{fmt.format(rng.uniform(-500, 500))}")
+        lines.append("M3")
+        for _ in range(rng.randint(1, 8)):
+            lines.append(f"G01 X{fmt.format(rng.uniform(-500, 500))} Y{fmt.format(rng.uniform(-500, 500))} ; draw")
+        lines.append("M5")
+    lines.append("G00 X0 Y0")
+    return "\n".join(lines) + "\n"
+
+
+@pytest.mark.parametrize("precision", [0, 3, 12, 60])
+def test_matches_line_parser(precision):
+    gcode = _program(precision)
+    frames, distance, pen_lifts = _reference_moves(gcode)
+    moves = parse_gcode_moves(gcode)
+    assert moves.count == len(frames)
+    assert np.array_equal(moves.x, [f[0] for f in frames])
+    assert np.array_equal(moves.y, [f[1] for f in frames])
+    assert np.array_equal(moves.pen, [f[2] for f in frames])
+    assert moves.distance == pytest.approx(distance)
+    assert moves.pen_lifts == pen_lifts